@@ -1,17 +1,15 @@
 from enum import Enum
 import sys
 from typing import Generator, Iterable
-import webbrowser
 import re
-import pyperclip
 import pywikibot
 import mwparserfromhell
 import kovachevbot
 
-SITE = pywikibot.Site("en", "wiktionary")
-COMMONS = pywikibot.Site("commons", "commons")
-NEED_ATTENTION = "audio_needs_attention.txt"
-SEEN_ENTRIES = "audio_seen_files.txt"
+NEED_ATTENTION = kovachevbot.task_file(__file__, "audio_needs_attention.txt")
+SEEN_ENTRIES = kovachevbot.task_file(__file__, "audio_seen_files.txt")  # Before the journal; imported into it on the first run
+JOURNAL_TASK = "auto-audio"
+JOURNAL_PATH = kovachevbot.task_file(__file__, kovachevbot.JOURNAL_FILE)
 HEAD_TEMPLATES = {"bg-noun", "bg-verb", "bg-adj", "head", "bg-adv", "bg-verbal noun", "bg-verbal noun form", "bg-letter", "bg-part", "bg-part form", "bg-phrase", "bg-proper noun"}
 
 
@@ -53,8 +51,7 @@ def add_pronunciation_section(bulgarian_section: mwparserfromhell.wikicode.Wikic
 
         bulgarian_section.get_sections([2], "Bulgarian")[0].insert_before(bulgarian_section.nodes[i], PRONUNCIATION_CONTENT)
 
-    while "\n\n\n" in bulgarian_section:
-        bulgarian_section.replace("\n\n\n", "\n\n")
+    kovachevbot.collapse_blank_lines_in(bulgarian_section)
 
 def process_header(template: mwparserfromhell.wikicode.Template) -> set[str]:
     name = str(template.name)
@@ -93,17 +90,12 @@ class PageEditStatus(Enum):
 def is_bg_ipa(node) -> bool:
     return isinstance(node, mwparserfromhell.wikicode.Template) and node.name == "bg-IPA"
 
-def visit_page(page_name: str, audio_file_name: str) -> bool:
-    p = pywikibot.Page(SITE, page_name)
-    parsed = mwparserfromhell.parse(p.text)
-
-    # sections = parsed.get_sections([2, 3, 4, 5, 6, 7])
-    try:
-        bulgarian_section: mwparserfromhell.wikicode.Wikicode = parsed.get_sections([2], "Bulgarian")[0]
-    except IndexError:
-        print("No Bulgarian entry for term", page_name, file=sys.stderr)
-        return
-
+def add_audio_to_section(bulgarian_section: mwparserfromhell.wikicode.Wikicode, page_name: str, audio_file_name: str) -> tuple[str, PageEditStatus]:
+    """
+    Work out whether the audio file can be added to the Bulgarian section, and add it if so, in place.
+    Returns the edit summary and the status. Unless the status is `SUCCESS`, the section is not to be saved,
+    though it may have been given a pronunciation section.
+    """
     edit_summary = ""
     # bulgarian_subsections = bulgarian_section.get_sections([3, 4, 5, 6, 7])
     etymology_sections = bulgarian_section.get_sections([3], "Etymology")
@@ -185,21 +177,58 @@ def visit_page(page_name: str, audio_file_name: str) -> bool:
         else:
             pron_section.insert(1, TO_INSERT)
 
-        p.text = str(parsed)
         edit_summary += ("A" if edit_summary == "" else "a") + "dd audio from User:Kiril kovachev"
-        p.save(edit_summary, minor=False)
+
+    return edit_summary, edit_status
+
+def add_audio(text: str, page_name: str, audio_file_name: str) -> tuple[str, str, PageEditStatus | None]:
+    """
+    Work out whether the audio file can be added to the page's Bulgarian entry, and add it if so.
+    Returns the new text of the page, the edit summary, and the status (`None` if there is no Bulgarian entry).
+    """
+    bulgarian_section_search = kovachevbot.parse_l2_section(text, "Bulgarian")
+    if bulgarian_section_search is None:
+        return text, "", None
+
+    bulgarian_section, section_span = bulgarian_section_search
+    edit_summary, edit_status = add_audio_to_section(bulgarian_section, page_name, audio_file_name)
+    if edit_status is PageEditStatus.SUCCESS:
+        text = kovachevbot.splice_section(text, section_span, str(bulgarian_section))
+
+    return text, edit_summary, edit_status
+
+def visit_page(page_name: str, audio_file_name: str) -> PageEditStatus | None:
+    p = kovachevbot.wikt_page(page_name)
+    with kovachevbot.timed("transform", page_name):
+        new_text, edit_summary, edit_status = add_audio(p.text, page_name, audio_file_name)
+
+    if edit_status is None:
+        print("No Bulgarian entry for term", page_name, file=sys.stderr)
+        kovachevbot.record_event("skip", page_name, "no Bulgarian section")
+    elif edit_status is PageEditStatus.SUCCESS:
+        p.text = new_text
+        kovachevbot.save_page(p, edit_summary, minor=False)
 
     return edit_status
 
-def run(attention: list[str], contribs: Iterable[str]):
+def recording_page_name(namespaced_filename: str) -> str:
+    """The entry a recording is of, e.g. "котка" for "File:LL-Q7918 (bul)-Kiril kovachev-котка.wav"."""
+    return namespaced_filename[namespaced_filename.rfind("Kiril kovachev-")+1+len("Kiril kovachev"):-4]
+
+def run(attention: list[str], contribs: Iterable[str], journal: kovachevbot.Journal):
     for namespaced_filename in contribs:
         filename = namespaced_filename[5:]
-        page_name = namespaced_filename[namespaced_filename.rfind("Kiril kovachev-")+1+len("Kiril kovachev"):-4]
+        page_name = recording_page_name(namespaced_filename)
         status = visit_page(page_name, filename)
 
         if status is PageEditStatus.CANNOT_ADD:
             attention.append(page_name)
             print(f"Failed to update page {page_name}, requires manual attention", file=sys.stderr)
+            journal.failed(namespaced_filename, f"{page_name} requires manual attention")
+        elif status is None:
+            journal.skipped(namespaced_filename, f"{page_name} has no Bulgarian entry")
+        else:
+            journal.done(namespaced_filename, status.name)
 
 def get_lines(filename: str) -> list[str]:
     try:
@@ -213,13 +242,12 @@ def get_lines(filename: str) -> list[str]:
 
     return lines
 
-def contributions(user: pywikibot.User, seen: list[str] = None, quit_if_seen: bool = True) -> Generator[str, None, None]:
-    if seen is None: seen = []
-    
+def contributions(user: pywikibot.User, journal: kovachevbot.Journal, quit_if_seen: bool = True) -> Generator[str, None, None]:
+    """The user's uploads of recordings, newest first, up to the first one already in the journal."""
     for record in user.contributions(total=-1):
         file = record[0].title()
         
-        if quit_if_seen and file in seen:
+        if quit_if_seen and file in journal:
             print("Caught up to latest changes, quitting")
             return
 
@@ -227,32 +255,82 @@ def contributions(user: pywikibot.User, seen: list[str] = None, quit_if_seen: bo
             yield file
         else:
             print("Ignoring contribution", file, file=sys.stderr)
-
-        seen.append(file)
+            journal.skipped(file, "not a recording")
+
+PENDING_RECORDINGS: dict[str, list[str]] = {}  # Entry -> the recordings to add to it (newest first), when run with other tasks
+ADDED_RECORDINGS: dict[str, list[str]] = {}  # Entry -> the recordings added to it, to be journalled once it has been saved
+
+def pending_recordings() -> list[str]:
+    """The entries with new recordings to add, up to the first recording already in the journal."""
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    journal.import_lines(SEEN_ENTRIES, kovachevbot.DONE)
+    me = pywikibot.User(kovachevbot.get_commons(), "User:Kiril kovachev")
+    for namespaced_filename in contributions(me, journal):
+        PENDING_RECORDINGS.setdefault(recording_page_name(namespaced_filename), []).append(namespaced_filename)
+    return list(PENDING_RECORDINGS)
+
+def has_pending_recording(title: str, text: str) -> bool:
+    return title in PENDING_RECORDINGS
+
+def recording_saved(title: str) -> None:
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    for namespaced_filename in ADDED_RECORDINGS.pop(title, []):
+        journal.done(namespaced_filename, PageEditStatus.SUCCESS.name)
+
+def recording_skipped(title: str, reason: str) -> None:
+    ADDED_RECORDINGS.pop(title, None)
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    for namespaced_filename in PENDING_RECORDINGS.get(title, []):
+        journal.skipped(namespaced_filename, f"{title}: {reason}")
+
+@kovachevbot.register_task("auto-audio", "Bulgarian", titles=pending_recordings, selector=has_pending_recording,
+                           saved=recording_saved, minor=False, skipped=recording_skipped)
+def add_audio_task(title: str, bulgarian_section: mwparserfromhell.wikicode.Wikicode) -> str | None:
+    # Every recording of the entry is tried in turn, as `run` does: once one is added, the others have nothing to add
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    summaries = []
+    for namespaced_filename in PENDING_RECORDINGS[title]:
+        before = str(bulgarian_section)
+        edit_summary, status = add_audio_to_section(bulgarian_section, title, namespaced_filename[5:])
+        if status is PageEditStatus.SUCCESS:
+            ADDED_RECORDINGS.setdefault(title, []).append(namespaced_filename)
+            summaries.append(edit_summary)
+            continue
+
+        bulgarian_section.nodes = mwparserfromhell.parse(before).nodes  # Undo any pronunciation section added on the way
+        if status is PageEditStatus.CANNOT_ADD:
+            with open(NEED_ATTENTION, mode="a") as f:
+                f.write(("\n" if f.tell() else "") + title)
+            journal.failed(namespaced_filename, f"{title} requires manual attention")
+        else:
+            journal.done(namespaced_filename, status.name)
+    return "; ".join(summaries) or None
 
 def auto_add():
     attention = get_lines(NEED_ATTENTION)
-    seen = get_lines(SEEN_ENTRIES)
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    journal.import_lines(SEEN_ENTRIES, kovachevbot.DONE)
 
-    me = pywikibot.User(COMMONS, "User:Kiril kovachev")
+    me = pywikibot.User(kovachevbot.get_commons(), "User:Kiril kovachev")
 
     try:
-        run(attention, contributions(me, seen))
+        run(attention, contributions(me, journal), journal)
     except KeyboardInterrupt:
         print()
     finally:
+        journal.commit()
         with open(NEED_ATTENTION, mode="w") as f:
             f.write("\n".join(attention))
 
-        with open(SEEN_ENTRIES, mode="w") as f:
-            f.write("\n".join(seen))
-
 def manual():
+    import webbrowser
+    import pyperclip  # Only needed for fixing pages by hand
+
     attention = get_lines(NEED_ATTENTION)
 
     try:
         for line in attention:
-            p = pywikibot.Page(SITE, line)
+            p = kovachevbot.wikt_page(line)
             parsed = mwparserfromhell.parse(p.text)
             sections = parsed.get_sections([2, 3, 4, 5, 6, 7])
 
@@ -266,23 +344,22 @@ def manual():
         with open(NEED_ATTENTION, mode="w") as f:
             f.write("\n".join(attention))
 
+REORDER_TASK = "auto-audio-reorder"
+REORDER_VERSION = "1"  # Change whenever the check changes, so that every page is checked again
+
 def reorder(limit: int = 2300):
-    me = pywikibot.User(SITE, "User:KovachevBot")
+    """
+    Check the Bulgarian pronunciation sections of the pages the bot has recently edited for templates out of order,
+    listing those which are. Pages which have not been edited since they were last checked are not fetched again.
+    """
+    me = pywikibot.User(kovachevbot.get_wiktionary(), "User:KovachevBot")
+    journal = kovachevbot.get_journal(REORDER_TASK, JOURNAL_PATH)
 
-    disordered: list[str] = []
     PRECEDENCE = [["bg-IPA", "IPA"], "audio", "rhymes", ["bg-hyph", "hyph"]]
 
     get_precedence = lambda x: PRECEDENCE.index([item for item in PRECEDENCE if (x in item if type(item) is list else x == item)][0])
 
-    for page, *_ in me.contributions(limit):
-        title = page.title()
-        print("Visiting", title)
-        content = page.text
-        parsed = mwparserfromhell.parse(content)
-        bulgarian_section: mwparserfromhell.wikicode.Wikicode = parsed.get_sections([2], "Bulgarian")[0]
-        pronunciation = bulgarian_section.get_sections([3], "Pronunciation")
-        if not pronunciation: continue
-        pronunciation: mwparserfromhell.wikicode.Wikicode = pronunciation[0]
+    def in_order(pronunciation: mwparserfromhell.wikicode.Wikicode) -> bool:
         highest_precedence = 0
         for template in pronunciation.filter(forcetype=mwparserfromhell.wikicode.Template):
             try:
@@ -292,9 +369,31 @@ def reorder(limit: int = 2300):
             if template_precedence > highest_precedence:
                 highest_precedence = template_precedence
             elif template_precedence < highest_precedence:
-                print("Entry is out of order:", title)
-                disordered.append(title)
-                break
+                return False
+        return True
+
+    titles = dict.fromkeys(page.title() for page, *_ in me.contributions(limit))  # A page may have been edited more than once
+    for page in kovachevbot.pages_changed_since_visit(titles, journal, REORDER_VERSION):
+        title = page.title()
+        print("Visiting", title)
+        content = page.text
+        bulgarian_section_search = kovachevbot.parse_l2_section(content, "Bulgarian", editable=False)
+        if bulgarian_section_search is None:
+            journal.record_visit(page, kovachevbot.SKIPPED, REORDER_VERSION, "no Bulgarian section")
+            continue
+        bulgarian_section, _ = bulgarian_section_search
+        pronunciation = bulgarian_section.get_sections([3], "Pronunciation")
+        if not pronunciation:
+            journal.record_visit(page, kovachevbot.SKIPPED, REORDER_VERSION, "no pronunciation section")
+            continue
+        if in_order(pronunciation[0]):
+            journal.record_visit(page, kovachevbot.DONE, REORDER_VERSION)
+        else:
+            print("Entry is out of order:", title)
+            journal.record_visit(page, kovachevbot.FAILED, REORDER_VERSION, "out of order")
+
+    # Including those found out of order before, and not edited since
+    disordered = sorted(journal.titles(kovachevbot.FAILED))
     print(disordered)
 
 def main():
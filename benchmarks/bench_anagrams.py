@@ -0,0 +1,91 @@
+"""
+Compare getting the anagrams of a wordlist by building a dict of sets of strings from it on every run
+(as the anagram tasks used to) with loading its anagram index, which is only built when the wordlist changes.
+Reports the time and the memory allocated by each, and checks that both have the same anagrams.
+With `--queries N`, also times N blank-tile and sub-anagram queries (on random words) with the letter-count index
+against scanning every word, checking that they agree (this needs NumPy).
+
+    python bench_anagrams.py ../bulgarian-anagrams/words.txt bg [--queries 100]
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from collections import Counter
+import kovachevbot
+
+
+def build_dict(wordlist: str, language: str) -> dict[str, set[str]]:
+    groups: dict[str, set[str]] = {}
+    with open(wordlist, encoding="utf-8") as f:
+        for line in f:
+            if word := line.strip():
+                groups.setdefault(kovachevbot.get_alphagram(word, language), set()).add(word)
+    return {alphagram: words for alphagram, words in groups.items() if len(words) > 1}
+
+def scan_with_blanks(counts: list[tuple[set[str], Counter, int]], letters: Counter, length: int) -> set[str]:
+    return {word for words, word_letters, word_length in counts if word_length == length and not letters - word_letters for word in words}
+
+def scan_sub_anagrams(counts: list[tuple[set[str], Counter, int]], letters: Counter) -> set[str]:
+    return {word for words, word_letters, word_length in counts if word_length and not word_letters - letters for word in words}
+
+def time_queries(index: kovachevbot.AnagramIndex, queries: int) -> None:
+    seconds, _, letter_counts = measure(kovachevbot.LetterCountIndex, index)
+    print(f"{'letter counts':<14}{seconds*1000:>10.1f} ms to build")
+    counts = [(index.words_at(i), Counter(alphagram), len(alphagram)) for i, alphagram in enumerate(index.alphagrams())]
+    words = random.Random(0).sample(list(index.words()), queries)
+
+    for name, indexed, scanned in [
+        ("blank tile", lambda word: letter_counts.with_blanks(word + kovachevbot.BLANK),
+         lambda word: scan_with_blanks(counts, Counter(index.alphagram(word)), len(index.alphagram(word)) + 1)),
+        ("sub-anagrams", letter_counts.sub_anagrams, lambda word: scan_sub_anagrams(counts, Counter(index.alphagram(word)))),
+    ]:
+        start = time.perf_counter()
+        indexed_results = [indexed(word) for word in words]
+        indexed_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        scanned_results = [scanned(word) for word in words]
+        scanned_seconds = time.perf_counter() - start
+        agree = "" if indexed_results == scanned_results else "  RESULTS DIFFER"
+        print(f"{name:<14}{indexed_seconds/queries*1000:>10.2f} ms/query indexed{scanned_seconds/queries*1000:>10.2f} ms/query scanned{agree}")
+
+def measure(function, *args) -> tuple[float, int, object]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return seconds, allocated, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wordlist")
+    parser.add_argument("language")
+    parser.add_argument("--queries", type=int, default=0, help="Blank-tile and sub-anagram queries to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The index is built next to a copy of the wordlist, so that the benchmark never leaves one behind
+        wordlist = os.path.join(directory, os.path.basename(args.wordlist))
+        shutil.copy(args.wordlist, wordlist)
+
+        results = {}
+        for name, function in [("dict of sets", build_dict), ("build index", kovachevbot.load_anagram_index), ("load index", kovachevbot.load_anagram_index)]:
+            seconds, allocated, results[name] = measure(function, wordlist, args.language)
+            print(f"{name:<14}{seconds*1000:>10.1f} ms{allocated/1024:>12.0f} KiB")
+
+        index = results["load index"]
+        if dict(index.items()) != results["dict of sets"]:
+            print("ANAGRAMS DIFFER")
+        print(f"{len(index)} alphagrams with anagrams, index of {os.path.getsize(index.path)/1024:.0f} KiB on disk")
+        if args.queries:
+            time_queries(index, args.queries)
+        index.close()
+        results["build index"].close()
+
+if __name__ == "__main__":
+    main()
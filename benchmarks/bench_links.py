@@ -0,0 +1,85 @@
+"""
+Compare ways of converting links to plain text over a corpus of {{ja-readings}} parameters, split into readings
+as `ja-readings.fix_reading_str` does: parsing every reading (as `links_to_plaintext` used to), `links_to_plaintext`
+with its fast paths for readings without links or with only simple ones, and `links_to_plaintext_many`
+on all the readings of a parameter at once.
+The corpus is the {{ja-readings}} of the Japanese pages in corpus/ (real and hand-written), and made-up parameters in their shape
+(so that the cache of converted readings does not hide the cost of parsing).
+
+    python bench_links.py [--parameters 20000] [--linked 0.3] [--repeat 3]
+"""
+import time
+import random
+import argparse
+import mwparserfromhell
+import kovachevbot
+from corpus import load_corpus
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+
+
+def corpus_readings() -> list[str]:
+    """The reading parameters of the {{ja-readings}} on the pages of the corpus."""
+    parameters = []
+    for text in load_corpus(synthetic=True).values():
+        for template in mwparserfromhell.parse(text).ifilter_templates(matches=lambda template: template.name.strip() == "ja-readings"):
+            parameters.extend(str(parameter.value).strip() for parameter in template.params if str(parameter.value).strip())
+    return parameters
+
+def made_up_readings(count: int, linked: float, seed: int = 0) -> list[str]:
+    """Parameters of one to eight readings, like "[[みず]] (mizu), み-", a fraction `linked` of them linked."""
+    generator = random.Random(seed)
+    parameters = []
+    for _ in range(count):
+        readings = []
+        for _ in range(generator.randint(1, 8)):
+            reading = "".join(generator.choice(KANA) for _ in range(generator.randint(1, 4)))
+            if generator.random() < linked:
+                reading = generator.choice([f"[[{reading}]]", f"[[{reading}|{reading[0]}.{reading[1:]}]]"])
+            readings.append(reading + generator.choice(["", "", "-", " (x)"]))
+        parameters.append(", ".join(readings))
+    return parameters
+
+def split_readings(parameter: str) -> list[str]:
+    return [each.strip() for each in parameter.split(",")]
+
+def parse_each(parameters: list[str]) -> list[list[str]]:
+    return [[kovachevbot.parse_links_to_plaintext.__wrapped__(reading) for reading in split_readings(parameter)] for parameter in parameters]
+
+def fast_path(parameters: list[str]) -> list[list[str]]:
+    return [[kovachevbot.links_to_plaintext(reading) for reading in split_readings(parameter)] for parameter in parameters]
+
+def batched(parameters: list[str]) -> list[list[str]]:
+    return [kovachevbot.links_to_plaintext_many(split_readings(parameter)) for parameter in parameters]
+
+def best_time(function, parameters: list[str], repeat: int) -> tuple[float, list]:
+    times = []
+    for _ in range(repeat):
+        kovachevbot.parse_links_to_plaintext.cache_clear()
+        start = time.perf_counter()
+        result = function(parameters)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parameters", type=int, default=20000, help="Made-up parameters to add to those of the corpus")
+    parser.add_argument("--linked", type=float, default=0.3, help="Fraction of made-up readings which are links")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    parameters = corpus_readings() + made_up_readings(args.parameters, args.linked)
+    readings = sum(len(split_readings(parameter)) for parameter in parameters)
+    print(f"{len(parameters)} parameters, {readings} readings")
+
+    expected = None
+    for name, function in [("parse each", parse_each), ("fast path", fast_path), ("batched", batched)]:
+        seconds, result = best_time(function, parameters, args.repeat)
+        if expected is None:
+            expected, baseline = result, seconds
+        elif result != expected:
+            print(f"{name}: OUTPUT DIFFERS")
+        print(f"{name:<12}{seconds*1000:>10.1f} ms{readings/seconds:>12.0f} readings/s{baseline/seconds:>8.1f}×")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare getting one language's section by parsing the whole page (`mwparserfromhell.parse(text).get_sections`)
+with finding it through the L2 section index and parsing only that section, on some of the largest pages.
+Pages come from Wiktionary, or from a dump if KOVACHEVBOT_DUMP is set; local files can be given with --file.
+
+    python bench_sections.py [--language Bulgarian] [--repeat 5] [--file page.wiki ...] [title ...]
+"""
+import sys
+import time
+import argparse
+import statistics
+import mwparserfromhell
+import kovachevbot
+
+# Some of the longest entries, with many languages each
+DEFAULT_TITLES = ["a", "i", "o", "e", "u", "人", "一", "大", "山"]
+
+
+def best_time(function, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def full_parse(text: str, language: str) -> str | None:
+    sections = mwparserfromhell.parse(text).get_sections([2], language)
+    return str(sections[0]) if sections else None
+
+def indexed_parse(text: str, language: str) -> str | None:
+    section = kovachevbot.find_l2_section(text, language)
+    if section is None:
+        return None
+    return str(mwparserfromhell.parse(text[section.start:section.end]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("titles", nargs="*", default=None)
+    parser.add_argument("--language", default="Bulgarian")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--file", action="append", default=[], help="Read a page's wikitext from a file")
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.file:
+        with open(path, encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    titles = args.titles or ([] if args.file else DEFAULT_TITLES)
+    pages.extend((page.title(), page.text) for page in kovachevbot.pages_from_titles(titles))
+
+    print(f"{'page':<20}{'chars':>10}{'L2s':>6}{'full (ms)':>12}{'indexed (ms)':>14}{'speedup':>10}")
+    speedups = []
+    for title, text in pages:
+        if not text:
+            print(f"{title:<20}{'missing':>10}")
+            continue
+
+        # mwparserfromhell matches section titles by regex search; compare on pages where both agree
+        expected = full_parse(text, args.language)
+        if indexed_parse(text, args.language) != expected:
+            print(f"{title:<20}MISMATCH between the full parse and the indexed section", file=sys.stderr)
+            continue
+
+        full = best_time(lambda: full_parse(text, args.language), args.repeat)
+        indexed = best_time(lambda: indexed_parse(text, args.language), args.repeat)
+        speedups.append(full / indexed)
+        print(f"{title:<20}{len(text):>10}{len(kovachevbot.l2_sections(text)):>6}{full*1000:>12.2f}{indexed*1000:>14.2f}{full/indexed:>9.1f}x")
+
+    if speedups:
+        print(f"Median speedup: {statistics.median(speedups):.1f}x over {len(speedups)} pages")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Benchmark the core wikitext transforms of the tasks over the page corpus of pinned real revisions (see corpus.py),
+and over the synthetic giant pages built from it (and, with --synthetic, the hand-written pages). For each transform and page this measures the time per call (the best of several runs)
+and the peak memory allocated during a call (with tracemalloc, in a separate run), and records a hash of the output.
+
+Results can be saved as a baseline and later compared against, so that the effect of a change to a parser or algorithm
+can be judged by numbers: a transform is reported as slower or heavier when it exceeds the baseline by more than
+the tolerance, and as changed when its output differs. The exit status is 1 if anything regressed or changed.
+
+    python bench_transforms.py [--case NAME ...] [--repeat 5] [--no-giants] [--synthetic] [--save baseline.json] [--compare baseline.json]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from dataclasses import dataclass
+from typing import Callable
+import mwparserfromhell
+import kovachevbot
+from corpus import load_corpus, load_revisions, giant_pages, unfetched
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(path: str):
+    """Import one of the task scripts (which are not modules, and may read files next to them when imported)."""
+    return kovachevbot.load_task_script(os.path.join(REPOSITORY, path))
+
+
+@dataclass
+class Case:
+    name: str
+    language: str | None  # Only pages with a section for this language are used, if given
+    script: str | None  # The task script the transform is in, if not in kovachevbot itself
+    run: Callable  # (module, title, text) -> the transform's result
+
+def anagrams_of(title: str) -> set[str]:
+    # Made-up anagrams: the cost of the transform does not depend on which words they are
+    return {"".join(sorted(title)), title[::-1]} - {title}
+
+def run_add_anagrams(module, title: str, text: str):
+    anagrams = anagrams_of(title)
+    return module.add_anagrams(text, anagrams, module.get_alphagram(title))
+
+NEW_L2 = "==Bulgarian==\n\n===Noun===\n{{bg-noun|тест|m}}\n\n# [[test]]\n"
+
+def run_add_l2(module, title: str, text: str):
+    parsed = mwparserfromhell.parse(text)
+    kovachevbot.add_l2(parsed, NEW_L2)
+    return str(parsed)
+
+CASES = [
+    Case("en add_anagrams", "English", "english-anagrams/en-anagrams.py", run_add_anagrams),
+    Case("bg add_anagrams", "Bulgarian", "bulgarian-anagrams/bg-anagrams.py", run_add_anagrams),
+    Case("ja-yomi remove_yomi", None, "ja-yomi/ja-yomi-remove.py", lambda module, title, text: module.remove_yomi(text)),
+    Case("ja-readings fix_readings", "Japanese", "ja-readings-fix/ja-readings.py", lambda module, title, text: module.fix_readings(title, text)),
+    Case("auto-audio add_audio", "Bulgarian", "auto-audio/auto-audio.py",
+         lambda module, title, text: module.add_audio(text, title, f"File:LL-Q7918 (bul)-Kiril kovachev-{title}.wav")[:2]),
+    Case("bg-subject-object fix_inflection", "Bulgarian", "bulgarian-subject-object/bg-subject-object.py", lambda module, title, text: module.fix_text(text)),
+    Case("verbal_noun_rename fix_infl_template", "Bulgarian", "one-time-tasks/verbal_noun_rename.py", lambda module, title, text: module.fix_text(text)),
+    Case("add_l2", None, None, run_add_l2),
+    Case("insert_l2", None, None, lambda module, title, text: kovachevbot.collapse_blank_lines(kovachevbot.insert_l2(text, NEW_L2))),
+]
+
+
+def call(case: Case, module, title: str, text: str):
+    kovachevbot.PARSE_CACHE.clear()  # Every call starts cold, as it does on a fresh page
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        return case.run(module, title, text)
+
+def measure(case: Case, module, title: str, text: str, repeat: int) -> dict:
+    result = call(case, module, title, text)  # Also warms up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call(case, module, title, text)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    call(case, module, title, text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "characters": len(text),
+        "seconds": min(times),
+        "peak_bytes": peak,
+        "output": hashlib.sha1(repr(result).encode("utf-8")).hexdigest(),
+    }
+
+def run_benchmarks(case_names: list[str], repeat: int, giants: bool, synthetic: bool) -> dict:
+    if missing := unfetched():
+        # Numbers from the hand-written pages alone say little about real ones, so they are only given when asked for
+        message = f"The corpus lacks the pinned revisions of {', '.join(missing)} (python corpus.py update)"
+        if not synthetic:
+            sys.exit(f"{message}; give --synthetic to run without them")
+        print(f"{message}; running without them", file=sys.stderr)
+    pages = load_corpus(synthetic)
+    if giants:
+        pages.update(giant_pages(pages))
+
+    results = {}
+    for case in CASES:
+        if case_names and case.name not in case_names:
+            continue
+        module = load_script(case.script) if case.script else None
+        case_pages = {title: text for title, text in pages.items() if case.language is None or kovachevbot.find_l2_section(text, case.language)}
+
+        results[case.name] = {}
+        for title, text in case_pages.items():
+            results[case.name][title] = measure(case, module, title, text, repeat)
+        report_case(case.name, results[case.name])
+    return results
+
+def report_case(name: str, pages: dict) -> None:
+    if not pages:
+        print(f"{name}: no pages in the corpus")
+        return
+    total = sum(page["seconds"] for page in pages.values())
+    slowest = max(pages, key=lambda title: pages[title]["seconds"])
+    print(f"{name}: {len(pages)} pages, {total*1000:.1f} ms in total, {total/len(pages)*1000:.2f} ms/page mean, "
+          f"peak {max(page['peak_bytes'] for page in pages.values())/1024:.0f} KiB; "
+          f"slowest {slowest} ({pages[slowest]['seconds']*1000:.1f} ms, {pages[slowest]['characters']} characters)")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """Report the differences from the baseline, returning whether anything regressed or changed output."""
+    problems = False
+    for name, pages in results.items():
+        for title, page in pages.items():
+            previous = baseline.get(name, {}).get(title)
+            if previous is None:
+                continue
+            time_ratio = page["seconds"] / previous["seconds"] if previous["seconds"] else 1.0
+            memory_ratio = page["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else 1.0
+            notes = []
+            if time_ratio > 1 + tolerance:
+                notes.append(f"slower ×{time_ratio:.2f}")
+            elif time_ratio < 1 - tolerance:
+                notes.append(f"faster ×{1/time_ratio:.2f}")
+            if memory_ratio > 1 + tolerance:
+                notes.append(f"more memory ×{memory_ratio:.2f}")
+            elif memory_ratio < 1 - tolerance:
+                notes.append(f"less memory ×{1/memory_ratio:.2f}")
+            if page["output"] != previous["output"]:
+                notes.append("OUTPUT CHANGED")
+            if notes:
+                print(f"{name} / {title}: {', '.join(notes)}")
+            problems = problems or time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance or page["output"] != previous["output"]
+    return problems
+
+def main():
+    if os.environ.get("PYTHONHASHSEED") != "0":
+        # Set iteration order (e.g. of the anagrams written into a template) must not vary between runs, or outputs would
+        os.execve(sys.executable, [sys.executable] + sys.argv, {**os.environ, "PYTHONHASHSEED": "0"})
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--case", action="append", default=[], help="Only run the named transform(s)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-giants", dest="giants", action="store_false", help="Leave out the giant pages")
+    parser.add_argument("--synthetic", action="store_true", help="Also run over the hand-written pages")
+    parser.add_argument("--save", metavar="BASELINE", help="Save the results as a baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare the results with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change from the baseline to report (default 0.1)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    # Some transforms write notes about problem pages into the working directory
+    with tempfile.TemporaryDirectory() as directory:
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            results = run_benchmarks(args.case, args.repeat, args.giants, args.synthetic)
+        finally:
+            os.chdir(previous_directory)
+
+    if args.save:
+        with open(args.save, mode="w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "mwparserfromhell": mwparserfromhell.__version__,
+                "revisions": load_revisions(),
+                "results": results,
+            }, f, ensure_ascii=False, indent=1)
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
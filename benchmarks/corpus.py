@@ -0,0 +1,133 @@
+"""
+The corpus of page snapshots which the benchmarks run the transforms over. Each real page is a file `corpus/<title>.wiki`,
+holding the revision of the page pinned for it in `corpus/revisions.json` (title -> revision ID), so that every checkout
+benchmarks the same text. `corpus/synthetic/` has hand-written pages in the shape of real entries, and `giant_pages` builds
+pathological pages out of the corpus: ones with hundreds of languages, and ones whose sections are hundreds of times
+longer than usual. Both are synthetic, and are labelled as such wherever they are reported.
+
+Run this file to pin the latest revision of pages (by default, every page in revisions.json), to fetch the pinned
+revisions from Wiktionary into the corpus, or to do both at once, and to list the pages yet to be pinned or fetched:
+
+    python corpus.py pin [title ...]
+    python corpus.py fetch [title ...]
+    python corpus.py update [title ...]
+    python corpus.py status
+"""
+import os
+import sys
+import json
+import pywikibot
+import kovachevbot
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+SYNTHETIC_DIRECTORY = os.path.join(CORPUS_DIRECTORY, "synthetic")
+REVISIONS_FILE = os.path.join(CORPUS_DIRECTORY, "revisions.json")
+CORPUS_EXTENSION = ".wiki"
+SYNTHETIC_LABEL = " (synthetic)"  # After the titles of the hand-written pages, in results
+GIANT_LANGUAGES = 200  # L2 sections in front of the page's own, in the giant versions of a page
+GIANT_SECTION_REPEAT = 50  # Times the body of each section is repeated, in the giant versions of a page
+
+
+def corpus_path(title: str, directory: str = CORPUS_DIRECTORY) -> str:
+    return os.path.join(directory, title.replace("/", "%2F") + CORPUS_EXTENSION)
+
+def read_pages(directory: str) -> dict[str, str]:
+    pages = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(CORPUS_EXTENSION):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                pages[name[:-len(CORPUS_EXTENSION)].replace("%2F", "/")] = f.read()
+    return pages
+
+def load_corpus(synthetic: bool = False) -> dict[str, str]:
+    """
+    The text of every real page in the corpus, by title, and with `synthetic`, of every hand-written page too,
+    titled "<title> (synthetic)".
+    """
+    pages = read_pages(CORPUS_DIRECTORY)
+    if synthetic:
+        pages.update({title + SYNTHETIC_LABEL: text for title, text in read_pages(SYNTHETIC_DIRECTORY).items()})
+    return pages
+
+def giant_pages(pages: dict[str, str]) -> dict[str, str]:
+    """
+    Synthetic, pathological versions of each page, titled "<title> (synthetic: many languages)" and
+    "<title> (synthetic: long sections)": the first has GIANT_LANGUAGES other languages' sections (taken from the
+    corpus, and renamed) before its own, the second has the body of each of its sections repeated GIANT_SECTION_REPEAT times.
+    """
+    filler = []
+    for text in pages.values():
+        for section in kovachevbot.l2_sections(text):
+            filler.append(text[section.start:section.end].split("\n", 1)[1])
+
+    giants = {}
+    for title, text in pages.items():
+        title = title.removesuffix(SYNTHETIC_LABEL)
+        languages = "".join(f"==Filler {i}==\n{filler[i % len(filler)]}" for i in range(GIANT_LANGUAGES))
+        giants[f"{title} (synthetic: many languages)"] = languages + text
+
+        sections = kovachevbot.l2_sections(text)
+        long_text = text[:sections[0].start] if sections else text
+        for section in sections:
+            heading, body = text[section.start:section.end].split("\n", 1)
+            long_text += heading + "\n" + body * GIANT_SECTION_REPEAT
+        giants[f"{title} (synthetic: long sections)"] = long_text
+    return giants
+
+def load_revisions() -> dict[str, int | None]:
+    """The pinned revision of each page of the corpus, by title (`None` if it is yet to be pinned)."""
+    with open(REVISIONS_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_revisions(revisions: dict[str, int | None]) -> None:
+    with open(REVISIONS_FILE, mode="w", encoding="utf-8") as f:
+        json.dump(revisions, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+
+def pin(titles: list[str]) -> None:
+    """Pin the latest revision of each page, to be fetched by `fetch`."""
+    revisions = load_revisions()
+    for page in kovachevbot.pages_from_titles(titles):
+        if not page.exists():
+            print(f"Page {page.title()} does not exist, not pinned", file=sys.stderr)
+            continue
+        revisions[page.title()] = kovachevbot.page_revid(page)
+        print(f"Pinned {page.title()} at revision {revisions[page.title()]}")
+    save_revisions(revisions)
+
+def fetch(titles: list[str]) -> None:
+    """Fetch the pinned revision of each page from Wiktionary into the corpus."""
+    revisions = load_revisions()
+    for title in titles:
+        revid = revisions.get(title)
+        if revid is None:
+            print(f"Page {title} has no pinned revision, not fetched (pin it first)", file=sys.stderr)
+            continue
+        text = pywikibot.Page(kovachevbot.get_wiktionary(), title).getOldVersion(revid)
+        with open(corpus_path(title), mode="w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Saved {title} at revision {revid} ({len(text)} characters)")
+
+def unfetched() -> list[str]:
+    """The pages of revisions.json which are not in the corpus yet, pinned or not."""
+    return [title for title in load_revisions() if not os.path.exists(corpus_path(title))]
+
+def main():
+    mode = sys.argv[1] if len(sys.argv) > 1 else None
+    titles = sys.argv[2:] or list(load_revisions())
+    if mode == "pin":
+        pin(titles)
+    elif mode == "fetch":
+        fetch(titles)
+    elif mode == "update":
+        pin(titles)
+        fetch(titles)
+    elif mode == "status":
+        revisions = load_revisions()
+        for title in unfetched():
+            print(title, "is not fetched" if revisions[title] else "is not pinned")
+    else:
+        print("Unrecognized mode", mode, "- the modes are pin, fetch, update and status", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
-import os
-import subprocess
 import sys
 import pywikibot
 import mwparserfromhell
+import kovachevbot
 import regex as re
-from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable
 
 # From User:JeffDoozan's bot AutoDooz
 CAT_TEMPLATES = [ "c", "C", "cat", "top", "topic", "topics", "categorize", "catlangname", "catlangcode", "cln", "zh-cat",
@@ -12,57 +12,61 @@ CAT_TEMPLATES = [ "c", "C", "cat", "top", "topic", "topics", "categorize", "catl
 RE_CAT_TEMPLATES = r"\{\{\s*(" + "|".join(CAT_TEMPLATES) + r")\s*[|}][^{}]*\}*"
 RE_CATEGORIES = r"\[\[\s*[cC]at(egory)?\s*:[^\]]*\]\]"
 RE_MATCH_CATEGORIES = re.compile(fr"({RE_CAT_TEMPLATES}|{RE_CATEGORIES})")
-SITE = pywikibot.Site("en", "wiktionary")
-BACKUP_PATH = "bg-anagrams-backup"
-ALPHABET = "абвгдежзийклмнопрстуфхцчшщъьюя"
-NUMERIC = "0123456789"
-NON_ALPHANUMERIC = f"[^{ALPHABET}{NUMERIC}]"
-NOT_CREATED_LOG = "non_existent_anagrams.txt"
-
-def create_diff(old_text: str, current_page: pywikibot.Page) -> None:
-    """
-    Copy the contents of the page to local storage for backup in case there is a problem
-    with the script later; this will allow the error to be automatically corrected at that time.
-    """
-    os.makedirs(BACKUP_PATH, exist_ok=True)
-    with open("temp1", mode="w", encoding="utf-8") as f:
-        f.write(old_text)
-
-    with open("temp2", mode="w", encoding="utf-8") as f:
-        f.write(current_page.text)
-
-    diff = subprocess.getoutput("diff -u temp2 temp1") # Get differences between new revision and previous
-    diff = diff + "\n" # patch will complain if we don't end the file with a newline
-
-    with open(os.path.join(BACKUP_PATH, current_page.title()), mode="w", encoding="utf-8") as f:
-        f.write(diff)
+BACKUP_PATH = kovachevbot.task_file(__file__, "bg-anagrams-backup")
+LANGUAGE = "bg"  # Whose normaliser decides which words are anagrams (see kovachevbot/anagrams.py)
+NOT_CREATED_LOG = kovachevbot.task_file(__file__, "non_existent_anagrams.txt")
+DUBIOUS_ANAGRAMS = kovachevbot.task_file(__file__, "dubious_anagrams.txt")
+JOURNAL_TASK = "bg-anagrams"
+JOURNAL_PATH = kovachevbot.task_file(__file__, kovachevbot.JOURNAL_FILE)
+TASK_VERSION = "1"  # Change whenever the edits change, so that every page is visited again
 
 def normalise(word: str) -> str:
-    return re.sub(NON_ALPHANUMERIC, "", re.sub("ѝ", "и", word.casefold()))
-    # return re.sub("[-.;:?!‒–—]", "", re.sub("\s", "", word.casefold()))
+    return kovachevbot.normalise_word(word, LANGUAGE)
 
 def get_alphagram(word: str) -> str:
-    return "".join(sorted(normalise(word)))
+    return kovachevbot.get_alphagram(word, LANGUAGE)
 
 def has_bulgarian(page: pywikibot.Page) -> bool:
-    return bool(mwparserfromhell.parse(page.text).get_sections([2], "Bulgarian"))
+    return kovachevbot.find_l2_section(page.text, "Bulgarian") is not None
 
 
-# Calculate all anagrams from the file of words
-with open("words.txt") as f:
-    wordlist: list[str] = f.readlines()
+@dataclass
+class PageInfo:
+    """What the task needs to know about an anagram's page, beyond the page it is editing."""
+    exists: bool
+    has_bulgarian: bool
+    revid: int | None
 
-anagrams = defaultdict(set)
+page_info: dict[str, PageInfo] = {}  # This run's, by title, so that no page is fetched twice for it
 
-for word in wordlist:
-    anagrams[get_alphagram(word)].add(word.strip())
+def remember_page(page: pywikibot.Page) -> PageInfo:
+    info = PageInfo(page.exists(), page.exists() and has_bulgarian(page), kovachevbot.page_revid(page))
+    page_info[page.title()] = info
+    return info
 
-# ---------------------------------------------
+def load_page_info(titles: Iterable[str]) -> None:
+    """Fetch the pages which this run knows nothing about yet, in batches, to fill in their info."""
+    for page in kovachevbot.pages_from_titles([title for title in dict.fromkeys(titles) if title not in page_info]):
+        remember_page(page)
+
+def uncreated_anagrams(titles: Iterable[str]) -> set[str]:
+    """Those of the titles whose pages do not exist or have no Bulgarian section."""
+    titles = set(titles)
+    load_page_info(titles)
+    return {title for title in titles if title not in page_info or not page_info[title].has_bulgarian}
+
+
+WORDLIST = kovachevbot.task_file(__file__, "words.txt")
+anagrams: kovachevbot.AnagramIndex | dict[str, set[str]] = {}  # Loaded by `load_anagrams` when the task runs
 
-anagrams = {letter_count: anas for letter_count, anas in anagrams.items() if len(anas) > 1} # Only keep words with multiple anagrams
+def load_anagrams(path: str = WORDLIST) -> kovachevbot.AnagramIndex:
+    """The anagrams of the file of words (the alphagrams with more than one word), indexed once per version of the file."""
+    return kovachevbot.load_anagram_index(path, LANGUAGE)
+
+# ---------------------------------------------
 
 def count_anagrams():
-    return sum(len(anagram_list) for anagram_list in anagrams.values())
+    return anagrams.anagram_count()  # From the sizes of the index's groups, none of which are decoded
 
 def generate_anagrams_section(anagrams: set[str]) -> str:
     return "\n\n===Anagrams===\n* " + generate_anagrams_template(anagrams, get_alphagram(anagrams.copy().pop())) + "\n\n"
@@ -70,19 +74,17 @@ def generate_anagrams_section(anagrams: set[str]) -> str:
 def generate_anagrams_template(anagrams: set[str], alphagram: str) -> str:
     return "{{" + f"anagrams|bg|a={alphagram}|" + "|".join(anagrams) + "}}"
 
-def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
-    parsed = mwparserfromhell.parse(contents)
-
+def add_anagrams_to_section(bulgarian_section: mwparserfromhell.wikicode.Wikicode, anagrams_to_add: set[str], alphagram: str) -> set[str]:
+    """Add the anagrams to the Bulgarian section, in place, returning those which were not there already."""
     anagrams_added = anagrams_to_add.copy()
 
-    bulgarian_section: mwparserfromhell.wikicode.Wikicode = parsed.get_sections([2], "Bulgarian")[0]
     anagrams_section: mwparserfromhell.wikicode.Wikicode = bulgarian_section.get_sections([3], "Anagrams")
     if anagrams_section:
         anagrams_section = anagrams_section[0]
         anagrams_templates = anagrams_section.filter(forcetype=mwparserfromhell.wikicode.Template)
         anagrams_templates = [t for t in anagrams_templates if t.name == "anagrams"]
         if len(anagrams_templates) == 0:
-            return contents, set()
+            return set()
     
         existing = set()
         anagrams_template = anagrams_templates[0]
@@ -92,7 +94,7 @@ def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
             i += 1
 
         if existing.union(anagrams_to_add) == existing:  # If there are no new anagrams present
-            return contents, set()
+            return set()
         
         anagrams_to_add = anagrams_to_add.union(existing)
 
@@ -115,110 +117,193 @@ def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
 
         bulgarian_section.insert(index, generate_anagrams_section(anagrams_to_add))
 
-    return str(parsed), anagrams_added
+    return anagrams_added
 
-def update_page(title: str, alphagram: str, uncreated: set[str]) -> bool:
-    """Update a page with its anagrams. Returns whether changes were made."""
-    page = pywikibot.Page(SITE, title)
-
-    create_diff(page.text, page)
-    
-    if has_bulgarian(page):
-        anagrams_to_add = anagrams[alphagram] - {title}
-        new_content, anagrams_added = add_anagrams(page.text, anagrams_to_add, alphagram)
-        new_content = re.sub("\n{3,}", "\n\n", new_content)
-
-        for anagram in anagrams_to_add:
-            other_page = pywikibot.Page(SITE, anagram)
-            if not has_bulgarian(other_page):
-                uncreated.add(f"{anagram}\n")
-
-        if new_content == page.text:
-            print(f"Did nothing on page {title} as there are already anagrams present", file=sys.stderr)
-            return False
-        else:
-            page.text = new_content
-            plural_s = "s" if len(anagrams_added) > 1 else ""
-            if len(anagrams_added) == 0:
-                print("Nothing was added, but the content was changed! (not saved)")
-                return False
-
-            page.save(f"Added anagram{plural_s} ({', '.join(anagrams_added)}) to Bulgarian section", minor=False)
-            return True
-    else:
+def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
+    bulgarian_section, section_span = kovachevbot.parse_l2_section(contents, "Bulgarian")
+    anagrams_added = add_anagrams_to_section(bulgarian_section, anagrams_to_add, alphagram)
+    return kovachevbot.splice_section(contents, section_span, str(bulgarian_section)), anagrams_added
+
+def anagram_words() -> list[str]:
+    """Every word with anagrams, loading them if need be."""
+    global anagrams
+    if not anagrams:
+        anagrams = load_anagrams()
+    return [word for group in anagrams.values() for word in group]
+
+def has_anagrams(title: str, text: str) -> bool:
+    return get_alphagram(title) in anagrams
+
+def edit_summary(anagrams_added: set[str]) -> str:
+    plural_s = "s" if len(anagrams_added) > 1 else ""
+    return f"Added anagram{plural_s} ({', '.join(anagrams_added)}) to Bulgarian section"
+
+@kovachevbot.register_task("bg-anagrams", "Bulgarian", titles=anagram_words, selector=has_anagrams, minor=False)
+def add_anagrams_task(title: str, bulgarian_section: mwparserfromhell.wikicode.Wikicode) -> str | None:
+    alphagram = get_alphagram(title)
+    anagrams_to_add = anagrams[alphagram] - {title}
+    if not anagrams_to_add:
+        return None
+    anagrams_added = add_anagrams_to_section(bulgarian_section, anagrams_to_add, alphagram)
+    if not anagrams_added:
+        return None
+    kovachevbot.collapse_blank_lines_in(bulgarian_section)
+    return edit_summary(anagrams_added)
+
+def page_version(title: str) -> str:
+    """The version of the task's work on a page, which changes with the task or the page's anagrams."""
+    return kovachevbot.version_of(TASK_VERSION, sorted(anagrams[get_alphagram(title)] - {title}))
+
+def plan_page(page: pywikibot.Page, alphagram: str, anagrams_to_add: set[str]) -> tuple[str, str] | None:
+    """The page's new text with its anagrams added, and the edit summary, or `None` if there is nothing to add."""
+    title = page.title()
+    if not has_bulgarian(page):
         print(f"Skipping page {title}, as it does not exist or has no Bulgarian content", file=sys.stderr)
-    
-    return False
-
-def main(uncreated: set[str]):
-    try:
-        LIMIT = int(pywikibot.argvu[1])
-    except:
-        LIMIT = -1
+        kovachevbot.record_event("skip", title, "no Bulgarian section")
+        return None
 
+    with kovachevbot.timed("transform", title):
+        new_content, anagrams_added = add_anagrams(page.text, anagrams_to_add, alphagram)
+    new_content = kovachevbot.collapse_blank_lines(new_content)
+
+    if new_content == page.text:
+        print(f"Did nothing on page {title} as there are already anagrams present", file=sys.stderr)
+        kovachevbot.record_event("no-op", title)
+        return None
+    if len(anagrams_added) == 0:
+        print("Nothing was added, but the content was changed! (not saved)")
+        return None
+    return new_content, edit_summary(anagrams_added)
+
+def plan_group(alphagram: str, pages: list[pywikibot.Page]) -> list[tuple[pywikibot.Page, tuple[str, str] | None]]:
+    """Plan the edits to the pages of an alphagram's words (see `plan_page`), taking the group's words once for all of them."""
+    group = anagrams[alphagram]
+    return [(page, plan_page(page, alphagram, group - {page.title()})) for page in pages]
+
+def delta_groups(previous: kovachevbot.AnagramIndex | None) -> list[list[str]]:
+    """The words of each alphagram with anagrams whose words have changed since the previous snapshot of the index (every one if there is none)."""
+    # The task only ever adds anagrams, so an alphagram left with fewer than two words is not visited: when a word leaves
+    # the wordlist, it stays listed on the pages of its former anagrams, as it would after a full run
+    alphagrams = [alphagram for alphagram in kovachevbot.changed_alphagrams(previous, anagrams) if alphagram in anagrams]
+    print(f"{len(alphagrams)} alphagrams have changed since the last delta run" if previous else "No snapshot yet: visiting every alphagram")
+    return [sorted(anagrams[alphagram]) for alphagram in alphagrams]
+
+def main(uncreated: set[str], delta: bool = False, limit: int = None):
+    """
+    Add anagrams to every word's page, or with `delta`, only to the words of alphagrams which changed since the last delta run,
+    making at most `limit` edits.
+    """
     print("Preparing to iterate over", len(anagrams), "alphragrams", f"({count_anagrams()} anagrams)")
 
-    edit_count = 0  # Updated for every individual page
-    iterations = 0  # Updated for every set of anagrams
-    for alphagram, anas in anagrams.items():
-
-        if iterations % 5 == 0: # Every fifth set of anagrams, consider whether to halt
-            halt_page = pywikibot.Page(SITE, "User:KovachevBot/halt")
-            if "halt" in halt_page.text.casefold():
-                print(f"ERROR: BOT WAS MANUALLY HALTED BY {halt_page.userName()}", file=sys.stderr)
-                return
+    # Pages which have not been edited since the last run, and whose anagrams are the same, are left out
+    journal = kovachevbot.get_journal(JOURNAL_TASK, JOURNAL_PATH)
+    previous = kovachevbot.load_anagram_snapshot(anagrams) if delta else None
+    groups = delta_groups(previous) if delta else (sorted(anas) for anas in anagrams.values())
 
-        for anagram in anas:
-            if edit_count == LIMIT:
-                return
+    def saved(page: pywikibot.Page, outcome: str):
+        status = {"saved": kovachevbot.DONE, "unchanged": kovachevbot.SKIPPED}.get(outcome, kovachevbot.FAILED)
+        journal.record_visit(page, status, page_version(page.title()))
+        remember_page(page)  # With the revision just saved
 
-            edit_count += int(update_page(anagram, alphagram, uncreated))  # If a change was made, increase the edit count
-
-        iterations += 1
+    # The anagrams added to pages, whose own pages are checked at the end, each fetched at most once in the run:
+    # most are pages the run visits anyway, as each alphagram's pages are fetched together
+    listed = set()
+    # Only the edits count towards the limit given on the command line, not the pages (or groups) visited
+    edit_count = 0  # Updated for every individual page
+    try:
+        with kovachevbot.SaveQueue(BACKUP_PATH, on_done=saved, minor=False) as saves:
+            for group in kovachevbot.iterate_with_abort_check(kovachevbot.groups_changed_since_visit(groups, journal, page_version)):
+                alphagram = get_alphagram(group[0].title())
+                for page, plan in plan_group(alphagram, group):
+                    title = page.title()
+                    if remember_page(page).has_bulgarian:
+                        listed.update(anagrams[alphagram] - {title})
+                    if plan is None:
+                        journal.record_visit(page, kovachevbot.SKIPPED, page_version(title))
+                        continue
+                    if edit_count == limit:
+                        return
+
+                    saves.put(page, *plan)
+                    edit_count += 1  # If a change was made, increase the edit count
+
+        if delta:
+            # Every changed group has been visited (unless halted, which raises here), so the next run compares with this index,
+            # unless some pages failed to save: the snapshot cannot leave out their groups, so the next run visits them all again
+            # (skipping the pages already done)
+            kovachevbot.check_halt()
+            if previous:
+                previous.close()
+            if saves.result.failed:
+                print(f"{saves.result.failed} pages failed to save, so the snapshot is not updated", file=sys.stderr)
+            else:
+                kovachevbot.save_anagram_snapshot(anagrams)
+    finally:
+        uncreated.update(f"{title}\n" for title in uncreated_anagrams(listed))
 
-def there_are_erroneous_anagrams(original, anagrams: set[str]) -> bool:
-    for anagram in anagrams:
-        if anagram == original: continue
-        if normalise(anagram) == normalise(original):
-            return True
-    return False
+def there_are_erroneous_anagrams(original: str, listed: list) -> bool:
+    """Whether any of the anagrams listed for a word is only a variant of it, with the same normal form."""
+    normal = normalise(original)
+    known = anagrams.normal_forms(get_alphagram(original))  # Normalised when the index was built
+    return any((known[anagram] if anagram in known else normalise(anagram)) == normal
+               for anagram in map(str, listed) if anagram != original)
 
 def find_erroneous_anagrams():
     errors = []
-    for anagram_list in anagrams.values():
-        for anagram in anagram_list:
-            page = pywikibot.Page(SITE, anagram)
-            
-            if not page.exists(): continue
-            if not has_bulgarian(page): continue
-
-            print("Traversing page", anagram + "...")
-
-            for template in mwparserfromhell.parse(page.text).filter(forcetype=mwparserfromhell.wikicode.Template):
-                template: mwparserfromhell.wikicode.Template
-                if template.name != "anagrams": continue
-                if not template.has_param(1): continue
-                if template.get(1) != "bg": continue
-
-                if there_are_erroneous_anagrams(anagram, template.params[2:]):
-                    print("Found erroneous anagrams: ", template.params[2:])
-                    errors.append(anagram)
-                    break
-
-    with open("dubious_anagrams.txt", mode="w") as f:
+    # Pages this run already knows to have no Bulgarian section are not fetched again; the rest are fetched in batches
+    words = (anagram for anagram_list in anagrams.values() for anagram in anagram_list
+             if anagram not in page_info or page_info[anagram].has_bulgarian)
+    for page in kovachevbot.pages_from_titles(words):
+        if not remember_page(page).has_bulgarian: continue
+        anagram = page.title()
+
+        print("Traversing page", anagram + "...")
+
+        for template in kovachevbot.parse(page.text).filter(forcetype=mwparserfromhell.wikicode.Template):
+            template: mwparserfromhell.wikicode.Template
+            if template.name != "anagrams": continue
+            if not template.has_param(1): continue
+            if template.get(1) != "bg": continue
+
+            if there_are_erroneous_anagrams(anagram, template.params[2:]):
+                print("Found erroneous anagrams: ", template.params[2:])
+                errors.append(anagram)
+                break
+
+    with open(DUBIOUS_ANAGRAMS, mode="w") as f:
         f.write("\n".join(errors))
 
+def delta_main(limit: int = None):
+    """Run only over the alphagrams which changed since the last delta run, keeping the log of uncreated anagrams."""
+    uncreated = set()
+    try:
+        with open(NOT_CREATED_LOG) as f:
+            uncreated = set(f.readlines())
+    except FileNotFoundError:
+        pass
+    try:
+        main(uncreated, delta=True, limit=limit)
+    finally:
+        with open(NOT_CREATED_LOG, "w") as f:
+            f.writelines(uncreated)
+
 if __name__ == "__main__":
-    # uncreated = set()
-    # try:
-    #     with open(NOT_CREATED_LOG) as f:
-    #         uncreated = set(f.readlines())
-    # except FileNotFoundError:
-    #     with open(NOT_CREATED_LOG, "w") as f:
-    #         pass
-    # try:
-    #     main(uncreated)
-    # finally:
-    #     with open(NOT_CREATED_LOG, "w") as f:
-    #         f.writelines(uncreated)
-    find_erroneous_anagrams()
\ No newline at end of file
+    anagrams = load_anagrams()
+    arguments, limit = kovachevbot.command_line_arguments()
+    if arguments[:1] == ["delta"]:
+        # After a wordlist refresh, visit only the words of alphagrams whose words changed: delta [limit]
+        delta_main(limit)
+    else:
+        # uncreated = set()
+        # try:
+        #     with open(NOT_CREATED_LOG) as f:
+        #         uncreated = set(f.readlines())
+        # except FileNotFoundError:
+        #     with open(NOT_CREATED_LOG, "w") as f:
+        #         pass
+        # try:
+        #     main(uncreated)
+        # finally:
+        #     with open(NOT_CREATED_LOG, "w") as f:
+        #         f.writelines(uncreated)
+        find_erroneous_anagrams()
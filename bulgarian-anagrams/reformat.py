@@ -1,11 +1,11 @@
-def process(line: str) -> str:
-    return line[line.rfind(" ")+1:].replace("-", "")
+import kovachevbot
 
-with open("words.txt") as f:
-    contents = f.readlines()
 
-for i, line in enumerate(contents):
-    contents[i] = process(line)
+def process(line: str) -> str:
+    return line[line.rfind(" ")+1:].replace("-", "")
 
-with open("modified.txt", mode="w") as f:
-    f.writelines(contents)
+if __name__ == "__main__":
+    # Each word once; the index can also be built from the raw list directly, with ("words.txt", process) as its source
+    with open("modified.txt", mode="w", encoding="utf-8") as f:
+        for word in kovachevbot.read_words(("words.txt", process), "bg"):
+            f.write(word + "\n")
@@ -3,41 +3,78 @@ import pywikibot
 import mwparserfromhell
 import sys
 
-def fix_inflection(template: mwparserfromhell.wikicode.Template):
+EDIT_SUMMARY = "Convert sbjv/objv into sbj/obj in Bulgarian inflections"
+WORDS_TO_EDIT = kovachevbot.task_file(__file__, "words-to-edit.txt")
+JOURNAL_PATH = kovachevbot.task_file(__file__, kovachevbot.JOURNAL_FILE)
+
+def fix_inflection(template: mwparserfromhell.wikicode.Template) -> bool:
+    """Fix the template's parameters, returning whether any were changed."""
     if template.name not in ("inflection of", "infl of"):
         print("Somehow encountered invalid template:", template.name)
 
+    changed = False
     for param in template.params:
         param: mwparserfromhell.nodes.extras.Parameter
         if param.value == "sbjv":
             param.value = "sbj"
+            changed = True
         elif param.value == "objv":
             param.value = "obj"
+            changed = True
+    return changed
+
+def fix_section(bulgarian_section: mwparserfromhell.wikicode.Wikicode) -> bool:
+    """Fix the inflections in the Bulgarian section, in place, returning whether any were changed."""
+    changed = False
+    for inflection_template in bulgarian_section.filter(forcetype=mwparserfromhell.wikicode.Template, matches=r"{{infl(?:ection)? of\|bg\|.*?}}"):
+        inflection_template: mwparserfromhell.wikicode.Template
+        changed = fix_inflection(inflection_template) or changed
+    return changed
+
+def fix_text(text: str) -> tuple[str, str | None]:
+    bulgarian_section_search = kovachevbot.parse_l2_section(text, "Bulgarian")
+    if bulgarian_section_search is None:
+        raise ValueError("Page has no Bulgarian content")
+
+    bulgarian_section, section_span = bulgarian_section_search
+    fix_section(bulgarian_section)
+
+    return kovachevbot.splice_section(text, section_span, str(bulgarian_section)), EDIT_SUMMARY
+
+def words_to_edit() -> list[str]:
+    with open(WORDS_TO_EDIT) as f:
+        return f.read().splitlines()
+
+def mentions_sbjv_or_objv(title: str, text: str) -> bool:
+    return "sbjv" in text or "objv" in text
+
+@kovachevbot.register_task("bg-subject-object", "Bulgarian", titles=words_to_edit, selector=mentions_sbjv_or_objv)
+def fix_section_task(title: str, bulgarian_section: mwparserfromhell.wikicode.Wikicode) -> str | None:
+    return EDIT_SUMMARY if fix_section(bulgarian_section) else None
+
+DRY_RUN_BUNDLE = "bg-subject-object-dry-run.zip"
+JOURNAL_OUTCOMES = {"saved": kovachevbot.DONE, "unchanged": kovachevbot.SKIPPED, "failed": kovachevbot.FAILED}
 
 def main() -> None:
-    with open("words-to-edit.txt") as f:
-        words_to_fix = f.read().splitlines()
-    
-    i = 0
-    for page in kovachevbot.iterate_safe((kovachevbot.wikt_page(word) for word in words_to_fix)):
-        page: pywikibot.Page
-        title = page.title()
-        parsed = mwparserfromhell.parse(page.text)
-        try:
-            bulgarian_section: mwparserfromhell.wikicode.Wikicode = parsed.get_sections([2], "Bulgarian")[0]
-        except IndexError:
-            print(f"Error: page {title} has no Bulgarian content", file=sys.stderr)
-        
-        for inflection_template in bulgarian_section.filter(forcetype=mwparserfromhell.wikicode.Template, matches=r"{{infl(?:ection)? of\|bg\|.*?}}"):
-            inflection_template: mwparserfromhell.wikicode.Template
-            fix_inflection(inflection_template)
-
-        page.text = str(parsed)
-        page.save("Convert sbjv/objv into sbj/obj in Bulgarian inflections")
-        i += 1
-    
-    with open("words-to-edit.txt", mode="w") as f:
-        f.write("\n".join(words_to_fix[i:]))
+    words_to_fix = words_to_edit()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "dry-run":
+        # Preview every edit without saving: dry-run [bundle path]
+        bundle = sys.argv[2] if len(sys.argv) > 2 else DRY_RUN_BUNDLE
+        kovachevbot.dry_run(kovachevbot.pages_from_titles(words_to_fix), fix_text, bundle)
+        return
+
+    # Pages already dealt with in earlier runs are left out
+    journal = kovachevbot.get_journal("bg-subject-object", JOURNAL_PATH)
+    remaining = (title for title in words_to_fix if title not in journal)
+
+    def record(page: pywikibot.Page, outcome: str):
+        journal.record(page.title(), JOURNAL_OUTCOMES[outcome])
+
+    try:
+        kovachevbot.run_pipeline(kovachevbot.pages_from_titles(remaining), fix_text, on_done=record)
+    finally:
+        journal.commit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
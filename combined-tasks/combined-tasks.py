@@ -0,0 +1,37 @@
+"""
+Run several of the Bulgarian tasks together, so that a page which more than one of them edits is fetched, parsed
+and saved only once, with one edit summary covering all of their changes:
+
+    python combined-tasks.py [task ...] [--limit <number of pages>]
+
+where the tasks are any of those registered by the scripts below (by default, all of them).
+"""
+import os
+import sys
+import kovachevbot
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASK_SCRIPTS = [
+    "bulgarian-anagrams/bg-anagrams.py",
+    "auto-audio/auto-audio.py",
+    "bulgarian-subject-object/bg-subject-object.py",
+    "one-time-tasks/verbal_noun_rename.py",
+]
+BACKUP_PATH = "combined-tasks-backup"
+
+def main():
+    for script in TASK_SCRIPTS:
+        kovachevbot.load_task_script(os.path.join(REPOSITORY, script))
+
+    arguments, limit = kovachevbot.command_line_arguments()
+    task_names = arguments or None
+    unknown = [name for name in task_names or [] if name not in kovachevbot.TASKS]
+    if unknown:
+        print("Unrecognized tasks:", ", ".join(unknown), "- the tasks are", ", ".join(kovachevbot.TASKS), file=sys.stderr)
+        return
+
+    saved = kovachevbot.run_tasks(task_names, backup_path=BACKUP_PATH, max_entries=limit)
+    print(f"Saved {saved} pages")
+
+if __name__ == "__main__":
+    main()
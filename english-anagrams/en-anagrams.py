@@ -1,13 +1,8 @@
-import os
-import subprocess
 import sys
-import pyperclip
 import pywikibot
 import mwparserfromhell
-import unicodedata
+import kovachevbot
 import regex as re
-import random
-from collections import defaultdict
 
 # From User:JeffDoozan's bot AutoDooz
 CAT_TEMPLATES = [ "c", "C", "cat", "top", "topic", "topics", "categorize", "catlangname", "catlangcode", "cln", "zh-cat",
@@ -15,74 +10,34 @@ CAT_TEMPLATES = [ "c", "C", "cat", "top", "topic", "topics", "categorize", "catl
 RE_CAT_TEMPLATES = r"\{\{\s*(" + "|".join(CAT_TEMPLATES) + r")\s*[|}][^{}]*\}*"
 RE_CATEGORIES = r"\[\[\s*[cC]at(egory)?\s*:[^\]]*\]\]"
 RE_MATCH_CATEGORIES = re.compile(fr"({RE_CAT_TEMPLATES}|{RE_CATEGORIES})")
-SITE = pywikibot.Site("en", "wiktionary")
 BACKUP_PATH = "en-anagrams-backup"
-DIACRITICS = f"{chr(0x0300)}-{chr(0x036F)}"
-PUNCTUATION = r"’'()\[\]{}<>:,‒–—―…!.«»\-‐?‘’“”;/⁄␠·&@*\\•^¤¢$€£¥₩₪†‡°¡¿¬#№%‰‱¶′§~¨_|¦⁂☞∴‽※" + f"{chr(0x2000)}-{chr(0x206F)}"
-REDUNDANT_CHARS = f"[{DIACRITICS}{PUNCTUATION} ]"
-
-CONVERSIONS = {
-    "æ": "ae",
-    "œ": "oe",
-    "ı": "i",
-}
-
-def create_diff(old_text: str, current_page: pywikibot.Page) -> None:
-    """
-    Copy the contents of the page to local storage for backup in case there is a problem
-    with the script later; this will allow the error to be automatically corrected at that time.
-    """
-    os.makedirs(BACKUP_PATH, exist_ok=True)
-    with open("temp1", mode="w", encoding="utf-8") as f:
-        f.write(old_text)
-
-    with open("temp2", mode="w", encoding="utf-8") as f:
-        f.write(current_page.text)
-
-    diff = subprocess.getoutput("diff -u temp2 temp1") # Get differences between new revision and previous
-    diff = diff + "\n" # patch will complain if we don't end the file with a newline
-
-    with open(os.path.join(BACKUP_PATH, current_page.title()), mode="w", encoding="utf-8") as f:
-        f.write(diff)
+JOURNAL_TASK = "en-anagrams"
+TASK_VERSION = "1"  # Change whenever the edits change, so that every page is visited again
+LANGUAGE = "en"  # Whose normaliser decides which words are anagrams (see kovachevbot/anagrams.py)
 
 def normalise(word: str) -> str:
-    """Normalises the word.
-    Using the following method:
-        - Remove all whitespace at the start and end.
-        - Decompose all characters to their simplest, e.g. é becomes e + ACUTE
-        - Convert to lowercase (casefold)
-        - Remove all irrelevant elements (punctuation, diacritics).
-    """
-    word = word.casefold()
-
-    for source_char, replacement in CONVERSIONS.items():
-        word = word.replace(source_char, replacement)
-
-    word = re.sub(REDUNDANT_CHARS, "", unicodedata.normalize("NFKD", word.strip()).casefold())
-    return word
+    """Normalises the word: without diacritics, punctuation or spaces, and casefolded (see `kovachevbot.normalise_english`)."""
+    return kovachevbot.normalise_word(word, LANGUAGE)
 
 def get_alphagram(word: str) -> str:
-    return "".join(sorted(normalise(word)))
-
-# Calculate all anagrams from the file of words
-print("Preparing anagrams from the dataset...")
-with open("en_wordlist.txt") as f:
-    wordlist: list[str] = f.readlines()
-
-anagrams = defaultdict(set)
+    return kovachevbot.get_alphagram(word, LANGUAGE)
 
-for word in wordlist:
-    anagrams[get_alphagram(word)].add(word.strip())
+WORDLIST = "en_wordlist.txt"
+anagrams: kovachevbot.AnagramIndex | dict[str, set[str]] = {}  # Loaded by `load_anagrams` when the task runs
 
-anagrams = {letter_count: anas for letter_count, anas in anagrams.items() if len(anas) > 1} # Only keep words with multiple anagrams
+def load_anagrams(path: str = WORDLIST) -> kovachevbot.AnagramIndex:
+    """The anagrams of the file of words (the alphagrams with more than one word), indexed once per version of the file."""
+    print("Preparing anagrams from the dataset...")
+    return kovachevbot.load_anagram_index(path, LANGUAGE)
 
 # ---------------------------------------------
 
 def count_anagrams():
-    return sum(len(anagram_list) for anagram_list in anagrams.values())
+    return anagrams.anagram_count()  # From the sizes of the index's groups, none of which are decoded
 
 def get_anagrams(word: str, alphagram: str) -> set[str]:
-    return anagrams[alphagram] - {word} - {ana for ana in anagrams[alphagram] if normalise(ana) == normalise(word)}
+    """The word's anagrams, without the word itself or its variants (e.g. "resume" and "résumé"), whose normal forms are in the index."""
+    return anagrams.anagrams_of(word, alphagram)
 
 def generate_anagrams_section(anagrams: set[str]) -> str:
     return "\n\n===Anagrams===\n* " + generate_anagrams_template(anagrams, get_alphagram(anagrams.copy().pop())) + "\n\n"
@@ -100,16 +55,19 @@ def get_see_also_contents(parsed: mwparserfromhell.wikicode.Wikicode) -> set[str
     return set()
 
 def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
-    parsed = mwparserfromhell.parse(contents)
-
-    anagrams_to_add.difference_update(get_see_also_contents(parsed))
+    l2_sections = kovachevbot.l2_sections(contents)
+    page_top = contents[:l2_sections[0].start] if l2_sections else contents  # Where {{also}} goes
+    anagrams_to_add.difference_update(get_see_also_contents(kovachevbot.parse(page_top)))
 
     if len(anagrams_to_add) == 0:
         return contents, set()
     
     anagrams_added = anagrams_to_add.copy()
 
-    english_section: mwparserfromhell.wikicode.Wikicode = parsed.get_sections([2], "English")[0]
+    english_section_search = kovachevbot.parse_l2_section(contents, "English")
+    if english_section_search is None:
+        return contents, set()
+    english_section, section_span = english_section_search
     anagrams_section: mwparserfromhell.wikicode.Wikicode = english_section.get_sections([3], "Anagrams")
     if anagrams_section:
         anagrams_section = anagrams_section[0]
@@ -150,56 +108,94 @@ def add_anagrams(contents: str, anagrams_to_add: set[str], alphagram):
 
         english_section.insert(index, generate_anagrams_section(anagrams_to_add))
 
-    return str(parsed), anagrams_added
+    return kovachevbot.splice_section(contents, section_span, str(english_section)), anagrams_added
 
-def update_page(title: str, alphagram: str) -> bool:
-    """Update a page with its anagrams. Returns whether changes were made."""
-    page = pywikibot.Page(SITE, title)
+def page_version(title: str) -> str:
+    """The version of the task's work on a page, which changes with the task or the page's anagrams."""
+    return kovachevbot.version_of(TASK_VERSION, sorted(get_anagrams(title, get_alphagram(title))))
 
-    create_diff(page.text, page)
-    
-    anagrams_to_add = get_anagrams(title, alphagram)
-    new_content, added_anagrams = add_anagrams(page.text, anagrams_to_add, alphagram)
-    new_content = re.sub("\n{3,}", "\n\n", new_content)
+def group_anagrams(alphagram: str) -> dict[str, set[str]]:
+    """The anagrams of every word of the alphagram, without the word or its variants, all worked out at once from the group's classes."""
+    classes = anagrams.classes(alphagram)
+    group = set().union(*classes.values())
+    return {word: group - variants for variants in classes.values() for word in variants}
+
+def plan_page(page: pywikibot.Page, alphagram: str, anagrams_to_add: set[str]) -> tuple[str, str] | None:
+    """The page's new text with its anagrams added, and the edit summary, or `None` if there is nothing to add."""
+    title = page.title()
+    with kovachevbot.timed("transform", title):
+        new_content, added_anagrams = add_anagrams(page.text, anagrams_to_add, alphagram)
+    new_content = kovachevbot.collapse_blank_lines(new_content)
 
     if new_content == page.text:
         print(f"Did nothing on page {title} as there are already anagrams present", file=sys.stderr)
-        return False
-    else:
-        page.text = new_content
-        plural_s = "s" if len(added_anagrams) > 1 else ""
-        exist_other_sections = len(mwparserfromhell.parse(page.text).get_sections([2])) > 1
-        page.save(f"Added anagram{plural_s} ({', '.join(added_anagrams)}){' to English section' if exist_other_sections else ''}", minor=False)
-        return True
-
-def main():
-    try:
-        LIMIT = int(pywikibot.argvu[1])
-    except:
-        LIMIT = -1
+        kovachevbot.record_event("no-op", title)
+        return None
+
+    plural_s = "s" if len(added_anagrams) > 1 else ""
+    exist_other_sections = len(kovachevbot.l2_sections(new_content)) > 1
+    return new_content, f"Added anagram{plural_s} ({', '.join(added_anagrams)}){' to English section' if exist_other_sections else ''}"
+
+def plan_group(alphagram: str, pages: list[pywikibot.Page]) -> list[tuple[pywikibot.Page, tuple[str, str] | None]]:
+    """Plan the edits to the pages of an alphagram's words (see `plan_page`), working out their anagrams together."""
+    to_add = group_anagrams(alphagram)
+    return [(page, plan_page(page, alphagram, set(to_add.get(page.title()) or get_anagrams(page.title(), alphagram)))) for page in pages]
+
+def delta_groups(previous: kovachevbot.AnagramIndex | None) -> list[list[str]]:
+    """The words of each alphagram with anagrams whose words have changed since the previous snapshot of the index (every one if there is none)."""
+    # The task only ever adds anagrams, so an alphagram left with fewer than two words is not visited: when a word leaves
+    # the wordlist, it stays listed on the pages of its former anagrams, as it would after a full run
+    alphagrams = [alphagram for alphagram in kovachevbot.changed_alphagrams(previous, anagrams) if alphagram in anagrams]
+    print(f"{len(alphagrams)} alphagrams have changed since the last delta run" if previous else "No snapshot yet: visiting every alphagram")
+    return [sorted(anagrams[alphagram]) for alphagram in alphagrams]
+
+def main(delta: bool = False, limit: int = None):
+    """
+    Add anagrams to every word's page, or with `delta`, only to the words of alphagrams which changed since the last delta run,
+    making at most `limit` edits.
+    """
+    global anagrams
+    anagrams = load_anagrams()
 
     print("Preparing to iterate over", len(anagrams), "alphragrams", f"({count_anagrams()} anagrams)")
-    for anagram_list in anagrams.values():
-        if random.randint(1, 1000) == 50:
-            print(anagram_list)
-
-    edit_count = 0  # Updated for every individual page
-    iterations = 0  # Updated for every set of anagrams
-    for alphagram, anas in anagrams.items():
 
-        if iterations % 5 == 0: # Every fifth set of anagrams, consider whether to halt
-            halt_page = pywikibot.Page(SITE, "User:KovachevBot/halt")
-            if "halt" in halt_page.text.casefold():
-                print(f"ERROR: BOT WAS MANUALLY HALTED BY {halt_page.userName()}", file=sys.stderr)
-                return
+    # Pages which have not been edited since the last run, and whose anagrams are the same, are left out
+    journal = kovachevbot.get_journal(JOURNAL_TASK)
+    previous = kovachevbot.load_anagram_snapshot(anagrams) if delta else None
+    groups = delta_groups(previous) if delta else (sorted(anas) for anas in anagrams.values())
 
-        for anagram in anas:
-            if edit_count == LIMIT:
-                return
+    def saved(page: pywikibot.Page, outcome: str):
+        status = {"saved": kovachevbot.DONE, "unchanged": kovachevbot.SKIPPED}.get(outcome, kovachevbot.FAILED)
+        journal.record_visit(page, status, page_version(page.title()))
 
-            edit_count += int(update_page(anagram, alphagram))  # If a change was made, increase the edit count
-
-        iterations += 1
+    # Each alphagram's pages are fetched together, and saved in the background while the next ones are fetched.
+    # Only the edits count towards the limit given on the command line, not the pages (or groups) visited
+    edit_count = 0  # Updated for every individual page
+    with kovachevbot.SaveQueue(BACKUP_PATH, on_done=saved, minor=False) as saves:
+        for group in kovachevbot.iterate_with_abort_check(kovachevbot.groups_changed_since_visit(groups, journal, page_version)):
+            for page, plan in plan_group(get_alphagram(group[0].title()), group):
+                if plan is None:
+                    journal.record_visit(page, kovachevbot.SKIPPED, page_version(page.title()))
+                    continue
+                if edit_count == limit:
+                    return
+
+                saves.put(page, *plan)
+                edit_count += 1  # If a change was made, increase the edit count
+
+    if delta:
+        # Every changed group has been visited (unless halted, which raises here), so the next run compares with this index,
+        # unless some pages failed to save: the snapshot cannot leave out their groups, so the next run visits them all again
+        # (skipping the pages already done)
+        kovachevbot.check_halt()
+        if previous:
+            previous.close()
+        if saves.result.failed:
+            print(f"{saves.result.failed} pages failed to save, so the snapshot is not updated", file=sys.stderr)
+        else:
+            kovachevbot.save_anagram_snapshot(anagrams)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Either every alphagram ([limit]), or only those changed since the last delta run (delta [limit])
+    arguments, limit = kovachevbot.command_line_arguments()
+    main(delta=arguments[:1] == ["delta"], limit=limit)
\ No newline at end of file
@@ -1,23 +1,19 @@
 import sys
 import pywikibot
 import mwparserfromhell
+import kovachevbot
 from typing import Generator
 from daijirin import are_duplicate_kanas, is_kana, get_accent
 
 
-SITE = pywikibot.Site("en", "wiktionary")
-NO_ACC_TRACKING_PAGE = "tracking/ja-pron/no accent"
-BLACKLIST = "blacklist.txt"
+NO_ACC_TRACKING_PAGE = "ja-pron/no accent"
+BLACKLIST = "blacklist.txt"  # Before the journal; imported into it on the first run
+JOURNAL_TASK = "ja-accent-add"
+CANDIDATES_FILE = "ja-accent-candidates.tsv"
 
 class JapaneseSectionNotFound(ValueError):
     """The entry had no Japanese section."""
 
-def get_japanese_section(parsed_text: mwparserfromhell.wikicode.Wikicode):
-    try:
-        return parsed_text.get_sections([2], "Japanese")[0]
-    except:
-        raise JapaneseSectionNotFound()
-
 def get_kana_from_pron(ja_pron: mwparserfromhell.wikicode.Template, page_title: str) -> str:
     # If entry is all kana, no kana will be provided in the {{ja-pron}}, so infer from title
     if ja_pron.has("1"):
@@ -31,10 +27,13 @@ def get_kana_from_pron(ja_pron: mwparserfromhell.wikicode.Template, page_title:
 def there_are_duplicate_readings(ja_prons: list[mwparserfromhell.wikicode.Template], title: str) -> bool:
     return are_duplicate_kanas([get_kana_from_pron(pron, page_title=title) for pron in ja_prons])
 
-def update_page(title: str):
-    page = pywikibot.Page(SITE, title)
-    parsed = mwparserfromhell.parse(page.text)
-    japanese_section = get_japanese_section(parsed)
+def update_page(page: pywikibot.Page) -> bool:
+    """Add pitch accents to the page, once they have been accepted. Returns whether the page was saved."""
+    title = page.title()
+    japanese_section_search = kovachevbot.parse_l2_section(page.text, "Japanese")
+    if japanese_section_search is None:
+        raise JapaneseSectionNotFound()
+    japanese_section, section_span = japanese_section_search
     ja_prons = [template for template in japanese_section.filter(forcetype=mwparserfromhell.wikicode.Template) if template.name == "ja-pron"]
 
     if len(ja_prons) == 0:
@@ -68,15 +67,13 @@ def update_page(title: str):
         japanese_section.append("\n\n===References===\n<references />\n\n")
 
     previous_text = page.text
-    page.text = str(parsed)
-    while "\n\n\n" in page.text:
-        page.text = page.text.replace("\n\n\n", "\n\n")
+    page.text = kovachevbot.collapse_blank_lines(kovachevbot.splice_section(previous_text, section_span, str(japanese_section)))
 
     if page.text == previous_text:
         print("Content was identical, exiting...")
-        return
+        return False
 
-    print(str(mwparserfromhell.parse(page.text).get_sections([2], "Japanese")[0]), "Is this text acceptable? (y/n)", sep="\n")
+    print(kovachevbot.get_l2_section(page.text, "Japanese"), "Is this text acceptable? (y/n)", sep="\n")
 
     valid = False
     while not valid:
@@ -85,45 +82,78 @@ def update_page(title: str):
             valid = True
 
     if answer == "y":
-        page.save("Added pitch accents from Daijirin to Japanese", minor=False)
+        kovachevbot.save_page(page, "Added pitch accents from Daijirin to Japanese", minor=False)
+        return True
+    return False
 
 def get_accentless_pages() -> Generator[pywikibot.Page, None, None]:
-    TEMPLATE_NAMESPACE = SITE.namespaces.TEMPLATE
-    MAIN_NAMESPACE = SITE.namespaces.MAIN
-    return pywikibot.Page(SITE, NO_ACC_TRACKING_PAGE, ns=TEMPLATE_NAMESPACE).getReferences(only_template_inclusion=True, namespaces=[MAIN_NAMESPACE])
+    return kovachevbot.iterate_tracking(NO_ACC_TRACKING_PAGE)
+
+def follow_accentless_pages(journal: kovachevbot.Journal, since: str = None) -> Generator[pywikibot.Page, None, None]:
+    """The pages which have a {{ja-pron}} without accents as they are edited, from the last time the task followed them (or `since`)."""
+    return kovachevbot.follow_tracking(NO_ACC_TRACKING_PAGE, journal, since=since and pywikibot.Timestamp.fromISOformat(since))
+
+def lacks_accent(title: str, text: str) -> bool:
+    """
+    Whether the page's Japanese section has a {{ja-pron}} without any accent given, i.e. whether
+    it would be in the "no accent" tracking category. Used to select pages from a dump instead of the tracking template.
+    """
+    if "ja-pron" not in text:
+        return False
 
-def iterate_pages(blacklist: set):
-    for page in get_accentless_pages():
+    japanese_section_search = kovachevbot.parse_l2_section(text, "Japanese", editable=False)
+    if japanese_section_search is None:
+        return False
+    japanese_section, _ = japanese_section_search
+
+    return any(template.name == "ja-pron" and not template.has("acc") for template in japanese_section.filter(forcetype=mwparserfromhell.wikicode.Template))
+
+def iterate_pages(pages: Generator[pywikibot.Page, None, None], journal: kovachevbot.Journal):
+    for page in pages:
         title = page.title()
-        if title in blacklist:
+        if journal.status(title) == kovachevbot.FAILED:
             print(f"Skipping page {title}")
             continue
 
         try:
             print(f"Updating pitch accents for page {title}")
-            update_page(title)
+            saved = update_page(page)
+            journal.record_visit(page, kovachevbot.DONE if saved else kovachevbot.SKIPPED)
         except Exception as e:
             print(f"Unable to update {title} due to error: {e}", file=sys.stderr)
             print(f"Adding {title} to blacklist")
-            blacklist.add(title)
+            journal.failed(title, str(e))
 
-def main():
-    try:
-        with open(BLACKLIST) as f:
-            blacklist = set(map(str.strip, f.readlines()))
-    except FileNotFoundError:
-        blacklist = set()
-    
-    # update_page("碧玉")
-    # update_page("パイプカット")
-    # update_page("火手")
-    # update_page("AA")
+def main(pages: Generator[pywikibot.Page, None, None], journal: kovachevbot.Journal, max_entries: int = None):
+    # Pages which failed before are blacklisted, and not tried again
+    journal.import_lines(BLACKLIST, kovachevbot.FAILED)
+
+    # update_page(kovachevbot.wikt_page("碧玉"))
+    # update_page(kovachevbot.wikt_page("パイプカット"))
+    # update_page(kovachevbot.wikt_page("火手"))
+    # update_page(kovachevbot.wikt_page("AA"))
 
     try:
-        iterate_pages(blacklist)
+        iterate_pages(kovachevbot.iterate_safe(pages, max_entries), journal)
     finally:
-        with open(BLACKLIST, mode="w") as f:
-            f.write("\n".join(blacklist))
+        journal.commit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # [mode] [mode's arguments] [number of pages, or --limit <number of pages>]
+    arguments, limit = kovachevbot.command_line_arguments()
+    mode = arguments[0] if arguments else "tracking"
+    journal = kovachevbot.get_journal(JOURNAL_TASK)
+
+    if mode == "tracking":
+        main(get_accentless_pages(), journal, limit)
+    elif mode == "scan":
+        # Select the pages from a dump rather than the tracking template: scan <dump path>
+        found = kovachevbot.scan_dump(arguments[1], lacks_accent, CANDIDATES_FILE)
+        print(f"Found {found} pages without accents, written to {CANDIDATES_FILE}")
+    elif mode == "candidates":
+        main(kovachevbot.pages_from_titles(kovachevbot.read_candidates(CANDIDATES_FILE)), journal, limit)
+    elif mode == "follow":
+        # Keep adding accents to pages as they are edited, until halted: follow [ISO timestamp to start from on the first run]
+        main(follow_accentless_pages(journal, arguments[1] if len(arguments) > 1 else None), journal, limit)
+    else:
+        print("Unrecognized mode", mode)
\ No newline at end of file
@@ -17,19 +17,23 @@ def wikicode_is_safe(param: mwparserfromhell.wikicode.Wikicode) -> bool:
     return all(type(node) in (mwparserfromhell.nodes.text.Text, mwparserfromhell.wikicode.Wikilink) for node in param.nodes)
 
 def fix_reading_str(reading_str: str) -> str:
-    all_readings = [each.strip() for each in reading_str.split(",")]
-    all_readings = [MULTIPLE_SPACE_PATTERN.sub(" ", ROMAJI_TRANSLITERATION_PATTERN.sub("", kovachevbot.links_to_plaintext(each))).strip() for each in all_readings]
+    all_readings = kovachevbot.links_to_plaintext_many(each.strip() for each in reading_str.split(","))
+    all_readings = [MULTIPLE_SPACE_PATTERN.sub(" ", ROMAJI_TRANSLITERATION_PATTERN.sub("", each)).strip() for each in all_readings]
     return ", ".join(all_readings)
     # return ROMAJI_TRANSLITERATION_PATTERN.sub("", kovachevbot.links_to_plaintext(reading_str))
 
 def fix_page(page: pywikibot.Page):
-    kanji = page.title()
-    parsed = mwparserfromhell.parse(page.text)
-    japanese_section_search = parsed.get_sections([2], "Japanese")
-    if len(japanese_section_search) == 0:
+    page.text = fix_readings(page.title(), page.text)
+
+def fix_readings(kanji: str, text: str) -> str:
+    """Clean up the {{ja-readings}} of the Japanese section of the page for `kanji`, giving the new text of the page."""
+    japanese_section_search = kovachevbot.parse_l2_section(text, "Japanese")
+    if japanese_section_search is None:
         print("Skipping page", kanji, "as it has no Japanese section", file=sys.stderr)
-    
-    japanese_section: mwparserfromhell.wikicode.Wikicode = japanese_section_search[0]
+        kovachevbot.record_event("skip", kanji, "no Japanese section")
+        return text
+
+    japanese_section, section_span = japanese_section_search
 
     ja_readingses: list[mwparserfromhell.wikicode.Template] = japanese_section.filter(forcetype=mwparserfromhell.wikicode.Template, matches="ja-readings")
 
@@ -76,26 +80,26 @@ def fix_page(page: pywikibot.Page):
         for param in params_to_remove:
             ja_reading_template.remove(param)
 
-    page.text = str(parsed)
+    return kovachevbot.splice_section(text, section_span, str(japanese_section))
 
 def main():
     with open("ja-readings-to-fix.txt") as f:
         kanji_to_fix = f.read()
 
-    pages = (kovachevbot.wikt_page(kanji) for kanji in kanji_to_fix)
+    # Kanji fixed in earlier runs are left out; a page that raises an error stops the run, and is tried again next time
+    journal = kovachevbot.get_journal("ja-readings")
+    pages = kovachevbot.pages_from_titles(kanji for kanji in kanji_to_fix if kanji not in journal)
     checked_pages_iter: Iterator[pywikibot.Page]  = kovachevbot.iterate_safe(pages)
     try:
-        for i, page in enumerate(checked_pages_iter):
-            fix_page(page)
-            page.save("Remove redundant ja-readings markup (manual transliterations; manual links; empty params)")
+        for page in checked_pages_iter:
+            with kovachevbot.timed("transform", page):
+                fix_page(page)
+            kovachevbot.save_page(page, "Remove redundant ja-readings markup (manual transliterations; manual links; empty params)")
+            journal.done(page.title())
     except:
-        i -= 1
-        if i < 0: i = 0
         traceback.print_exc()
     finally:
-        kanji_to_fix = kanji_to_fix[max(i+1, 0):]
-        with open("ja-readings-to-fix.txt", mode="w") as f:
-            kanji_to_fix = f.write(kanji_to_fix)
+        journal.commit()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,29 +1,52 @@
+import sys
 from typing import Generator
 import pywikibot
-import os
-import subprocess
 import mwparserfromhell
 import kovachevbot
 from mwparserfromhell.wikicode import Template
 from restore_pages import BACKUP_PATH
 
-JA_YOMI_TRACKING_PAGE = "tracking/ja-pron/yomi"
-SITE = pywikibot.Site("en", "wiktionary")
+JA_YOMI_TRACKING_PAGE = "ja-pron/yomi"
+CANDIDATES_FILE = "ja-yomi-candidates.tsv"
+DRY_RUN_BUNDLE = "ja-yomi-dry-run.zip"
+JOURNAL_TASK = "ja-yomi-remove"
+EDIT_SUMMARY = "Removed deprecated yomi/y parameters from {{ja-pron}} (automated task)"
 
 def get_yomi_pages() -> Generator[pywikibot.Page, None, None]:
-    TEMPLATE_NAMESPACE = SITE.namespaces.TEMPLATE
-    MAIN_NAMESPACE = SITE.namespaces.MAIN
-    return pywikibot.Page(SITE, JA_YOMI_TRACKING_PAGE, ns=TEMPLATE_NAMESPACE).getReferences(only_template_inclusion=True, namespaces=[MAIN_NAMESPACE])
+    return kovachevbot.iterate_tracking(JA_YOMI_TRACKING_PAGE)
+
+def follow_yomi_pages(journal: kovachevbot.Journal, since: str = None) -> Generator[pywikibot.Page, None, None]:
+    """The pages which get `|y=` or `|yomi=` as they are edited, from the last time the task followed them (or `since`)."""
+    return kovachevbot.follow_tracking(JA_YOMI_TRACKING_PAGE, journal, since=since and pywikibot.Timestamp.fromISOformat(since))
+
+def has_yomi(title: str, text: str) -> bool:
+    """
+    Whether the page has a {{ja-pron}} with `|y=` or `|yomi=`, i.e. whether it is one that
+    `remove_yomi_from_page` would change. Used to select pages from a dump instead of the tracking template.
+    """
+    if "y=" not in text and "yomi=" not in text:
+        return False
+
+    for template in mwparserfromhell.parse(text).ifilter(forcetype=Template, recursive=False):
+        template: Template
+        if template.name != "ja-pron" and str(template.name).casefold() != "ja-ipa":
+            continue
+        if template.has("y") or template.has("yomi"):
+            return True
+    return False
 
 # Use mwparserfromhell to filter all the templates, select the ja-pron ones, and remove any "y" or "yomi"
 # arguments they might have.
-def remove_yomi_from_page(page: pywikibot.Page) -> None:
+def remove_yomi_from_page(page: pywikibot.Page) -> str:
     """
     Given a page on en.wiktionary, it removes any occurrences of `|y=` or `|yomi=`
     from the source within {{ja-pron}} templates.
     """
-    text = page.text
-    parsed = mwparserfromhell.parse(text)
+    return remove_yomi(page.text)
+
+def remove_yomi(text: str) -> str:
+    """Remove `|y=` and `|yomi=` from the {{ja-pron}} templates in the wikitext, giving the new text."""
+    parsed = kovachevbot.parse(text, editable=True)
     for template in parsed.ifilter(forcetype=Template, recursive=False):
         template: Template
         if template.name != "ja-pron" and str(template.name).casefold() != "ja-ipa":
@@ -35,25 +58,15 @@ def remove_yomi_from_page(page: pywikibot.Page) -> None:
             template.remove("yomi")
 
     new_text = str(parsed)
+    kovachevbot.remember_parse(parsed, new_text)  # So that checking the new text does not parse it again
     return new_text
 
-def create_diff(old_text: str, current_page: pywikibot.Page) -> None:
-    """
-    Copy the contents of the page to local storage for backup in case there is a problem
-    with the script later; this will allow the error to be automatically corrected at that time.
-    """
-    os.makedirs(BACKUP_PATH, exist_ok=True)
-    with open("temp1", mode="w", encoding="utf-8") as f:
-        f.write(old_text)
-
-    with open("temp2", mode="w", encoding="utf-8") as f:
-        f.write(current_page.text)
-
-    diff = subprocess.getoutput("diff -u temp2 temp1") # Get differences between new revision and previous
-    diff = diff + "\n" # patch will complain if we don't end the file with a newline
-
-    with open(os.path.join(BACKUP_PATH, current_page.title()), mode="w", encoding="utf-8") as f:
-        f.write(diff)
+def remove_yomi_checked(text: str) -> tuple[str, str]:
+    """`remove_yomi` with its failsafe, as a transform for `dry_run`."""
+    new_text = remove_yomi(text)
+    if not template_argument_counts_accord(text, new_text):
+        raise ValueError("template argument counts do not accord")
+    return new_text, EDIT_SUMMARY
 
 def template_argument_counts_accord(previous_text: str, current_text: str) -> bool:
     """
@@ -64,7 +77,7 @@ def template_argument_counts_accord(previous_text: str, current_text: str) -> bo
     Of course, this is because the new text should not have `y=` or `yomi=` in it,
     so the number of arguments should be exactly one less once this has been removed.
     """
-    for previous_pron, current_pron in zip(mwparserfromhell.parse(previous_text).filter(forcetype=Template, recursive=False), mwparserfromhell.parse(current_text).filter(forcetype=Template, recursive=False)):
+    for previous_pron, current_pron in zip(kovachevbot.parse(previous_text).filter(forcetype=Template, recursive=False), kovachevbot.parse(current_text).filter(forcetype=Template, recursive=False)):
         previous_pron: Template
         current_pron: Template
         
@@ -80,23 +93,48 @@ def template_argument_counts_accord(previous_text: str, current_text: str) -> bo
     return True
 
 
-def main():
-    for page in kovachevbot.iterate_safe((get_yomi_pages())):
+def main(pages: Generator[pywikibot.Page, None, None], journal: kovachevbot.Journal, max_entries: int = None):
+    for page in kovachevbot.iterate_safe(pages, max_entries):
         original_text = page.text
 
         print(f"Removing yomi from {page.title()}...")
 
-        page.text = remove_yomi_from_page(page)
+        with kovachevbot.timed("transform", page):
+            page.text = remove_yomi_from_page(page)
 
         print(f"Backing up {page.title()}...")
         kovachevbot.backup_page(original_text, page, BACKUP_PATH)
 
         try:
             assert template_argument_counts_accord(original_text, page.text)
-            page.save("Removed deprecated yomi/y parameters from {{ja-pron}} (automated task)", minor=True, botflag=True)
+            kovachevbot.save_page(page, EDIT_SUMMARY, minor=True, botflag=True)
+            journal.record_visit(page, kovachevbot.DONE)
         except AssertionError:
             print("ERROR: page raised error, template argument-counting failsafe did not accord")
+            kovachevbot.record_event("error", page, "template argument counts do not accord")
+            journal.record_visit(page, kovachevbot.FAILED, reason="template argument counts do not accord")
             continue
 
 if __name__ == "__main__":
-    main()
+    # [mode] [mode's arguments] [number of pages, or --limit <number of pages>]
+    arguments, limit = kovachevbot.command_line_arguments()
+    mode = arguments[0] if arguments else "tracking"
+    journal = kovachevbot.get_journal(JOURNAL_TASK)
+
+    if mode == "tracking":
+        main(get_yomi_pages(), journal, limit)
+    elif mode == "scan":
+        # Select the pages from a dump rather than the tracking template: scan <dump path>
+        found = kovachevbot.scan_dump(arguments[1], has_yomi, CANDIDATES_FILE)
+        print(f"Found {found} pages with yomi, written to {CANDIDATES_FILE}")
+    elif mode == "candidates":
+        main(kovachevbot.pages_from_titles(kovachevbot.read_candidates(CANDIDATES_FILE)), journal, limit)
+    elif mode == "follow":
+        # Keep removing yomi from pages as they are edited, until halted: follow [ISO timestamp to start from on the first run]
+        main(follow_yomi_pages(journal, arguments[1] if len(arguments) > 1 else None), journal, limit)
+    elif mode == "dry-run":
+        # Preview the edits to the candidates without saving: dry-run [bundle path]
+        bundle = arguments[1] if len(arguments) > 1 else DRY_RUN_BUNDLE
+        kovachevbot.dry_run(kovachevbot.pages_from_titles(kovachevbot.read_candidates(CANDIDATES_FILE)), remove_yomi_checked, bundle)
+    else:
+        print("Unrecognized mode", mode)
@@ -1,23 +1,22 @@
 import os
-import subprocess
 import pywikibot
+import kovachevbot
 
 
 BACKUP_PATH = "ja-yomi-backup"
-SITE = pywikibot.Site("en", "wiktionary")
 
 
 def restore_page(page: pywikibot.Page):
-    diff_file = os.path.join(BACKUP_PATH, page.title())
     current_text = page.text
-    with open("temp", mode="w", encoding="utf-8") as f:
-        f.write(current_text)
-
-    subprocess.run(["patch", "temp", "-u", diff_file]) # Restores previous page text before my bot's edit
-    with open("temp", encoding="utf-8") as f:
-        restored_contents = f.read()
+    restored_contents = kovachevbot.get_backup_store(BACKUP_PATH).restore(page.title(), current_text)
+    if restored_contents is not None:
         return restored_contents
 
+    # Backups made before the backup archive was introduced are loose diff files named after the page
+    diff_file = os.path.join(BACKUP_PATH, page.title())
+    with open(diff_file, encoding="utf-8") as f:
+        return kovachevbot.apply_diff(current_text, f.read()) # Restores previous page text before my bot's edit
+
 
 def restore_pages(page_list: list[str]):
     """
@@ -26,10 +25,11 @@ def restore_pages(page_list: list[str]):
     """
     for page_name in page_list:
         print(f"Restoring page {page_name}...")
-        page = pywikibot.Page(SITE, page_name)
+        page = kovachevbot.wikt_page(page_name)
         try:
-            print(restore_page(page))
-            page.text = restore_page(page)
+            restored = restore_page(page)
+            print(restored)
+            page.text = restored
             page.save("Revert previous attempt to remove yomi parameters due to ill behaviour")
         except FileNotFoundError:
             print(f"No local patch was found for {page_name}; either the page was never edited, or no patch was correctly saved.")
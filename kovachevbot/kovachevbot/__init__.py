@@ -1,3 +1,17 @@
 # When `import kovachevbot` is run, extract all of its data under the simple namespace `kovachevbot`
 # (as opposed to resolving `kovachevbot.common` for all module data)
-from kovachevbot.common import * 
\ No newline at end of file
+from kovachevbot.common import *
+from kovachevbot.common import __getattr__  # Lazily created sites, e.g. `kovachevbot.WIKTIONARY`
+from kovachevbot.backup import *
+from kovachevbot.dump import *
+from kovachevbot.scan import *
+from kovachevbot.parsing import *
+from kovachevbot.sections import *
+from kovachevbot.pipeline import *
+from kovachevbot.metrics import *
+from kovachevbot.journal import *
+from kovachevbot.dryrun import *
+from kovachevbot.tasks import *
+from kovachevbot.follow import *
+from kovachevbot.anagrams import *
+from kovachevbot.lettercounts import *
@@ -0,0 +1,521 @@
+"""
+Anagrams of a wordlist, shared by the anagram tasks of every language. Each language registers a normaliser
+(`@register_normaliser("bg")`), which decides what counts as the same letters; a word's alphagram is its normalised
+letters, sorted. `load_anagram_index(wordlist, "bg")` builds an index of the wordlist's alphagrams into a file next
+to it the first time, and again only once the wordlist (or the normaliser's version) changes. The file is mapped
+into memory rather than read, so loading it is near instant, and the words are only decoded when they are looked up:
+
+    anagrams = kovachevbot.load_anagram_index("words.txt", "bg")
+    anagrams["аво"]  # {"ова", "вао"}: every alphagram with more than one word, as with a dict of sets
+
+Each word's normal form is kept in the index too, so the words of an alphagram can be split into classes of variants
+of the same word (e.g. "resume" and "résumé") without normalising any of them again, and excluding a word's own
+variants from its anagrams is a set operation (`anagrams.anagrams_of("resume")`).
+
+An index can also be built from several wordlists, and from kaikki.org's JSONL dumps (the headwords of the language's entries),
+which are read as a stream and deduplicated, with the words normalised in chunks by a pool of processes (see `ingest`).
+It can be built beforehand with `python -m kovachevbot.anagrams <language> <wordlist or dump> [...]`.
+"""
+import os
+import sys
+import mmap
+import array
+import struct
+import bisect
+import operator
+import shutil
+import gzip
+import json
+import hashlib
+import unicodedata
+import regex as re
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+__all__ = ["Normaliser", "NORMALISERS", "register_normaliser", "normalise_word", "get_alphagram",
+           "read_words", "ingest", "AnagramIndex", "build_anagram_index", "load_anagram_index",
+           "changed_alphagrams", "load_anagram_snapshot", "save_anagram_snapshot"]
+
+
+@dataclass
+class Normaliser:
+    """How a language's words are reduced to the letters which count for anagrams; see `register_normaliser`."""
+    language: str
+    normalise: Callable[[str], str]
+    version: str = "1"  # Change whenever the normaliser's output changes, so that indices built with it are rebuilt
+    # Optionally, the same for many (stripped) words at once, one per line, in a few passes over the whole text
+    normalise_lines: Callable[[str], str] | None = None
+
+NORMALISERS: dict[str, Normaliser] = {}
+
+def register_normaliser(language: str, version: str = "1", lines: Callable[[str], str] = None):
+    """
+    Register the decorated function `word -> normalised word` as the normaliser of a language (by its code).
+    If its work is done a character at a time (case folding, decomposition, translation tables), `lines` can do
+    the same to many words joined by newlines, keeping the newlines, which is much quicker when building an index.
+    """
+    def register(normalise: Callable[[str], str]):
+        NORMALISERS[language] = Normaliser(language, normalise, version, lines)
+        return normalise
+    return register
+
+def normalise_words(words: list[str], language: str) -> list[str]:
+    """The normal forms of many words, at once if the language's normaliser can (and none of the words has a newline)."""
+    normaliser = NORMALISERS[language]
+    if normaliser.normalise_lines and words:
+        text = "\n".join(words)
+        if text.count("\n") == len(words) - 1:
+            return normaliser.normalise_lines(text).split("\n")
+    return list(map(normaliser.normalise, words))
+
+def normalise_word(word: str, language: str) -> str:
+    return NORMALISERS[language].normalise(word)
+
+def get_alphagram(word: str, language: str) -> str:
+    return "".join(sorted(normalise_word(word, language)))
+
+
+def character_range(first: int, last: int) -> str:
+    return "".join(chr(code) for code in range(first, last + 1))
+
+ENGLISH_DIACRITICS = character_range(0x0300, 0x036F)
+ENGLISH_PUNCTUATION = "’'()[]{}<>:,‒–—―…!.«»-‐?‘’“”;/⁄␠·&@*\\•^¤¢$€£¥₩₪†‡°¡¿¬#№%‰‱¶′§~¨_|¦⁂☞∴‽※" + character_range(0x2000, 0x206F)
+ENGLISH_CONVERSIONS = {
+    "æ": "ae",
+    "œ": "oe",
+    "ı": "i",
+}
+ENGLISH_CONVERSION_TABLE = str.maketrans(ENGLISH_CONVERSIONS)
+ENGLISH_REDUNDANT_CHARS = str.maketrans("", "", ENGLISH_DIACRITICS + ENGLISH_PUNCTUATION + " ")
+# A translation table is quicker on a word, but on a long text a character class is, as the table looks up every character in a dict
+ENGLISH_REDUNDANT_PATTERN = re.compile(f"[{re.escape(ENGLISH_DIACRITICS + ENGLISH_PUNCTUATION + ' ')}]+")
+
+def normalise_english_lines(text: str) -> str:
+    text = text.casefold()
+    for ligature, letters in ENGLISH_CONVERSIONS.items():
+        text = text.replace(ligature, letters)
+    return ENGLISH_REDUNDANT_PATTERN.sub("", unicodedata.normalize("NFKD", text).casefold())
+
+@register_normaliser("en", lines=normalise_english_lines)
+def normalise_english(word: str) -> str:
+    """Normalises the word.
+    Using the following method:
+        - Remove all whitespace at the start and end.
+        - Decompose all characters to their simplest, e.g. é becomes e + ACUTE
+        - Convert to lowercase (casefold)
+        - Remove all irrelevant elements (punctuation, diacritics).
+    """
+    word = word.casefold().translate(ENGLISH_CONVERSION_TABLE)
+    return unicodedata.normalize("NFKD", word.strip()).casefold().translate(ENGLISH_REDUNDANT_CHARS)
+
+BULGARIAN_ALPHABET = "абвгдежзийклмнопрстуфхцчшщъьюя"
+BULGARIAN_NUMERIC = "0123456789"
+BULGARIAN_NON_ALPHANUMERIC = re.compile(f"[^{BULGARIAN_ALPHABET}{BULGARIAN_NUMERIC}]")
+BULGARIAN_NON_ALPHANUMERIC_LINES = re.compile(f"[^{BULGARIAN_ALPHABET}{BULGARIAN_NUMERIC}\n]+")
+
+def normalise_bulgarian_lines(text: str) -> str:
+    return BULGARIAN_NON_ALPHANUMERIC_LINES.sub("", text.casefold().replace("ѝ", "и"))
+
+@register_normaliser("bg", lines=normalise_bulgarian_lines)
+def normalise_bulgarian(word: str) -> str:
+    return BULGARIAN_NON_ALPHANUMERIC.sub("", word.casefold().replace("ѝ", "и"))
+
+
+INDEX_MAGIC = b"KBANAGR2"  # Changed whenever the layout does, so that older indices are rebuilt
+INDEX_HEADER = struct.Struct("=8s40sIIIIIII")  # Magic, key, words, alphagrams, alphagrams with more than one word, normal forms, and bytes of words, alphagrams and normal forms
+INDEX_SUFFIX = ".anagrams"
+SNAPSHOT_SUFFIX = ".previous"  # The copy of an index which the last delta run worked from, next to it
+
+# A wordlist, or a wordlist with a function to clean each of its lines into a word (which must be a module-level
+# function, to be sent to the worker processes); files ending in .jsonl or .jsonl.gz are read as kaikki.org dumps instead
+Source = str | tuple[str, Callable[[str], str]]
+
+INGEST_CHUNK_CHARACTERS = 1 << 22  # Roughly how much of a source each worker process is sent at a time
+INGEST_INLINE_BYTES = 1 << 22  # Sources smaller than this in total are ingested without a pool of processes
+
+def source_path(source: Source) -> str:
+    return source if isinstance(source, str) else source[0]
+
+def source_cleaner(source: Source) -> Callable[[str], str] | None:
+    return None if isinstance(source, str) else source[1]
+
+def is_kaikki(path: str) -> bool:
+    return path.endswith((".jsonl", ".jsonl.gz"))
+
+def open_source(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+def wordlist_key(sources: Source | list[Source], language: str) -> str:
+    """The hash of the sources and the normaliser they are indexed with; an index is rebuilt whenever it changes."""
+    sources = [sources] if isinstance(sources, (str, tuple)) else sources
+    digest = hashlib.sha1(f"{language}\0{NORMALISERS[language].version}\0".encode("utf-8"))
+    for source in sources:
+        cleaner = source_cleaner(source)
+        digest.update(f"{cleaner.__module__}.{cleaner.__qualname__}\0".encode("utf-8") if cleaner else b"\0")
+        with open(source_path(source), "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def words_in_lines(lines: list[str], kaikki: bool, language: str, cleaner: Callable[[str], str] = None) -> list[str]:
+    """The words in some lines of a wordlist (one per line) or of a kaikki.org dump (the language's entries' headwords)."""
+    if not kaikki:
+        return [word for word in map(str.strip, map(cleaner, lines) if cleaner else lines) if word]
+    words = []
+    for line in lines:
+        if f'"{language}"' not in line:
+            continue  # Quicker than decoding an entry which cannot be in the language
+        entry = json.loads(line)
+        if entry.get("lang_code") == language and (word := entry.get("word", "").strip()):
+            words.append(word)
+    return words
+
+def source_chunks(sources: list[Source]) -> Iterator[tuple[list[str], bool, Callable[[str], str] | None]]:
+    """The lines of the sources, read as a stream, in chunks of about `INGEST_CHUNK_CHARACTERS`."""
+    for source in sources:
+        path = source_path(source)
+        with open_source(path) as f:
+            while chunk := f.readlines(INGEST_CHUNK_CHARACTERS):
+                yield chunk, is_kaikki(path), source_cleaner(source)
+
+def read_words(sources: Source | list[Source], language: str) -> Iterator[str]:
+    """The words of the sources, each once (across all of them) and in order, read as a stream."""
+    sources = [sources] if isinstance(sources, (str, tuple)) else sources
+    seen = set()
+    for lines, kaikki, cleaner in source_chunks(sources):
+        for word in words_in_lines(lines, kaikki, language, cleaner):
+            if word not in seen:
+                seen.add(word)
+                yield word
+
+def normalise_chunk(lines: list[str], kaikki: bool, language: str,
+                    cleaner: Callable[[str], str] = None) -> tuple[list[str], list[str], list[str]]:
+    """The words in a chunk of a source (each once), their normal forms and their alphagrams; run in the worker processes."""
+    words = list(dict.fromkeys(words_in_lines(lines, kaikki, language, cleaner)))
+    normals = normalise_words(words, language)
+    return words, normals, ["".join(sorted(normal)) for normal in normals]
+
+def ingest(sources: Source | list[Source], language: str, processes: int = None) -> tuple[list[str], list[str], list[str]]:
+    """
+    Read the words of the sources as a stream, each once across all of them and in order, with their normal forms
+    and alphagrams, which are worked out in chunks by a pool of `processes` processes (one per core by default;
+    none for sources of less than `INGEST_INLINE_BYTES`, for which starting the pool would take longer).
+    The normaliser must be registered when the module is imported (or before the pool's processes are forked).
+    """
+    sources = [sources] if isinstance(sources, (str, tuple)) else sources
+    processes = processes or os.cpu_count()
+    if sum(os.path.getsize(source_path(source)) for source in sources) < INGEST_INLINE_BYTES:
+        processes = 1
+
+    # Each word, in order of its first appearance, to where its normal form is in `normals` (that of its last
+    # appearance, which is the same), so that the chunks are merged without a loop over their words in Python
+    words: dict[str, int] = {}
+    normals, alphagrams = [], []
+    def take(chunk_words: list[str], chunk_normals: list[str], chunk_alphagrams: list[str]):
+        words.update(zip(chunk_words, range(len(normals), len(normals) + len(chunk_words))))
+        normals.extend(chunk_normals)
+        alphagrams.extend(chunk_alphagrams)
+
+    if processes == 1:
+        for lines, kaikki, cleaner in source_chunks(sources):
+            take(*normalise_chunk(lines, kaikki, language, cleaner))
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            pending = deque()
+            for lines, kaikki, cleaner in source_chunks(sources):
+                # Keep a couple of chunks per worker in flight, so that no more of the sources is read than can be worked on
+                if len(pending) >= 2 * processes:
+                    take(*pending.popleft().result())
+                pending.append(executor.submit(normalise_chunk, lines, kaikki, language, cleaner))
+            while pending:
+                take(*pending.popleft().result())
+
+    if len(words) < len(normals):  # Some words were in more than one chunk
+        normals = [normals[i] for i in words.values()]
+        alphagrams = [alphagrams[i] for i in words.values()]
+    return list(words), normals, alphagrams
+
+def default_index_path(sources: Source | list[Source], language: str) -> str:
+    """Next to the (first) source: `<wordlist>.<language>.anagrams`."""
+    first = sources if isinstance(sources, (str, tuple)) else sources[0]
+    return f"{source_path(first)}.{language}{INDEX_SUFFIX}"
+
+def _pack_strings(strings: list[str]) -> tuple[array.array, bytes]:
+    """The strings as one block of UTF-8, and the offset of each in it (and of its end)."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = array.array("I", [0])
+    for each in encoded:
+        offsets.append(offsets[-1] + len(each))
+    return offsets, b"".join(encoded)
+
+def build_anagram_index(wordlist: Source | list[Source], language: str, path: str = None, processes: int = None) -> str:
+    """
+    Index the anagrams of a wordlist (or of several sources, see `ingest`) in a file
+    (by default `<wordlist>.<language>.anagrams`), returning its path.
+    The file has the words, the alphagrams (sorted, for looking them up by bisection), for each alphagram the IDs
+    of its words, and the normal forms with the ID of each word's, all as arrays of 32-bit integers and blocks of UTF-8.
+    Words without anagrams are kept too.
+    """
+    path = path or default_index_path(wordlist, language)
+    key = wordlist_key(wordlist, language)
+    words, word_normals, word_alphagrams = ingest(wordlist, language, processes)
+
+    groups: dict[str, list[int]] = {}
+    normal_ids: dict[str, int] = {}  # Each normal form, in order, to its ID
+    word_normal_ids = array.array("I")
+    for word_id, (normal, alphagram) in enumerate(zip(word_normals, word_alphagrams)):
+        word_normal_ids.append(normal_ids.setdefault(normal, len(normal_ids)))
+        groups.setdefault(alphagram, []).append(word_id)
+    del word_normals, word_alphagrams
+    alphagrams = sorted(groups)
+
+    word_offsets, word_bytes = _pack_strings(words)
+    alphagram_offsets, alphagram_bytes = _pack_strings(alphagrams)
+    normal_offsets, normal_bytes = _pack_strings(list(normal_ids))
+    group_starts, members = array.array("I", [0]), array.array("I")
+    for alphagram in alphagrams:
+        members.extend(groups[alphagram])
+        group_starts.append(len(members))
+    multiple = sum(len(group) > 1 for group in groups.values())
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, key.encode("ascii"), len(words), len(alphagrams), multiple, len(normal_ids),
+                                  len(word_bytes), len(alphagram_bytes), len(normal_bytes)))
+        for integers in (word_offsets, alphagram_offsets, group_starts, members, normal_offsets, word_normal_ids):
+            integers.tofile(f)
+        for data in (word_bytes, alphagram_bytes, normal_bytes):
+            f.write(data)
+    os.replace(temporary_path, path)  # So that a half-written index is never loaded
+    return path
+
+
+class _Strings:
+    """A read-only sequence of the strings in a block of UTF-8, as bytes, for bisection."""
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+class AnagramIndex(Mapping):
+    """
+    An index built by `build_anagram_index`, mapped into memory. As a mapping, it has every alphagram with more than
+    one word, giving the set of its words (decoded on each lookup); `group` also gives the words without anagrams.
+    `classes` splits an alphagram's words by their normal forms, which were computed when the index was built.
+    """
+    def __init__(self, path: str, language: str):
+        self.path = path
+        self.language = language
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < INDEX_HEADER.size or self._map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not an anagram index of this version")
+        (_, key, word_count, alphagram_count, self._multiple, normal_count,
+         word_bytes, alphagram_bytes, normal_bytes) = INDEX_HEADER.unpack_from(self._map)
+        self.key = key.decode("ascii")
+
+        view = memoryview(self._map)
+        position = INDEX_HEADER.size
+        arrays = []
+        for length in (word_count + 1, alphagram_count + 1, alphagram_count + 1, word_count, normal_count + 1, word_count):
+            arrays.append(view[position:position + 4 * length].cast("I"))
+            position += 4 * length
+        word_offsets, alphagram_offsets, self._group_starts, self._members, normal_offsets, self._normal_ids = arrays
+        blocks = []
+        for length in (word_bytes, alphagram_bytes, normal_bytes):
+            blocks.append(view[position:position + length])
+            position += length
+        self._words = _Strings(word_offsets, blocks[0])
+        self._alphagrams = _Strings(alphagram_offsets, blocks[1])
+        self._normals = _Strings(normal_offsets, blocks[2])
+        self._views = [view, *arrays, *blocks]
+
+    def __repr__(self) -> str:
+        return f"AnagramIndex({self.path!r}, {self.language!r})"
+
+    def _find(self, alphagram: str) -> int | None:
+        """The position of the alphagram among all of them, or `None` if no word has it."""
+        encoded = alphagram.encode("utf-8")
+        i = bisect.bisect_left(self._alphagrams, encoded)
+        return i if i < len(self._alphagrams) and self._alphagrams[i] == encoded else None
+
+    def _group_size(self, i: int) -> int:
+        return self._group_starts[i + 1] - self._group_starts[i]
+
+    def _group_signature(self, i: int) -> list[tuple[bytes, bytes]]:
+        """The group's words with their normal forms, encoded and sorted, to compare with another index's."""
+        return sorted((self._words[word_id], self._normals[self._normal_ids[word_id]])
+                      for word_id in self._members[self._group_starts[i]:self._group_starts[i + 1]])
+
+    def _group_words(self, i: int) -> set[str]:
+        return {self.word(word_id) for word_id in self._members[self._group_starts[i]:self._group_starts[i + 1]]}
+
+    def word(self, word_id: int) -> str:
+        return self._words[word_id].decode("utf-8")
+
+    def alphagrams(self) -> list[str]:
+        """Every alphagram, with or without anagrams, in the order of their positions (see `words_at`)."""
+        return [alphagram.decode("utf-8") for alphagram in self._alphagrams]
+
+    def words_at(self, position: int) -> set[str]:
+        """The words with the alphagram at the given position in `alphagrams()`."""
+        return self._group_words(position)
+
+    def classes(self, alphagram: str) -> dict[str, set[str]]:
+        """The words with the alphagram, by their normal forms: each set is the variants of one word."""
+        i = self._find(alphagram)
+        if i is None:
+            return {}
+        normals: dict[int, str] = {}
+        classes: dict[str, set[str]] = {}
+        for word_id in self._members[self._group_starts[i]:self._group_starts[i + 1]]:
+            normal_id = self._normal_ids[word_id]
+            if normal_id not in normals:
+                normals[normal_id] = self._normals[normal_id].decode("utf-8")
+            classes.setdefault(normals[normal_id], set()).add(self.word(word_id))
+        return classes
+
+    def normal_forms(self, alphagram: str) -> dict[str, str]:
+        """The normal form of each word with the alphagram."""
+        return {word: normal for normal, words in self.classes(alphagram).items() for word in words}
+
+    def anagrams_of(self, word: str, alphagram: str = None) -> set[str]:
+        """The anagrams of a word (in the wordlist or not), leaving out the word and its variants (words with the same normal form)."""
+        normal = normalise_word(word, self.language)
+        classes = self.classes(alphagram or "".join(sorted(normal)))
+        classes.pop(normal, None)
+        return set().union(*classes.values()) - {word}
+
+    def group(self, alphagram: str) -> set[str]:
+        """The words with the alphagram, however many there are (none, if there are none)."""
+        i = self._find(alphagram)
+        return self._group_words(i) if i is not None else set()
+
+    def __getitem__(self, alphagram: str) -> set[str]:
+        i = self._find(alphagram)
+        if i is None or self._group_size(i) < 2:
+            raise KeyError(alphagram)
+        return self._group_words(i)
+
+    def __contains__(self, alphagram: object) -> bool:
+        if not isinstance(alphagram, str):
+            return False
+        i = self._find(alphagram)
+        return i is not None and self._group_size(i) > 1
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self._alphagrams)):
+            if self._group_size(i) > 1:
+                yield self._alphagrams[i].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._multiple
+
+    def anagram_count(self) -> int:
+        """The number of words with anagrams (in groups of more than one word), from the groups' sizes, without decoding any."""
+        starts = self._group_starts
+        return sum(size for size in map(operator.sub, starts[1:], starts[:-1]) if size > 1)
+
+    def items(self) -> Iterator[tuple[str, set[str]]]:
+        for i in range(len(self._alphagrams)):
+            if self._group_size(i) > 1:
+                yield self._alphagrams[i].decode("utf-8"), self._group_words(i)
+
+    def values(self) -> Iterator[set[str]]:
+        return (words for _, words in self.items())
+
+    def words(self) -> Iterator[str]:
+        """Every word of the wordlist, with or without anagrams."""
+        return (self.word(word_id) for word_id in range(len(self._words)))
+
+    def alphagram(self, word: str) -> str:
+        return get_alphagram(word, self.language)
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._map.close()
+
+def load_anagram_index(wordlist: Source | list[Source], language: str, path: str = None) -> AnagramIndex:
+    """
+    The anagram index of a wordlist (or of several sources, see `ingest`), in the given language, built first
+    if there is none yet, or if the one there is was built from another version of them or of the language's normaliser.
+    """
+    path = path or default_index_path(wordlist, language)
+    key = wordlist_key(wordlist, language)
+    if os.path.exists(path):
+        try:
+            index = AnagramIndex(path, language)
+        except ValueError:
+            pass  # Built by an older version of the bot
+        else:
+            if index.key == key:
+                return index
+            index.close()
+    print(f"Building the anagram index of {wordlist} in {path}...", file=sys.stderr)
+    return AnagramIndex(build_anagram_index(wordlist, language, path), language)
+
+def changed_alphagrams(previous: AnagramIndex | None, current: AnagramIndex) -> Iterator[str]:
+    """
+    The alphagrams, in order, whose words (or the words' normal forms) differ between two indices of a language,
+    among those with anagrams in either; all of the current index's alphagrams with anagrams if there is no previous one.
+    Both lists of alphagrams are sorted, so they are compared in one pass, and only groups of the same size are decoded.
+    """
+    if previous is None:
+        yield from current
+        return
+    if previous.key == current.key:
+        return  # Built from the same words with the same normaliser
+    old, new = previous._alphagrams, current._alphagrams
+    i = j = 0
+    while i < len(old) or j < len(new):
+        if j == len(new) or (i < len(old) and old[i] < new[j]):  # Only in the previous index
+            if previous._group_size(i) > 1:
+                yield old[i].decode("utf-8")
+            i += 1
+        elif i == len(old) or new[j] < old[i]:  # Only in the current index
+            if current._group_size(j) > 1:
+                yield new[j].decode("utf-8")
+            j += 1
+        else:
+            size = current._group_size(j)
+            if (size > 1 or previous._group_size(i) > 1) and (size != previous._group_size(i)
+                                                              or current._group_signature(j) != previous._group_signature(i)):
+                yield new[j].decode("utf-8")
+            i += 1
+            j += 1
+
+def snapshot_path(index: AnagramIndex) -> str:
+    return f"{index.path}{SNAPSHOT_SUFFIX}"
+
+def load_anagram_snapshot(index: AnagramIndex) -> AnagramIndex | None:
+    """The index as it was when `save_anagram_snapshot` was last called on it, or `None` if it never was."""
+    try:
+        return AnagramIndex(snapshot_path(index), index.language)
+    except (FileNotFoundError, ValueError):  # Never taken, or by an older version of the bot
+        return None
+
+def save_anagram_snapshot(index: AnagramIndex) -> None:
+    """
+    Keep a copy of the index, for the next delta run to compare with (see `changed_alphagrams`); a task takes it
+    only once it has visited every changed group, so that a run which is stopped is carried on by the next one.
+    Any loaded snapshot of the index should be closed first.
+    """
+    path = snapshot_path(index)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    shutil.copyfile(index.path, temporary_path)
+    os.replace(temporary_path, path)
+
+
+if __name__ == "__main__":
+    # <language> <wordlist or kaikki.org dump> [...]
+    print(build_anagram_index(sys.argv[2:], sys.argv[1]))
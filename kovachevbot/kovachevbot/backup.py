@@ -0,0 +1,179 @@
+"""
+Local backups of the bot's edits, so that they can be reverted automatically if a script misbehaves.
+Every backup is a unified diff from the bot's new text back to the original text, compressed and
+stored in a per-run SQLite archive which is indexed by title and by the revision the edit was made on top of.
+"""
+import os
+import sqlite3
+import time
+import zlib
+import difflib
+import regex as re
+from dataclasses import dataclass
+from typing import Generator
+
+__all__ = ["BackupRecord", "BackupStore", "make_reverse_diff", "apply_diff"]
+
+HUNK_HEADER_PATTERN = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_NEWLINE_MARKER = "\\ No newline at end of file\n"
+ARCHIVE_EXTENSION = ".db"
+
+
+@dataclass
+class BackupRecord:
+    title: str
+    revid: int | None
+    timestamp: float
+    diff: str
+
+
+def diff_lines(text: str) -> list[str]:
+    """Split text into lines for diffing. Only "\\n" counts as a line break (unlike `str.splitlines`),
+    and a missing newline at the end of the text is marked the same way `diff -u` marks it.
+    """
+    lines = [line + "\n" for line in text.split("\n")]
+    if lines[-1] == "\n":
+        lines.pop()
+    else:
+        lines[-1] = lines[-1] + NO_NEWLINE_MARKER
+    return lines
+
+def make_reverse_diff(old_text: str, new_text: str, title: str) -> str:
+    """Make a unified diff which turns `new_text` back into `old_text`, like `diff -u new old` would."""
+    return "".join(difflib.unified_diff(diff_lines(new_text), diff_lines(old_text), fromfile=title, tofile=title))
+
+def apply_diff(text: str, diff: str) -> str:
+    """Apply a unified diff (as made by `make_reverse_diff` or `diff -u`) to `text`, like `patch` would.
+    Raises `ValueError` if the diff does not apply cleanly, e.g. because the page was edited again since.
+    """
+    source = diff_lines(text)
+    patch = []
+    for line in diff_lines(diff):
+        if line == NO_NEWLINE_MARKER and patch:
+            patch[-1] += line
+        else:
+            patch.append(line)
+
+    result = []
+    position = 0
+    i = 0
+    while i < len(patch):
+        match = HUNK_HEADER_PATTERN.match(patch[i])
+        i += 1
+        if not match:
+            continue  # File headers and anything else outside the hunks
+
+        old_remaining = int(match[2] or 1)
+        new_remaining = int(match[4] or 1)
+        start = int(match[1]) - (1 if old_remaining else 0)
+        if start < position:
+            raise ValueError(f"Overlapping or out-of-order hunk: {patch[i-1].strip()}")
+        result.extend(source[position:start])
+        position = start
+
+        try:
+            while old_remaining or new_remaining:
+                tag, content = patch[i][0], patch[i][1:]
+                i += 1
+                if tag in " -":
+                    if source[position] != content:
+                        raise ValueError(f"Diff does not apply at line {position+1}: expected {content!r}, found {source[position]!r}")
+                    position += 1
+                    old_remaining -= 1
+                if tag in " +":
+                    result.append(content)
+                    new_remaining -= 1
+        except IndexError:
+            raise ValueError("Diff does not apply: hunk runs past the end of the text or the diff")
+
+    result.extend(source[position:])
+    restored = "".join(result)
+    if restored.endswith("\n" + NO_NEWLINE_MARKER):
+        restored = restored[:-len("\n" + NO_NEWLINE_MARKER)]
+    return restored
+
+
+class BackupStore:
+    """An archive of reverse diffs for one run of a bot task, stored in `backup_path`.
+    Several tasks (or several runs of the same task) can back up concurrently, since each run writes to its own archive.
+    """
+    def __init__(self, backup_path: str, run_name: str = None):
+        self.backup_path = backup_path
+        self.run_name = run_name or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        os.makedirs(backup_path, exist_ok=True)
+        self.archive_path = os.path.join(backup_path, self.run_name + ARCHIVE_EXTENSION)
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # The archive is only created once something is backed up, so that lookups alone leave no empty archives behind
+        if self._connection is None:
+            self._connection = self._open(self.archive_path)
+        return self._connection
+
+    @staticmethod
+    def _open(archive_path: str) -> sqlite3.Connection:
+        connection = sqlite3.connect(archive_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS backups (title TEXT NOT NULL, revid INTEGER, timestamp REAL NOT NULL, diff BLOB NOT NULL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS backups_title ON backups (title)")
+        connection.execute("CREATE INDEX IF NOT EXISTS backups_revid ON backups (revid)")
+        return connection
+
+    def backup(self, old_text: str, new_text: str, title: str, revid: int = None) -> bool:
+        """Store the diff needed to restore `old_text` from `new_text`. `revid` is the ID of the revision
+        that `old_text` comes from. Nothing is stored if the text did not change.
+        Returns whether a backup was made.
+        """
+        if old_text == new_text:
+            return False
+
+        diff = zlib.compress(make_reverse_diff(old_text, new_text, title).encode("utf-8"))
+        with self.connection:
+            self.connection.execute("INSERT INTO backups VALUES (?, ?, ?, ?)", (title, revid, time.time(), diff))
+        return True
+
+    def archives(self) -> list[str]:
+        """All archive files in this store's directory, most recent run first."""
+        names = [name for name in os.listdir(self.backup_path) if name.endswith(ARCHIVE_EXTENSION)]
+        return [os.path.join(self.backup_path, name) for name in sorted(names, reverse=True)]
+
+    def find(self, title: str = None, revid: int = None) -> Generator[BackupRecord, None, None]:
+        """Find backups by page title and/or by the revision the edit replaced, across every run
+        in this store's directory, most recent first.
+        """
+        conditions, parameters = [], []
+        if title is not None:
+            conditions.append("title = ?")
+            parameters.append(title)
+        if revid is not None:
+            conditions.append("revid = ?")
+            parameters.append(revid)
+        query = "SELECT title, revid, timestamp, diff FROM backups"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp DESC"
+
+        for archive_path in self.archives():
+            own_archive = archive_path == self.archive_path
+            connection = self.connection if own_archive else self._open(archive_path)
+            try:
+                for record_title, record_revid, timestamp, diff in connection.execute(query, parameters).fetchall():
+                    yield BackupRecord(record_title, record_revid, timestamp, zlib.decompress(diff).decode("utf-8"))
+            finally:
+                if not own_archive:
+                    connection.close()
+
+    def restore(self, title: str, current_text: str) -> str | None:
+        """Get the text of `title` from before the bot's most recent backed-up edit to it,
+        given the page's current text, or `None` if there is no backup of that page.
+        """
+        for record in self.find(title=title):
+            return apply_diff(current_text, record.diff)
+        return None
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
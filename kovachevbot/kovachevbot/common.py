@@ -1,26 +1,158 @@
 import os
-import subprocess
+import functools
 import pywikibot
-import tkinter
 import sys
 import itertools
+import threading
 import mwparserfromhell
 import regex as re
-from typing import Generator, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Iterable, Iterator
+from kovachevbot.backup import BackupStore
+from kovachevbot.dump import DumpSource, DumpPage
+from kovachevbot.metrics import METRICS
+from kovachevbot.sections import insert_l2, collapse_blank_lines
 
 
-WIKTIONARY = pywikibot.Site("en", "wiktionary")
-TEMPLATE_NAMESPACE = WIKTIONARY.namespaces.TEMPLATE
-MAIN_NAMESPACE = WIKTIONARY.namespaces.MAIN
-COMMONS = pywikibot.Site("commons", "commons")
+TEMPLATE_NAMESPACE = 10
+MAIN_NAMESPACE = 0
 LINK_PATTERN = re.compile(r"\[\[(.+?)(?:\|(.+?))?\]\]")
 
 
-def wikt_page(title: str) -> pywikibot.Page:
-    return pywikibot.Page(WIKTIONARY, title)
+# The sites are only created when first needed, rather than at import time, so that importing this module
+# is fast and works offline; every script and helper shares the same site objects.
+@functools.cache
+def get_wiktionary() -> pywikibot.site.BaseSite:
+    return pywikibot.Site("en", "wiktionary")
+
+@functools.cache
+def get_commons() -> pywikibot.site.BaseSite:
+    return pywikibot.Site("commons", "commons")
+
+@functools.cache
+def get_halt_page() -> pywikibot.Page:
+    return wikt_page(HALT_PAGE_TITLE)
+
+DUMP_ENVIRONMENT_VARIABLE = "KOVACHEVBOT_DUMP"
+DUMP_SOURCE: DumpSource = None
+
+def use_dump(path: str) -> DumpSource:
+    """Read Wiktionary pages from a local XML dump instead of the live site from now on.
+    Saving such pages does not edit anything, so any task can be dry-run against the dump this way.
+    The same can be done without changing a script, by setting the `KOVACHEVBOT_DUMP` environment variable to the dump's path.
+    """
+    global DUMP_SOURCE
+    DUMP_SOURCE = DumpSource(path)
+    return DUMP_SOURCE
+
+def get_dump() -> DumpSource | None:
+    """The dump that pages are being read from, or `None` when using the live site."""
+    if DUMP_SOURCE is None and os.environ.get(DUMP_ENVIRONMENT_VARIABLE):
+        use_dump(os.environ[DUMP_ENVIRONMENT_VARIABLE])
+    return DUMP_SOURCE
+
+LAZY_ATTRIBUTES = {
+    "WIKTIONARY": get_wiktionary,
+    "COMMONS": get_commons,
+    "HALT_PAGE": get_halt_page,
+}
+
+def __getattr__(name: str):
+    # Keeps `kovachevbot.WIKTIONARY` and the like working, without creating anything on import
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def wikt_page(title: str) -> pywikibot.Page | DumpPage:
+    if (dump := get_dump()) is not None:
+        return dump.page(title)
+    return pywikibot.Page(get_wiktionary(), title)
+
+def batched(iterable: Iterable, size: int) -> Generator[list, None, None]:
+    """Split an iterable into lists of at most `size` items each."""
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def _load_batch(batch: list[pywikibot.Page], groupsize: int, content: bool) -> list[pywikibot.Page]:
+    return list(batch[0].site.preloadpages(batch, groupsize=groupsize, content=content))
+
+def preload_pages(pages: Iterable[pywikibot.Page], groupsize: int = None, content: bool = True) -> Generator[pywikibot.Page, None, None]:
+    """Load the text, latest revision ID and protection info of `pages` in batches, one API query per batch,
+    instead of one round-trip per page. By default a batch is as large as the API allows
+    (50 titles, or 500 when logged in with the bot flag). With `content=False`, everything but the text is loaded,
+    e.g. to check which pages have changed before fetching them.
+    While the pages of one batch are being consumed, the next batch is already being fetched in the background.
+    """
+    if (dump := get_dump()) is not None:
+        # Pages listed by the live site (e.g. from a category) are read from the dump instead
+        pages = (page if isinstance(page, DumpPage) else dump.page(page.title()) for page in pages)
+
+    pages = iter(pages)
+    first_page = next(pages, None)
+    if first_page is None:
+        return
+    groupsize = groupsize or first_page.site.maxlimit
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for batch in batched(itertools.chain([first_page], pages), groupsize):
+            loading = executor.submit(_load_batch, batch, groupsize, content)
+            if pending is not None:
+                yield from pending.result()
+            pending = loading
+
+        if pending is not None:
+            yield from pending.result()
+
+def _packed_groups(groups: Iterable[list[pywikibot.Page]], groupsize: int) -> Generator[list[list[pywikibot.Page]], None, None]:
+    """Whole groups, packed into batches of at most `groupsize` pages (a larger group is a batch of its own)."""
+    batch, size = [], 0
+    for group in groups:
+        if not group:
+            continue
+        if batch and size + len(group) > groupsize:
+            yield batch
+            batch, size = [], 0
+        batch.append(group)
+        size += len(group)
+    if batch:
+        yield batch
+
+def preload_groups(groups: Iterable[list[pywikibot.Page]], groupsize: int = None, content: bool = True) -> Generator[list[pywikibot.Page], None, None]:
+    """Load groups of pages as `preload_pages` does, but packing whole groups into each batch, so that the pages
+    of a group (e.g. the words of an alphagram) are always loaded together by one query, and yielding a group at a time.
+    """
+    if (dump := get_dump()) is not None:
+        groups = ([page if isinstance(page, DumpPage) else dump.page(page.title()) for page in group] for group in groups)
+
+    groups = iter(groups)
+    first_group = next((group for group in groups if group), None)
+    if first_group is None:
+        return
+    groupsize = groupsize or first_group[0].site.maxlimit
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = None
+        for batch in _packed_groups(itertools.chain([first_group], groups), groupsize):
+            # Pages are loaded in place, so the groups are whole once their batch has been
+            loading = executor.submit(_load_batch, [page for group in batch for page in group], groupsize, content)
+            if pending is not None:
+                pending[0].result()
+                yield from pending[1]
+            pending = (loading, batch)
+
+        if pending is not None:
+            pending[0].result()
+            yield from pending[1]
+
+def pages_from_titles(titles: Iterable[str]) -> Generator[pywikibot.Page, None, None]:
+    """Iterate over the Wiktionary pages with the given titles, with their contents preloaded in batches."""
+    return preload_pages(wikt_page(title) for title in titles)
 
 def save_gui(page: pywikibot.Page, default_edit_summary: str = "") -> bool:
     """Returns whether the edit was successfully completed through the save button or not."""
+    import tkinter  # Only imported here, since loading the GUI toolkit is slow and most scripts never need it
     window = tkinter.Tk()
     window.title(f"Editing page {page.title()}")
     window.geometry("800x600")
@@ -55,7 +187,7 @@ def save_gui(page: pywikibot.Page, default_edit_summary: str = "") -> bool:
     window.mainloop()
     return success
 
-# save_gui(pywikibot.Page(WIKTIONARY, "User:Kiril kovachev/Sandbox"))
+# save_gui(pywikibot.Page(get_wiktionary(), "User:Kiril kovachev/Sandbox"))
 
 def convert_link_to_plaintext(link: mwparserfromhell.wikicode.Wikilink) -> str:
     if link.text is not None:
@@ -64,43 +196,228 @@ def convert_link_to_plaintext(link: mwparserfromhell.wikicode.Wikilink) -> str:
     else:
         return link.title
 
+# A link with no markup in it, to no namespace or interwiki (whose prefixes could also be URL schemes, like "mailto:")
+SIMPLE_LINK_PATTERN = re.compile(r"\[\[((?:[^\[\]{}<>|\n':]|'(?!'))+)(?:\|((?:[^\[\]{}<>\n']|'(?!'))*))?\]\]")
+LINK_MARKUP_PATTERN = re.compile(r"[\[\]{}<]")  # Anything which could make the links of a text other than simple ones
+LINK_BATCH_SEPARATOR = "\x1f"  # Joins fragments converted together; never found in wikitext
+LINK_BATCH_UNSAFE = re.compile(r"[{<\x1f]")  # Templates, tags and comments could span several fragments once joined
+
 def links_to_plaintext(text: str) -> str:
-    parsed: mwparserfromhell.wikicode.Wikicode = mwparserfromhell.parse(text)
-    links = parsed.filter(forcetype=mwparserfromhell.wikicode.Wikilink)
-    for link in links:
-        plain = convert_link_to_plaintext(link)
-        parsed.replace(link, plain)
+    """Replace the wikilinks in the text with their displayed text, e.g. "[[よむ|よ.む]]" with "よ.む"."""
+    if "[[" not in text:
+        return text
+    plain = simple_links_to_plaintext(text)
+    return plain if plain is not None else parse_links_to_plaintext(text)
 
-    return str(parsed)
+def simple_links_to_plaintext(text: str) -> str | None:
+    """
+    Convert the links of text whose links are all simple, and which has no other markup that could contain them,
+    without parsing it at all. Gives `None` for any other text.
+    """
+    if "//" in text:  # URLs, which are never titles
+        return None
+    plain = SIMPLE_LINK_PATTERN.sub(lambda link: link[2] or link[1], text)
+    return None if LINK_MARKUP_PATTERN.search(plain) else plain
 
-ABORT_CHECK_INTERVAL = 15
-HALT_PAGE = wikt_page("User:KovachevBot/halt")  # Do not edit, please!
+@functools.lru_cache(maxsize=4096)  # The same fragments (e.g. readings) come up on page after page
+def parse_links_to_plaintext(text: str) -> str:
+    parsed: mwparserfromhell.wikicode.Wikicode = mwparserfromhell.parse(text)
+    # The text is put back together node by node, converting the links on the way, in one pass over the page;
+    # only nodes with links nested in them (e.g. templates) have those replaced in their own tree
+    pieces = []
+    for node in parsed.nodes:
+        if isinstance(node, mwparserfromhell.wikicode.Wikilink):
+            pieces.append(links_to_plaintext(str(convert_link_to_plaintext(node))))  # Its text may have links of its own
+        elif isinstance(node, mwparserfromhell.wikicode.Text):
+            pieces.append(node.value)
+        else:
+            code = mwparserfromhell.wikicode.Wikicode([node])
+            for link in code.filter(forcetype=mwparserfromhell.wikicode.Wikilink):
+                code.replace(link, convert_link_to_plaintext(link))
+            pieces.append(str(code))
+    return "".join(pieces)
+
+def links_are_self_contained(text: str) -> bool:
+    """Whether every link in the text both opens and closes within it, so that it can be joined to others without merging with them."""
+    if LINK_BATCH_UNSAFE.search(text):
+        return False
+    depth = 0
+    for bracket in re.findall(r"\[\[|\]\]", text):
+        depth += 1 if bracket == "[[" else -1
+        if depth < 0:
+            return False
+    return depth == 0
+
+def links_to_plaintext_many(fragments: Iterable[str]) -> list[str]:
+    """
+    `links_to_plaintext` for many fragments at once, e.g. the readings of a page: the fragments whose links
+    need parsing are joined and parsed together, rather than each being parsed on its own. Any fragment which could
+    interfere with its neighbours once joined (an unclosed link, a template, a tag) is converted by itself.
+    """
+    results = list(fragments)
+    batch = []
+    for i, fragment in enumerate(results):
+        if "[[" not in fragment:
+            continue
+        if (plain := simple_links_to_plaintext(fragment)) is not None:
+            results[i] = plain
+        elif links_are_self_contained(fragment):
+            batch.append(i)
+        else:
+            results[i] = parse_links_to_plaintext(fragment)
+
+    if len(batch) == 1:
+        results[batch[0]] = parse_links_to_plaintext(results[batch[0]])
+    elif batch:
+        converted = parse_links_to_plaintext(LINK_BATCH_SEPARATOR.join(results[i] for i in batch)).split(LINK_BATCH_SEPARATOR)
+        if len(converted) != len(batch):  # Should never happen, but the fragments can always be converted one by one
+            converted = [parse_links_to_plaintext(results[i]) for i in batch]
+        for i, plain in zip(batch, converted):
+            results[i] = plain
+    return results
+
+ABORT_CHECK_INTERVAL = 10  # Seconds between checks of the halt page
+HALT_PAGE_TITLE = "User:KovachevBot/halt"  # Do not edit, please!
+
+class BotHaltedError(SystemExit):
+    """The bot was manually ordered to stop through its halt page.
+    Like `SystemExit`, this is not caught by `except Exception`, so it stops the script (running any `finally` blocks).
+    """
 
-def iterate_with_abort_check(iterator: Iterator, interval: int = ABORT_CHECK_INTERVAL, halt_page = HALT_PAGE):
+class HaltWatcher:
+    """
+    Watch a halt page in a background thread, polling its latest revision ID every `interval` seconds
+    and only fetching its text once it has been edited. Once someone has put the word 'halt' on it,
+    the `halted` flag is set, which iterators and saves can then check without a round-trip of their own.
+    """
+    def __init__(self, halt_page: pywikibot.Page, interval: float = ABORT_CHECK_INTERVAL):
+        self.halt_page = halt_page
+        self.interval = interval
+        self.halted = threading.Event()
+        self.halted_by: str = None
+        self._revid: int = None
+        self._stopped = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> "HaltWatcher":
+        if self._thread is None:
+            self.check()  # So that a halt already in place takes effect before the first edit
+            self._thread = threading.Thread(target=self._run, name="halt-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval) and not self.halted.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f"WARNING: could not check the halt page: {e}", file=sys.stderr)
+
+    def check(self) -> bool:
+        """Check the halt page now, returning whether the bot has been halted."""
+        self.halt_page.site.loadpageinfo(self.halt_page)
+        revid = self.halt_page.latest_revision_id
+        if revid != self._revid:
+            self._revid = revid
+            if "halt" in self.halt_page.get(force=True).casefold():
+                self.halted_by = self.halt_page.userName()
+                self.halted.set()
+        return self.halted.is_set()
+
+HALT_WATCHERS: dict[str, HaltWatcher] = {}
+
+def watch_halt_page(halt_page: pywikibot.Page = None, interval: float = ABORT_CHECK_INTERVAL) -> HaltWatcher:
+    """Get the (running) watcher of the given halt page (User:KovachevBot/halt by default),
+    which is shared by everything that uses the same page.
+    If it is already running, it is made to poll at least as often as every `interval` seconds.
     """
-    Run over an iterator, checking at every interval of 5 (or other specified value)
-    whether the bot has been ordered to stop. The failsafe site is defined as User:KovachevBot/halt by default.
+    if get_dump() is not None:
+        # Nothing is edited when reading from a dump, so there is nothing to halt; the watcher is never started
+        return HALT_WATCHERS.setdefault(DUMP_ENVIRONMENT_VARIABLE, HaltWatcher(None, interval))
+
+    halt_page = halt_page or get_halt_page()
+    title = halt_page.title()
+    if title not in HALT_WATCHERS:
+        HALT_WATCHERS[title] = HaltWatcher(halt_page, interval)
+    watcher = HALT_WATCHERS[title]
+    watcher.interval = min(watcher.interval, interval)
+    return watcher.start()
+
+def check_halt() -> None:
+    """Raise `BotHaltedError` if any watched halt page has ordered the bot to stop."""
+    for watcher in HALT_WATCHERS.values():
+        if watcher.halted.is_set():
+            raise BotHaltedError(f"ERROR: BOT WAS MANUALLY HALTED BY {watcher.halted_by}")
+
+def save_page(page: pywikibot.Page, summary: str, **kwargs) -> None:
+    """Save the page with the given edit summary (and any other arguments to `pywikibot.Page.save`),
+    unless the bot has been halted in the meantime, in which case `BotHaltedError` is raised instead.
     """
-    for edit_count, value in enumerate(iterator):
-        # Check halt page
-        if edit_count % interval == 0:
-            if "halt" in halt_page.get(force=True).casefold():
-                print(f"ERROR: BOT WAS MANUALLY HALTED BY {halt_page.userName()}", file=sys.stderr)
-                return
+    if not HALT_WATCHERS:
+        watch_halt_page()
+    check_halt()
+    try:
+        with METRICS.timed("save", page):
+            page.save(summary, **kwargs)
+    except Exception as error:
+        METRICS.record_event("error", page, f"{type(error).__name__}: {error}")
+        raise
+    METRICS.record_event("saved", page)
+
+def iterate_with_abort_check(iterator: Iterator, interval: float = ABORT_CHECK_INTERVAL, halt_page: pywikibot.Page = None):
+    """
+    Run over an iterator, stopping as soon as the bot has been ordered to stop.
+    The halt page is checked in the background every 10 seconds (or other specified interval),
+    so this costs nothing per item. The failsafe site is defined as User:KovachevBot/halt by default.
+    """
+    watcher = watch_halt_page(halt_page, interval)
+    for value in iterator:
+        if watcher.halted.is_set():
+            print(f"ERROR: BOT WAS MANUALLY HALTED BY {watcher.halted_by}", file=sys.stderr)
+            return
         yield value
 
+LIMIT_OPTION = "--limit"
+
+def command_line_arguments(argv: list[str] = None) -> tuple[list[str], int | None]:
+    """The script's command-line arguments (`sys.argv[1:]` by default), without the limit on the number of edits, and that limit.
+    The limit is given as `--limit N` (or `--limit=N`) anywhere, or as a bare number in the first argument (as the scripts without modes
+    have always taken it) or the last one (after a mode); it is `None` if there is none. The remaining arguments (a mode and its own arguments) can then be read by position.
+    """
+    arguments = list(sys.argv[1:] if argv is None else argv)
+    for position, argument in enumerate(arguments):
+        if argument == LIMIT_OPTION:
+            if position + 1 == len(arguments):
+                raise ValueError(f"{LIMIT_OPTION} needs a number of edits")
+            limit = arguments[position + 1]
+            del arguments[position:position + 2]
+            return arguments, int(limit)
+        if argument.startswith(f"{LIMIT_OPTION}="):
+            del arguments[position]
+            return arguments, int(argument.removeprefix(f"{LIMIT_OPTION}="))
+    if arguments and arguments[0].isdigit():
+        return arguments[1:], int(arguments[0])
+    if arguments and arguments[-1].isdigit():
+        return arguments[:-1], int(arguments[-1])
+    return arguments, None
+
 def iterate_entries(iterator: Iterator, max_edits: int = None):
     """Iterate at most `max_edits` entries of an iterator (of pages), or unlimited.
-    If no `max_edits` is provided as an arg, try to get the value from the command-line arguments.
+    If no `max_edits` is provided as an arg, try to get the value from the command-line arguments (see `command_line_arguments`).
     If it still isn't found, default to running indefinitely.
     If it is provided, but it's not a valid integer, it will default to unlimited again.
     In the unlimited case, this effectively means this iterator will run until the original one is exhausted.
     """
     if max_edits is None:
         try:
-            edit_iter = range(int(pywikibot.argvu[1]))
-        except:
-            edit_iter = itertools.count()
+            _, max_edits = command_line_arguments()
+        except ValueError:
+            pass
+    if max_edits is None:
+        edit_iter = itertools.count()
     else:
         try:
             edit_iter = range(int(max_edits))
@@ -110,71 +427,65 @@ def iterate_entries(iterator: Iterator, max_edits: int = None):
     for _, value in zip(edit_iter, iterator):
         yield value
 
-def iterate_safe(iterator: Iterator, max_entries: int = None, abort_check_interval: int = ABORT_CHECK_INTERVAL, halt_page: pywikibot.Page = HALT_PAGE):
-    """Iterate safely over an iterator of pages, checking every `abort_check_interval` for whether to halt
+def iterate_safe(iterator: Iterator, max_entries: int = None, abort_check_interval: float = ABORT_CHECK_INTERVAL, halt_page: pywikibot.Page = None):
+    """Iterate safely over an iterator of pages, checking every `abort_check_interval` seconds for whether to halt
     the bot based on a user's manual request (by editing the `halt_page` to contain the word 'halt'),
     yielding at most `max_entries`.
     """
-    return iterate_entries(iterate_with_abort_check(iterator, abort_check_interval, halt_page), max_entries)
+    entries = iterate_entries(iterate_with_abort_check(iterator, abort_check_interval, halt_page), max_entries)
+    return METRICS.time_iterator(entries, "fetch") if METRICS.enabled else entries
 
 def iterate_tracking(tracking_page: str) -> Generator[pywikibot.Page, None, None]:
     """
     Iterate over pages in a tracking category on Wiktionary (linked to within Template:tracking/(page_name_here)).
     `tracking_page` should be the name of the tracking category: e.g. if you want to iterate
     over `Template:tracking/ja-pron/yomi`, you would enter `ja-pron/yomi`.
-    Returns only entries in the main entry namespace.
+    Returns only entries in the main entry namespace, with their contents preloaded in batches.
     """
-    return pywikibot.Page(WIKTIONARY, f"tracking/{tracking_page}", ns=TEMPLATE_NAMESPACE).getReferences(only_template_inclusion=True, namespaces=[MAIN_NAMESPACE])
+    references = pywikibot.Page(get_wiktionary(), f"tracking/{tracking_page}", ns=TEMPLATE_NAMESPACE).getReferences(only_template_inclusion=True, namespaces=[MAIN_NAMESPACE])
+    return preload_pages(references)
 
 def iterate_category(category_name: str) -> Generator[pywikibot.Page, None, None]:
     """Iterate pages in a category on Wiktionary.
     The `category_name` should be the name without the Category: namespace, e.g.
-    `category_name="Bulgarian lemmas"`.
+    `category_name="Bulgarian lemmas"`. The pages' contents are preloaded in batches.
     """
-    return pywikibot.Category(WIKTIONARY, category_name).articles(namespaces=[MAIN_NAMESPACE])
+    return preload_pages(pywikibot.Category(get_wiktionary(), category_name).articles(namespaces=[MAIN_NAMESPACE]))
+
+BACKUP_STORES: dict[str, BackupStore] = {}
 
-def backup_page(old_text: str, new_page: pywikibot.Page, backup_path: str, file_name: str = None) -> None:
+def get_backup_store(backup_path: str) -> BackupStore:
+    """Get this run's backup archive in the directory `backup_path`, creating it on first use."""
+    if backup_path not in BACKUP_STORES:
+        BACKUP_STORES[backup_path] = BackupStore(backup_path)
+    return BACKUP_STORES[backup_path]
+
+def page_revid(page: pywikibot.Page) -> int | None:
+    """The ID of the latest revision of the page, or `None` if the page does not exist."""
+    try:
+        return page.latest_revision_id
+    except pywikibot.exceptions.NoPageError:
+        return None
+
+def backup_page(old_text: str, new_page: pywikibot.Page, backup_path: str, file_name: str = None) -> bool:
     """
     Copy the contents of the page to local storage for backup in case there is a problem
     with the script later; this will allow the error to be automatically corrected at that time.
+    The backup is a diff from the page's new text back to `old_text`, stored in this run's archive under `backup_path`
+    by title (or `file_name`, if given) and by the page's current revision ID. Call this before saving the page.
+    Nothing is stored if the text did not change; returns whether a backup was made.
     """
-
-    file_name = file_name or new_page.title()
-    os.makedirs(backup_path, exist_ok=True)
-    
-    with open("temp1", mode="w", encoding="utf-8") as f:
-        f.write(old_text)
-
-    with open("temp2", mode="w", encoding="utf-8") as f:
-        f.write(new_page.text)
-
-    diff = subprocess.getoutput("diff -u temp2 temp1") # Get differences between new revision and previous
-    diff = diff + "\n" # patch will complain if we don't end the file with a newline
-
-    with open(os.path.join(backup_path, new_page.title()), mode="w", encoding="utf-8") as f:
-        f.write(diff)
+    if isinstance(new_page, DumpPage):
+        return False  # Pages read from a dump are never really saved
+    with METRICS.timed("backup", new_page):
+        return get_backup_store(backup_path).backup(old_text, new_page.text, file_name or new_page.title(), page_revid(new_page))
 
 def add_l2(parsed: mwparserfromhell.wikicode.Wikicode, l2_section: mwparserfromhell.wikicode.Wikicode) -> None:
-    parsed = mwparserfromhell.parse(parsed)
-    l2_section = mwparserfromhell.parse(l2_section)
-
-    l2_title = l2_section.nodes[0].title
-
-    if l2_title in [section.nodes[0].title for section in parsed.get_sections([2])]:
-        return
-
-    new = mwparserfromhell.parse("")
-
-    l2_sections = parsed.get_sections([2])
-    l2_sections.append(l2_section)
-
-    l2_sections.sort(key=lambda section: section.nodes[0].title)
-
-    for section in l2_sections:
-        section.append("\n\n")
-        new.append(section)
-
-    parsed.nodes = new.nodes
-
-    while "\n\n\n" in parsed:
-        parsed.replace("\n\n\n", "\n\n")
\ No newline at end of file
+    """
+    Add an L2 section to the page's tree, in place, at its place in the order of languages
+    (see `insert_l2`), unless the page already has a section with its title. Runs of blank lines are collapsed.
+    """
+    text = str(parsed)
+    new_text = insert_l2(text, str(l2_section))
+    if new_text != text:
+        parsed.nodes = mwparserfromhell.parse(collapse_blank_lines(new_text)).nodes
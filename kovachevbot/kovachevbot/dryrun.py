@@ -0,0 +1,104 @@
+"""
+Dry runs: a task's transform is run over a list of pages in a pool of processes, without saving anything,
+and everything it would have changed is written to a bundle for review before the real run. The bundle is a zip file with:
+
+- `changes.diff`: a unified diff of every page that would change, in page order
+- `summaries.tsv`: the title, outcome ("changed", "unchanged", "failed" or "missing") and edit summary (or error) of every page,
+  quoted as by `csv` with the "excel-tab" dialect where a field has tabs or line breaks
+- `counts.json`: the number of pages with each outcome
+"""
+import io
+import os
+import csv
+import sys
+import json
+import zipfile
+import difflib
+import itertools
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+import pywikibot
+from kovachevbot.backup import diff_lines
+from kovachevbot.pipeline import Transform
+
+__all__ = ["dry_run"]
+
+DRY_RUN_BLOCK_SIZE = 100  # Pages handed to a worker at a time
+PROGRESS_INTERVAL = 5000  # Pages between progress reports
+
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+FAILED = "failed"
+MISSING = "missing"
+
+
+def make_diff(old_text: str, new_text: str, title: str) -> str:
+    return "".join(difflib.unified_diff(diff_lines(old_text), diff_lines(new_text), fromfile=f"a/{title}", tofile=f"b/{title}"))
+
+def transform_block(transform: Transform, block: list[tuple[str, str | None]]) -> list[tuple[str, str, str, str]]:
+    """Transform a block of (title, text) pairs, giving the title, outcome, summary or error, and diff of each."""
+    results = []
+    for title, text in block:
+        if text is None:
+            results.append((title, MISSING, "", ""))
+            continue
+        try:
+            new_text, summary = transform(text)
+        except Exception as error:
+            results.append((title, FAILED, f"{type(error).__name__}: {error}", ""))
+            continue
+        if new_text == text or not summary:
+            results.append((title, UNCHANGED, summary or "", ""))
+        else:
+            results.append((title, CHANGED, summary, make_diff(text, new_text, title)))
+    return results
+
+def page_texts(pages: Iterable[pywikibot.Page]) -> Iterable[tuple[str, str | None]]:
+    for page in pages:
+        yield page.title(), page.text if page.exists() else None
+
+def dry_run(pages: Iterable[pywikibot.Page], transform: Transform, bundle_path: str, processes: int = None) -> Counter:
+    """
+    Run `transform` (as given to `run_pipeline`) over the pages, in a pool of `processes` processes (by default, one per core),
+    and write the bundle of what would change to `bundle_path`. Nothing is saved. `pages` should preload them,
+    e.g. `pages_from_titles`, or come from a dump; the transform must be a module-level function, to be sent to the workers.
+    Returns the number of pages with each outcome.
+    """
+    processes = processes or os.cpu_count()
+    counts = Counter()
+    summaries: list[tuple[str, str, str]] = []
+    texts = page_texts(pages)
+    done = 0
+
+    with ProcessPoolExecutor(processes) as executor, zipfile.ZipFile(bundle_path, mode="w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        with bundle.open("changes.diff", mode="w", force_zip64=True) as diffs:
+            pending = deque()
+
+            def write_next():
+                nonlocal done
+                for title, outcome, summary, diff in pending.popleft().result():
+                    counts[outcome] += 1
+                    summaries.append((title, outcome, summary))
+                    if diff:
+                        diffs.write(diff.encode("utf-8"))
+                    done += 1
+                    if done % PROGRESS_INTERVAL == 0:
+                        print(f"Transformed {done} pages: {dict(counts)}", file=sys.stderr)
+
+            while block := list(itertools.islice(texts, DRY_RUN_BLOCK_SIZE)):
+                # Keep a couple of blocks per worker in flight, so that pages are fetched no faster than they are transformed
+                if len(pending) >= 2 * processes:
+                    write_next()
+                pending.append(executor.submit(transform_block, transform, block))
+
+            while pending:
+                write_next()
+
+        summaries_file = io.StringIO()
+        csv.writer(summaries_file, dialect="excel-tab", lineterminator="\n").writerows(summaries)
+        bundle.writestr("summaries.tsv", summaries_file.getvalue())
+        bundle.writestr("counts.json", json.dumps(dict(counts), indent=1))
+
+    print(f"Dry run of {sum(counts.values())} pages written to {bundle_path}: {dict(counts)}", file=sys.stderr)
+    return counts
@@ -0,0 +1,326 @@
+"""
+Offline access to pages from a MediaWiki XML dump (e.g. enwiktionary-latest-pages-articles-multistream.xml.bz2),
+so that the tasks can read pages at disk speed, without the API, for dry runs, benchmarks and tests.
+
+Random access goes through an index from titles to offsets in the dump, which is built the first time a dump is used
+and kept next to it. The dump can either be uncompressed XML, or a *multistream* bz2 dump, where the offset is that
+of the bz2 stream (of about 100 pages) containing the page. Plain single-stream bz2 dumps cannot be read at random.
+If the index published with a multistream dump (`...-multistream-index.txt.bz2`) is next to it, it is built from that,
+without decompressing the dump.
+"""
+import os
+import sys
+import bz2
+import html
+import sqlite3
+import itertools
+import threading
+import regex as re
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from typing import Generator, Iterable
+import pywikibot
+
+__all__ = ["DumpRecord", "DumpSource", "DumpPage", "iter_page_blocks", "iter_dump"]
+
+READ_CHUNK_SIZE = 1 << 20
+INDEX_SUFFIX = ".index.db"
+MULTISTREAM_SUFFIX = ".xml.bz2"
+MULTISTREAM_INDEX_SUFFIX = "-index.txt.bz2"
+INDEX_COMMIT_INTERVAL = 100_000
+PAGE_START = b"<page>"
+PAGE_END = b"</page>"
+TITLE_PATTERN = re.compile(rb"<title>(.*?)</title>")
+
+
+@dataclass
+class DumpRecord:
+    title: str
+    namespace: int
+    pageid: int
+    revid: int
+    text: str
+    redirect: str | None = None
+
+
+def is_bz2(path: str) -> bool:
+    return path.endswith(".bz2")
+
+def parse_page(block: bytes) -> DumpRecord:
+    """Parse the XML of a single <page> element of a dump."""
+    element = ElementTree.fromstring(block)
+    revision = element.find("revision")
+    redirect = element.find("redirect")
+    return DumpRecord(
+        title=element.findtext("title"),
+        namespace=int(element.findtext("ns")),
+        pageid=int(element.findtext("id")),
+        revid=int(revision.findtext("id")),
+        text=revision.findtext("text") or "",
+        redirect=redirect.get("title") if redirect is not None else None,
+    )
+
+def page_block_title(block: bytes) -> str:
+    """Get the title of a raw <page> element, without parsing the whole page."""
+    return html.unescape(TITLE_PATTERN.search(block)[1].decode("utf-8"))
+
+def split_page_blocks(data: bytes) -> tuple[list[bytes], bytes]:
+    """Split off all the complete <page> elements in `data`, returning them and the incomplete rest."""
+    blocks = []
+    position = 0
+    while (start := data.find(PAGE_START, position)) != -1:
+        end = data.find(PAGE_END, start)
+        if end == -1:
+            return blocks, data[start:]
+        position = end + len(PAGE_END)
+        blocks.append(data[start:position])
+    return blocks, b""
+
+def iter_bz2_streams(f) -> Generator[tuple[int, Generator[bytes, None, None]], None, None]:
+    """Iterate over the bz2 streams of a (multistream) bz2 file, giving the offset of each stream
+    and a generator of its decompressed data, chunk by chunk (which must be exhausted before moving on).
+    """
+    buffer = b""
+    position = 0  # Offset in the file of the start of `buffer`
+    while True:
+        if not buffer:
+            buffer = f.read(READ_CHUNK_SIZE)
+            if not buffer:
+                return
+
+        def decompress_stream():
+            nonlocal buffer, position
+            decompressor = bz2.BZ2Decompressor()
+            while True:
+                yield decompressor.decompress(buffer)
+                if decompressor.eof:
+                    unused = decompressor.unused_data
+                    position += len(buffer) - len(unused)
+                    buffer = unused
+                    return
+                position += len(buffer)
+                buffer = f.read(READ_CHUNK_SIZE)
+                if not buffer:
+                    raise EOFError("The bz2 dump ends in the middle of a stream")
+
+        yield position, decompress_stream()
+
+def iter_page_blocks(path: str) -> Generator[tuple[int, bytes], None, None]:
+    """Iterate over the raw XML of every <page> in the dump, with the offset to look it up by in the index:
+    the byte offset of the page for uncompressed XML, or that of its bz2 stream for multistream bz2 dumps.
+    """
+    with open(path, "rb") as f:
+        if is_bz2(path):
+            for offset, chunks in iter_bz2_streams(f):
+                rest = b""
+                for chunk in chunks:
+                    blocks, rest = split_page_blocks(rest + chunk)
+                    for block in blocks:
+                        yield offset, block
+        else:
+            offset = 0
+            lines = []
+            page_offset = None
+            for line in f:
+                if page_offset is None:
+                    if PAGE_START in line:
+                        page_offset = offset + line.index(PAGE_START)
+                        lines.append(line[line.index(PAGE_START):])
+                else:
+                    lines.append(line)
+                if page_offset is not None and PAGE_END in line:
+                    block = b"".join(lines)
+                    yield page_offset, block[:block.index(PAGE_END) + len(PAGE_END)]
+                    lines = []
+                    page_offset = None
+                offset += len(line)
+
+def read_page_blocks_at(f, path: str, offset: int) -> list[bytes]:
+    """The raw XML of the pages at an offset in the index (see `iter_page_blocks`), read from the open dump `f`:
+    every page of the bz2 stream there, or the one page there in uncompressed XML."""
+    f.seek(offset)
+    if is_bz2(path):
+        _, chunks = next(iter_bz2_streams(f))
+        blocks, _ = split_page_blocks(b"".join(chunks))
+        return blocks
+    lines = []
+    for line in f:
+        lines.append(line)
+        if PAGE_END in line:
+            break
+    block = b"".join(lines)
+    return [block[:block.index(PAGE_END) + len(PAGE_END)]]
+
+def multistream_index_path(path: str) -> str | None:
+    """The path of the index published with a multistream dump (`x-multistream-index.txt.bz2` for `x-multistream.xml.bz2`), if it is next to it."""
+    if not path.endswith(MULTISTREAM_SUFFIX):
+        return None
+    index_path = path.removesuffix(MULTISTREAM_SUFFIX) + MULTISTREAM_INDEX_SUFFIX
+    return index_path if os.path.exists(index_path) else None
+
+def iter_multistream_index(index_path: str) -> Generator[tuple[str, int], None, None]:
+    """Iterate over the title and bz2 stream offset of every page in a published multistream index, in dump order.
+    Its lines are `offset:page ID:title`, with the title escaped as in the XML."""
+    with bz2.open(index_path, mode="rt", encoding="utf-8") as f:
+        for line in f:
+            offset, _, title = line.rstrip("\n").split(":", 2)
+            yield html.unescape(title), int(offset)
+
+def multistream_offsets(index_path: str) -> Generator[int, None, None]:
+    """Iterate over the offsets of the bz2 streams with pages in a published multistream index, in dump order."""
+    return (offset for offset, _ in itertools.groupby(offset for _, offset in iter_multistream_index(index_path)))
+
+def iter_dump(path: str) -> Generator[DumpRecord, None, None]:
+    """Iterate over every page in the dump, in order."""
+    for _, block in iter_page_blocks(path):
+        yield parse_page(block)
+
+
+class DumpSource:
+    """
+    A source of pages from a local dump, usable in place of the Wiktionary site:
+    `page(title)` gives a `DumpPage`, which provides the parts of `pywikibot.Page` that the tasks use.
+    It can be used from several threads (e.g. that of `kovachevbot.preload_pages`): the index connection
+    and the cache of streams are only touched under a lock, and streams are read and parsed outside it.
+    """
+    maxlimit = 500  # Batch size for `kovachevbot.preload_pages`, which calls `preloadpages` below
+
+    def __init__(self, path: str, index_path: str = None):
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        if not os.path.exists(self.index_path):
+            self.build_index()
+        self.index = sqlite3.connect(self.index_path, check_same_thread=False)  # Shared between threads, under the lock
+        self._stream_cache: dict[int, dict[str, DumpRecord]] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"DumpSource({self.path!r})"
+
+    def build_index(self) -> None:
+        print(f"Indexing dump {self.path}, this only needs to be done once...", file=sys.stderr)
+        temporary_path = self.index_path + ".partial"
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        index = sqlite3.connect(temporary_path)
+        index.execute("CREATE TABLE pages (title TEXT PRIMARY KEY, offset INTEGER NOT NULL) WITHOUT ROWID")
+        if published_index := multistream_index_path(self.path):
+            entries = iter_multistream_index(published_index)
+        else:
+            entries = ((page_block_title(block), offset) for offset, block in iter_page_blocks(self.path))
+        while batch := list(itertools.islice(entries, INDEX_COMMIT_INTERVAL)):
+            with index:
+                index.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?)", batch)
+        index.close()
+        os.replace(temporary_path, self.index_path)
+
+    def offsets(self) -> list[int]:
+        """Every offset in the index, in dump order: that of each bz2 stream with pages, or of each page in uncompressed XML."""
+        with self._lock:
+            return [row[0] for row in self.index.execute("SELECT DISTINCT offset FROM pages ORDER BY offset")]
+
+    def offset(self, title: str) -> int | None:
+        with self._lock:
+            row = self.index.execute("SELECT offset FROM pages WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def _read_at(self, offset: int) -> list[bytes]:
+        with open(self.path, "rb") as f:
+            return read_page_blocks_at(f, self.path, offset)
+
+    def load(self, title: str) -> DumpRecord | None:
+        """Get the record of the page with the given title, or `None` if it is not in the dump."""
+        offset = self.offset(title)
+        if offset is None:
+            return None
+        with self._lock:
+            records = self._stream_cache.get(offset)
+        if records is None:
+            records = {record.title: record for record in map(parse_page, self._read_at(offset))}
+            with self._lock:
+                # A multistream block holds ~100 pages, which are often looked up together; keep the last few around
+                if offset not in self._stream_cache and len(self._stream_cache) >= 8:
+                    del self._stream_cache[next(iter(self._stream_cache))]
+                self._stream_cache[offset] = records
+        return records.get(title)
+
+    def page(self, title: str) -> "DumpPage":
+        return DumpPage(self, title)
+
+    def preloadpages(self, pages: Iterable["DumpPage"], groupsize: int = None, content: bool = True) -> Generator["DumpPage", None, None]:
+        """Load the given pages, in order of their position in the dump to keep reads sequential."""
+        pages = list(pages)
+        for page in sorted(pages, key=lambda page: self.offset(page.title()) or 0):
+            page.load()
+        yield from pages
+
+    def loadpageinfo(self, page: "DumpPage") -> None:
+        page.load()
+
+
+class DumpPage:
+    """A page read from a dump. Saving does not edit anything, it only reports what would have been saved."""
+    def __init__(self, source: DumpSource, title: str):
+        self.site = source
+        self._title = title.replace("_", " ").strip()
+        self._record: DumpRecord = None
+        self._loaded = False
+        self._text: str = None
+
+    def __repr__(self) -> str:
+        return f"DumpPage({self._title!r})"
+
+    def load(self) -> DumpRecord | None:
+        if not self._loaded:
+            self._record = self.site.load(self._title)
+            self._loaded = True
+        return self._record
+
+    def title(self, as_link: bool = False, **kwargs) -> str:
+        return f"[[{self._title}]]" if as_link else self._title
+
+    def exists(self) -> bool:
+        return self.load() is not None
+
+    def isRedirectPage(self) -> bool:
+        return self.exists() and self._record.redirect is not None
+
+    def get(self, force: bool = False, get_redirect: bool = False) -> str:
+        if not self.exists():
+            raise pywikibot.exceptions.NoPageError(self)
+        return self._record.text
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            return self._record.text if self.exists() else ""
+        return self._text
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self._text = value
+
+    @property
+    def latest_revision_id(self) -> int:
+        if not self.exists():
+            raise pywikibot.exceptions.NoPageError(self)
+        return self._record.revid
+
+    @property
+    def pageid(self) -> int:
+        return self._record.pageid if self.exists() else 0
+
+    def namespace(self) -> int:
+        return self._record.namespace if self.exists() else 0
+
+    def userName(self) -> None:
+        return None  # Dumps of current revisions do not need to say who made them
+
+    def save(self, summary: str = None, **kwargs) -> None:
+        changed = "changed" if self.text != (self._record.text if self.exists() else "") else "unchanged"
+        print(f"DRY RUN: would save [[{self._title}]] ({changed}): {summary}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    # Build the index of a dump ahead of time: python -m kovachevbot.dump <path to dump>
+    DumpSource(sys.argv[1])
@@ -0,0 +1,93 @@
+"""
+Following recent changes instead of walking a whole tracking template or category on every run:
+`follow_tracking` polls Special:RecentChanges every minute or so from a high-water mark kept in the task's journal,
+asks in batches which of the pages edited since then transclude the task's tracking template, and yields those
+(leaving out the ones the task has already seen at their latest revision), so that the cost of each poll follows
+the number of edits rather than the size of the category, and new pages reach the task within minutes of being edited.
+
+Pages which only start transcluding the template without being edited themselves (e.g. after an edit to a template
+they use) do not show up in recent changes; a full run over the tracking template now and then picks them up.
+"""
+import sys
+import datetime
+from typing import Callable, Generator, Iterable
+import pywikibot
+from pywikibot.data.api import PropertyGenerator
+from kovachevbot.common import get_wiktionary, batched, watch_halt_page, TEMPLATE_NAMESPACE, MAIN_NAMESPACE
+from kovachevbot.journal import Journal, pages_changed_since_visit
+
+__all__ = ["follow_tracking", "recent_changes", "transcluding"]
+
+FOLLOW_INTERVAL = 60  # Seconds between polls of recent changes
+FOLLOW_OVERLAP = 120  # Seconds before the high-water mark read again on each poll, for changes which reach the feed late
+
+
+def parse_cursor(cursor: str | None) -> tuple[pywikibot.Timestamp, int] | None:
+    """The (timestamp, recent change ID) of a high-water mark kept as "<ISO timestamp> <rcid>"."""
+    if not cursor:
+        return None
+    timestamp, rcid = cursor.split()
+    return pywikibot.Timestamp.fromISOformat(timestamp), int(rcid)
+
+def format_cursor(timestamp: pywikibot.Timestamp, rcid: int) -> str:
+    return f"{timestamp.isoformat()} {rcid}"
+
+def recent_changes(since: tuple[pywikibot.Timestamp, int], namespaces: list[int] = None,
+                   site: pywikibot.site.BaseSite = None) -> tuple[list[str], tuple[pywikibot.Timestamp, int]]:
+    """
+    The titles of the pages edited or created after the high-water mark `since` (oldest first, each once),
+    and the new high-water mark. The bot's own edits are left out.
+    """
+    site = site or get_wiktionary()
+    timestamp, last_rcid = since
+    titles = {}  # Ordered, without duplicates
+    for change in site.recentchanges(start=timestamp - datetime.timedelta(seconds=FOLLOW_OVERLAP), reverse=True,
+                                     namespaces=namespaces or [MAIN_NAMESPACE], changetype="edit|new",
+                                     excludeuser=site.username() or None):
+        if change["rcid"] <= last_rcid:
+            continue  # Seen on an earlier poll
+        titles[change["title"]] = None
+        change_timestamp = pywikibot.Timestamp.fromISOformat(change["timestamp"])
+        timestamp, last_rcid = max(timestamp, change_timestamp), max(last_rcid, change["rcid"])
+    return list(titles), (timestamp, last_rcid)
+
+def transcluding(titles: Iterable[str], template: str, groupsize: int = None, site: pywikibot.site.BaseSite = None) -> set[str]:
+    """
+    Which of the pages transclude the template (a full title, e.g. "Template:tracking/ja-pron/yomi"),
+    asked with `prop=templates&tltemplates=` for a whole batch of pages per query, without loading any text.
+    """
+    site = site or get_wiktionary()
+    found = set()
+    for batch in batched(titles, groupsize or site.maxlimit):
+        query = PropertyGenerator("templates", site=site, parameters={"titles": batch, "tltemplates": template, "tllimit": "max"})
+        found.update(page["title"] for page in query if page.get("templates"))
+    return found
+
+def follow_tracking(tracking_page: str, journal: Journal, version: str | Callable[[str], str] = None,
+                    since: pywikibot.Timestamp = None, interval: float = FOLLOW_INTERVAL) -> Generator[pywikibot.Page, None, None]:
+    """
+    Follow the pages in a tracking template (as for `iterate_tracking`, e.g. "ja-pron/yomi") as they are edited,
+    yielding each page which transcludes it after an edit, with its text preloaded, until the bot is halted.
+    The high-water mark is kept as the journal's cursor, and is only moved on once every page of a poll has been
+    handled, so a run which is stopped carries on from where it was. The first run starts from `since`, or from now.
+    Pages the journal says the task has seen at their latest revision (in `version`) are left out.
+    """
+    site = get_wiktionary()
+    template = pywikibot.Page(site, f"tracking/{tracking_page}", ns=TEMPLATE_NAMESPACE).title()
+    mark = parse_cursor(journal.cursor)
+    if mark is None:
+        mark = (since or site.server_time(), 0)
+        print(f"Following {template} from {mark[0].isoformat()}; earlier pages are only found by a full run", file=sys.stderr)
+
+    watcher = watch_halt_page()
+    while True:
+        titles, new_mark = recent_changes(mark, site=site)
+        if titles:
+            tracked = transcluding(titles, template, site=site)
+            print(f"{len(titles)} pages edited since {mark[0].isoformat()}, {len(tracked)} of them in {template}", file=sys.stderr)
+            yield from pages_changed_since_visit((title for title in titles if title in tracked), journal, version)
+        mark = new_mark
+        journal.cursor = format_cursor(*mark)
+        journal.commit()
+        if watcher.halted.wait(interval):
+            return
@@ -0,0 +1,247 @@
+"""
+A journal of each task's progress: which pages are done, which were skipped and which failed (and why),
+kept in a SQLite database in WAL mode, with one table per task. Entries are written as they happen and committed
+every few pages or seconds, so a run that is killed loses at most that much, and the next run carries on where it stopped.
+The whole journal of a task is also kept in memory, so checking whether a page has been seen is a dictionary lookup.
+A task can also keep a cursor, e.g. the timestamp or title up to which it has worked through a list.
+
+Each entry can also keep the revision of the page the task last saw (or made), and the version of the task that saw it,
+so that a re-run can ask the API for the latest revision IDs of its pages in batches, and skip every page which
+has not been edited since, unless the task itself has changed (see `pages_changed_since_visit`).
+"""
+import os
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+import regex as re
+from typing import Callable, Generator, Iterable
+import pywikibot
+from kovachevbot.common import preload_pages, preload_groups, wikt_page, page_revid
+from kovachevbot.metrics import record_event
+
+__all__ = ["Journal", "JOURNAL_FILE", "get_journal", "version_of", "pages_changed_since_visit", "groups_changed_since_visit", "DONE", "SKIPPED", "FAILED"]
+
+JOURNAL_FILE = "kovachevbot-journal.db"  # In the task's directory, like its other files (see `task_file`)
+COMMIT_INTERVAL = 100  # Entries between commits
+COMMIT_SECONDS = 5.0  # Longest time between commits while entries are being written
+
+DONE = "done"
+SKIPPED = "skipped"
+FAILED = "failed"
+
+
+class Journal:
+    """The journal of one task. Use `get_journal` to share it within a run."""
+    def __init__(self, task: str, path: str = JOURNAL_FILE, commit_interval: int = COMMIT_INTERVAL, commit_seconds: float = COMMIT_SECONDS):
+        self.task = task
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_seconds = commit_seconds
+        self.table = '"journal_' + re.sub(r"\W", "_", task) + '"'
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (title TEXT PRIMARY KEY, status TEXT NOT NULL, reason TEXT, revid INTEGER, timestamp REAL NOT NULL, version TEXT) WITHOUT ROWID")
+        if "version" not in {column[1] for column in self.connection.execute(f"PRAGMA table_info({self.table})")}:
+            self.connection.execute(f"ALTER TABLE {self.table} ADD COLUMN version TEXT")  # Journals from before versions were kept
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cursors (task TEXT PRIMARY KEY, position TEXT) WITHOUT ROWID")
+        self.statuses: dict[str, str] = {}
+        self.revisions: dict[str, tuple[int, str | None]] = {}  # Title -> (revision ID, task version), where known
+        for title, status, revid, version in self.connection.execute(f"SELECT title, status, revid, version FROM {self.table}"):
+            self.statuses[title] = status
+            if revid is not None:
+                self.revisions[title] = (revid, version)
+        row = self.connection.execute("SELECT position FROM cursors WHERE task = ?", (task,)).fetchone()
+        self._cursor: str | None = row[0] if row else None
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"Journal({self.task!r}, {self.path!r})"
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.statuses
+
+    def __len__(self) -> int:
+        return len(self.statuses)
+
+    def status(self, title: str) -> str | None:
+        """"done", "skipped" or "failed", or `None` if the page is not in the journal."""
+        return self.statuses.get(title)
+
+    def titles(self, status: str = None) -> set[str]:
+        return {title for title, title_status in self.statuses.items() if status is None or title_status == status}
+
+    def reason(self, title: str) -> str | None:
+        row = self.connection.execute(f"SELECT reason FROM {self.table} WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, title: str, status: str, reason: str = None, revid: int = None, version: str = None) -> None:
+        """Record what happened to a page, replacing anything recorded for it before."""
+        with self._lock:
+            if self._pending == 0:
+                self.connection.execute("BEGIN")
+            self.connection.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", (title, status, reason, revid, time.time(), version))
+            self.statuses[title] = status
+            if revid is not None:
+                self.revisions[title] = (revid, version)
+            else:
+                self.revisions.pop(title, None)
+            self._pending += 1
+            self._commit_if_due()
+
+    def done(self, title: str, reason: str = None, revid: int = None, version: str = None) -> None:
+        self.record(title, DONE, reason, revid, version)
+
+    def skipped(self, title: str, reason: str = None, revid: int = None, version: str = None) -> None:
+        self.record(title, SKIPPED, reason, revid, version)
+
+    def failed(self, title: str, reason: str = None, revid: int = None, version: str = None) -> None:
+        self.record(title, FAILED, reason, revid, version)
+
+    def record_visit(self, page: pywikibot.Page, status: str, version: str = None, reason: str = None) -> None:
+        """Record a visit to a page, with its latest revision (so, after saving it, the revision the task made)."""
+        self.record(page.title(), status, reason, page_revid(page), version)
+
+    def is_current(self, title: str, revid: int | None, version: str = None) -> bool:
+        """Whether the task has already seen this revision of the page, in this version of the task."""
+        return revid is not None and self.revisions.get(title) == (revid, version)
+
+    def forget(self, title: str) -> None:
+        """Remove a page from the journal, so that it is visited again."""
+        with self._lock:
+            if self._pending == 0:
+                self.connection.execute("BEGIN")
+            self.connection.execute(f"DELETE FROM {self.table} WHERE title = ?", (title,))
+            self.statuses.pop(title, None)
+            self.revisions.pop(title, None)
+            self._pending += 1
+            self._commit_if_due()
+
+    @property
+    def cursor(self) -> str | None:
+        """Where the task has got to, as it last set it, or `None` if it never has."""
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, position: str | None) -> None:
+        with self._lock:
+            if self._pending == 0:
+                self.connection.execute("BEGIN")
+            self.connection.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?)", (self.task, position))
+            self._cursor = position
+            self._pending += 1
+            self._commit_if_due()
+
+    def _commit_if_due(self) -> None:
+        if self._pending >= self.commit_interval or time.monotonic() - self._last_commit >= self.commit_seconds:
+            self._commit()
+
+    def _commit(self) -> None:
+        if self._pending:
+            self.connection.execute("COMMIT")
+            self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def commit(self) -> None:
+        with self._lock:
+            self._commit()
+
+    def import_lines(self, path: str, status: str, reason: str = None) -> int:
+        """
+        Take the titles in a text file, one per line, into the journal with the given status, unless the journal
+        already has entries for this task (so that an old progress file is only ever imported once).
+        Returns the number of titles imported.
+        """
+        if self.statuses or not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            titles = [line.strip() for line in f if line.strip()]
+        self.record_many(titles, status, reason)
+        return len(titles)
+
+    def record_many(self, titles: Iterable[str], status: str, reason: str = None) -> None:
+        with self._lock:
+            self._commit()
+            now = time.time()
+            with self.connection:
+                self.connection.execute("BEGIN")
+                for title in titles:
+                    self.connection.execute(f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)", (title, status, reason, None, now, None))
+                    self.statuses[title] = status
+                    self.revisions.pop(title, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self.connection.close()
+
+
+JOURNALS: dict[tuple[str, str], Journal] = {}
+
+def get_journal(task: str, path: str = JOURNAL_FILE) -> Journal:
+    """Get the journal of a task, opening it on first use. Whatever is pending is committed when the program exits."""
+    key = (task, os.path.abspath(path))
+    if key not in JOURNALS:
+        JOURNALS[key] = Journal(task, path)
+    return JOURNALS[key]
+
+@atexit.register
+def _close_journals() -> None:
+    for journal in JOURNALS.values():
+        journal.close()
+    JOURNALS.clear()
+
+
+def version_of(*parts: object) -> str:
+    """A short version string for a task's work on a page, e.g. `version_of(TASK_VERSION, sorted(anagrams))`,
+    which changes whenever any of the parts do."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+def pages_changed_since_visit(titles: Iterable[str], journal: Journal, version: str | Callable[[str], str] = None,
+                              groupsize: int = None) -> Generator[pywikibot.Page, None, None]:
+    """
+    The pages with the given titles, with their text preloaded, leaving out those which the journal says the task
+    has already seen at their latest revision, in the same version of the task. `version` is either the same for
+    every page, or a function of the title (e.g. so that an anagram page is only revisited when its anagrams change).
+    The latest revision IDs are fetched in batches without the text, so a re-run where nothing has changed costs
+    one small query per batch of pages.
+    """
+    version_for = version if callable(version) else lambda title: version
+
+    def changed(pages: Iterable[pywikibot.Page]) -> Generator[pywikibot.Page, None, None]:
+        for page in pages:
+            title = page.title()
+            if journal.is_current(title, page_revid(page), version_for(title)):
+                record_event("skip", title, "unchanged since the last visit")
+                continue
+            yield page
+
+    return preload_pages(changed(preload_pages((wikt_page(title) for title in titles), groupsize, content=False)), groupsize)
+
+def groups_changed_since_visit(groups: Iterable[Iterable[str]], journal: Journal, version: str | Callable[[str], str] = None,
+                               groupsize: int = None) -> Generator[list[pywikibot.Page], None, None]:
+    """
+    As `pages_changed_since_visit`, for groups of titles which are worked on together (e.g. the words of an alphagram):
+    yields each group's pages which have changed, leaving out groups where none have, with each group's pages
+    always fetched by the same query (see `preload_groups`).
+    """
+    version_for = version if callable(version) else lambda title: version
+
+    def changed(groups_of_pages: Iterable[list[pywikibot.Page]]) -> Generator[list[pywikibot.Page], None, None]:
+        for group in groups_of_pages:
+            changed_pages = []
+            for page in group:
+                title = page.title()
+                if journal.is_current(title, page_revid(page), version_for(title)):
+                    record_event("skip", title, "unchanged since the last visit")
+                else:
+                    changed_pages.append(page)
+            if changed_pages:
+                yield changed_pages
+
+    pages = ([wikt_page(title) for title in titles] for titles in groups)
+    return preload_groups(changed(preload_groups(pages, groupsize, content=False)), groupsize)
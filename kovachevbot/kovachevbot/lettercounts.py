@@ -0,0 +1,173 @@
+"""
+Queries on an anagram index beyond exact anagrams, using a vector of letter counts for every alphagram
+(rows of a NumPy array, bucketed by length), so that each query compares a few arrays instead of scanning every word:
+
+    letters = kovachevbot.LetterCountIndex(kovachevbot.load_anagram_index("words.txt", "bg"))
+    letters.with_blanks("ад?")  # Words spelt with all of the letters and one blank tile (any letter): {"два", "вад", ...}
+    letters.sub_anagrams("вода")  # Words whose letters all fit inside the given ones: {"ад", "да", "вода", ...}
+
+`bulk_with_blanks` and `bulk_sub_anagrams` answer the same for every alphagram of the index at once, in chunks;
+`python -m kovachevbot.lettercounts <wordlist> <language> blanks|sub [letters]` runs either from the command line.
+NumPy is only imported when a letter-count index is built, so the rest of the module does not depend on it.
+"""
+import sys
+from dataclasses import dataclass
+from typing import Any, Iterator
+from kovachevbot.anagrams import AnagramIndex, normalise_word, load_anagram_index
+
+__all__ = ["LetterCountIndex", "BLANK"]
+
+BLANK = "?"  # A blank tile, standing for any one letter
+BULK_CHUNK_PAIRS = 1 << 20  # Most pairs of alphagrams compared at once in the bulk queries, to bound their memory
+MASK_BITS = 64  # The rarest letters share the last bit of the masks of which letters an alphagram has
+
+
+def import_numpy():
+    try:
+        import numpy  # Only imported here, since only the letter-count queries need it
+    except ImportError as error:
+        raise ImportError("Letter-count queries on anagrams need NumPy, which is not installed (pip install numpy)") from error
+    return numpy
+
+@dataclass
+class LengthBucket:
+    """The alphagrams of one length: their positions in the anagram index, letter counts and masks of letters."""
+    positions: Any  # numpy.ndarray of int64
+    counts: Any  # numpy.ndarray of uint8, one row per alphagram and one column per letter
+    masks: Any  # numpy.ndarray of uint64
+
+class LetterCountIndex:
+    """The letter counts of every alphagram of an anagram index (words without anagrams too), bucketed by length."""
+    def __init__(self, anagrams: AnagramIndex):
+        np = import_numpy()
+        self.np = np
+        self.anagrams = anagrams
+        alphagrams = anagrams.alphagrams()
+        lengths = np.fromiter((len(alphagram) for alphagram in alphagrams), dtype=np.int64, count=len(alphagrams))
+
+        # Every letter of every alphagram at once, as code points, numbered by column
+        codes = np.frombuffer("".join(alphagrams).encode("utf-32-le"), dtype=np.uint32)
+        letters, columns = np.unique(codes, return_inverse=True)
+        rows = np.repeat(np.arange(len(alphagrams)), lengths)
+        self.letters = [chr(code) for code in letters]
+        self.columns = {letter: column for column, letter in enumerate(self.letters)}
+        counts = np.bincount(rows * len(letters) + columns, minlength=len(alphagrams) * len(letters))
+        counts = counts.reshape(len(alphagrams), len(letters)).astype(np.uint8)
+
+        # One bit per letter, from the most common, for ruling out most pairs of alphagrams before counting
+        by_frequency = np.argsort(-np.bincount(columns, minlength=len(letters)), kind="stable")
+        self.bits = np.zeros(len(letters), dtype=np.uint64)
+        self.bits[by_frequency] = np.left_shift(np.uint64(1), np.minimum(np.arange(len(letters)), MASK_BITS - 1).astype(np.uint64))
+        masks = np.zeros(len(alphagrams), dtype=np.uint64)
+        for column in range(len(letters)):
+            masks[counts[:, column] > 0] |= self.bits[column]
+
+        self.buckets: dict[int, LengthBucket] = {}
+        order = np.argsort(lengths, kind="stable")
+        for length in np.unique(lengths):
+            start, end = np.searchsorted(lengths[order], [length, length + 1])
+            positions = order[start:end]
+            self.buckets[int(length)] = LengthBucket(positions, np.ascontiguousarray(counts[positions]), masks[positions])
+
+    def vector(self, letters: str) -> tuple[Any, int, int]:
+        """The letter counts of some letters (normalised as the index's words are), their number of blanks,
+        and how many of them are letters which no word has."""
+        blanks = letters.count(BLANK)
+        counts = self.np.zeros(len(self.letters), dtype=self.np.uint8)
+        unknown = 0
+        for letter in normalise_word(letters.replace(BLANK, ""), self.anagrams.language):
+            if letter in self.columns:
+                counts[self.columns[letter]] += 1
+            else:
+                unknown += 1
+        return counts, blanks, unknown
+
+    def words(self, positions) -> set[str]:
+        return set().union(*(self.anagrams.words_at(int(position)) for position in positions))
+
+    def with_blanks(self, letters: str, blanks: int = 0) -> set[str]:
+        """
+        The words spelt with all of the letters and as many blank tiles as there are `BLANK`s among them (plus `blanks`),
+        e.g. the words one letter longer than a word with `with_blanks(word + BLANK)`.
+        """
+        counts, query_blanks, unknown = self.vector(letters)
+        length = int(counts.sum()) + unknown + query_blanks + blanks
+        if unknown or length not in self.buckets:
+            return set()
+        bucket = self.buckets[length]
+        return self.words(bucket.positions[(bucket.counts >= counts).all(axis=1)])
+
+    def sub_anagrams(self, letters: str, min_length: int = 1, blanks: int = 0) -> set[str]:
+        """The words whose letters all fit inside the given letters (with any `BLANK`s among them, plus `blanks`, standing for any letter)."""
+        np = self.np
+        counts, query_blanks, _ = self.vector(letters)
+        blanks += query_blanks
+        found = []
+        for length in range(min_length, int(counts.sum()) + blanks + 1):
+            if length not in self.buckets:
+                continue
+            bucket = self.buckets[length]
+            if blanks:
+                missing = np.maximum(bucket.counts.astype(np.int16) - counts, 0).sum(axis=1)
+                found.append(bucket.positions[missing <= blanks])
+            else:
+                found.append(bucket.positions[(bucket.counts <= counts).all(axis=1)])
+        return self.words(np.concatenate(found)) if found else set()
+
+    def _related(self, queries: LengthBucket, candidates: LengthBucket, contains: bool) -> Iterator[tuple[int, Any]]:
+        """For each query alphagram (by its position in the index), the positions of the candidates which contain
+        all of its letters (or, if not `contains`, whose letters all fit inside it)."""
+        np = self.np
+        chunk = max(1, BULK_CHUNK_PAIRS // max(1, len(candidates.positions)))
+        for start in range(0, len(queries.positions), chunk):
+            query_masks = queries.masks[start:start + chunk, None]
+            if contains:
+                possible = (query_masks & ~candidates.masks[None, :]) == 0
+            else:
+                possible = (candidates.masks[None, :] & ~query_masks) == 0
+            query_indices, candidate_indices = np.nonzero(possible)
+            query_counts = queries.counts[start + query_indices]
+            candidate_counts = candidates.counts[candidate_indices]
+            fits = (candidate_counts >= query_counts if contains else candidate_counts <= query_counts).all(axis=1)
+            query_indices, candidate_indices = query_indices[fits], candidate_indices[fits]
+            # np.nonzero gives the pairs in order of query, so each query's candidates are a run
+            boundaries = np.flatnonzero(np.diff(query_indices)) + 1
+            for query_run, candidate_run in zip(np.split(query_indices, boundaries), np.split(candidate_indices, boundaries)):
+                if len(query_run):
+                    yield int(queries.positions[start + query_run[0]]), candidates.positions[candidate_run]
+
+    def bulk_with_blanks(self, blanks: int = 1) -> Iterator[tuple[str, list[str]]]:
+        """Every alphagram with the alphagrams spelt with all of its letters and `blanks` blank tiles, where there are any."""
+        alphagrams = self.anagrams.alphagrams()
+        for length, bucket in self.buckets.items():
+            if length + blanks in self.buckets:
+                for position, related in self._related(bucket, self.buckets[length + blanks], contains=True):
+                    yield alphagrams[position], [alphagrams[each] for each in related]
+
+    def bulk_sub_anagrams(self, min_length: int = 1) -> Iterator[tuple[str, list[str]]]:
+        """Every alphagram with the (shorter or equal) alphagrams whose letters all fit inside it."""
+        alphagrams = self.anagrams.alphagrams()
+        for length, bucket in self.buckets.items():
+            related: dict[int, list[int]] = {}
+            for candidate_length in range(min_length, length + 1):
+                if candidate_length in self.buckets:
+                    for position, positions in self._related(bucket, self.buckets[candidate_length], contains=False):
+                        related.setdefault(position, []).extend(positions.tolist())
+            for position, positions in related.items():
+                yield alphagrams[position], [alphagrams[each] for each in positions]
+
+
+if __name__ == "__main__":
+    # <wordlist> <language> blanks|sub [letters]: the words for the letters, or a TSV of every word's
+    anagrams = load_anagram_index(sys.argv[1], sys.argv[2])
+    letter_counts = LetterCountIndex(anagrams)
+    query = sys.argv[3]
+    if len(sys.argv) > 4:
+        found = letter_counts.with_blanks(sys.argv[4]) if query == "blanks" else letter_counts.sub_anagrams(sys.argv[4])
+        print("\n".join(sorted(found)))
+    else:
+        bulk = letter_counts.bulk_with_blanks() if query == "blanks" else letter_counts.bulk_sub_anagrams()
+        for alphagram, related in bulk:
+            words = set().union(*(anagrams.group(each) for each in related))
+            for word in sorted(anagrams.group(alphagram)):
+                print(word, ", ".join(sorted(words - {word})), sep="\t")
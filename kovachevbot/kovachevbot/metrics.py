@@ -0,0 +1,176 @@
+"""
+Timings of the stages of a bot run (fetching, parsing, transforming, backing up and saving pages) and counts of what
+happened to the pages (skips, no-ops, errors), written out as JSON lines and summarised at the end of the run.
+Metrics are turned on by setting the KOVACHEVBOT_METRICS environment variable to the path of the file to write them to
+(or calling `enable_metrics`). While they are off, recording anything costs a single attribute check.
+"""
+import os
+import sys
+import json
+import math
+import time
+import atexit
+import threading
+import contextlib
+from typing import Iterable, Iterator
+
+__all__ = ["Metrics", "METRICS", "enable_metrics", "timed", "record_timing", "record_event", "metrics_summary"]
+
+METRICS_ENVIRONMENT_VARIABLE = "KOVACHEVBOT_METRICS"
+STAGES = ["fetch", "parse", "transform", "backup", "save"]  # The order they are reported in
+NULL_TIMER = contextlib.nullcontext()
+
+
+def percentile(ordered: list[float], percent: float) -> float:
+    """The nearest-rank percentile of an already sorted list of values."""
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def page_title(page) -> str | None:
+    if page is None or isinstance(page, str):
+        return page
+    return page.title() if callable(getattr(page, "title", None)) else None
+
+
+class Metrics:
+    """Collects the timings of each stage and counts of events; see the module's documentation."""
+    def __init__(self):
+        self.enabled = False
+        self.path: str = None
+        self.started: float = None
+        self.timings: dict[str, list[float]] = {}
+        self.events: dict[str, int] = {}
+        self.titles: set[str] = set()  # Of the pages anything was recorded for, which are counted as the pages of the run
+        self._file = None
+        self._lock = threading.Lock()
+
+    def enable(self, path: str = None) -> None:
+        """Start collecting metrics, appending them to the JSONL file `path` if given. The summary is written at exit."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, mode="a", encoding="utf-8") if path else None
+            self.path = path
+            self.started = time.time()
+            self.timings.clear()
+            self.events.clear()
+            self.titles.clear()
+            self.enabled = True
+        atexit.register(self.finish)
+
+    def _write(self, record: dict) -> None:
+        if self._file is not None:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_timing(self, stage: str, seconds: float, page=None) -> None:
+        """Record that `stage` took `seconds` (for the page, or page title, `page`)."""
+        if not self.enabled:
+            return
+        title = page_title(page)
+        with self._lock:
+            self.timings.setdefault(stage, []).append(seconds)
+            if title is not None:
+                self.titles.add(title)
+            self._write({"time": time.time(), "stage": stage, "title": title, "seconds": round(seconds, 6)})
+
+    def record_event(self, event: str, page=None, reason: str = None) -> None:
+        """Count an event, like "skip", "no-op", "error" or "saved" (for the page, or page title, `page`)."""
+        if not self.enabled:
+            return
+        title = page_title(page)
+        with self._lock:
+            self.events[event] = self.events.get(event, 0) + 1
+            if title is not None:
+                self.titles.add(title)
+            self._write({"time": time.time(), "event": event, "title": title, "reason": reason})
+
+    @contextlib.contextmanager
+    def _timer(self, stage: str, page):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_timing(stage, time.perf_counter() - start, page)
+
+    def timed(self, stage: str, page=None) -> contextlib.AbstractContextManager:
+        """Time a `with` block as the given stage."""
+        return self._timer(stage, page) if self.enabled else NULL_TIMER
+
+    def time_iterator(self, iterator: Iterable, stage: str = "fetch") -> Iterator:
+        """Time how long each item of an iterator (e.g. of preloaded pages) takes to come, as the given stage."""
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record_timing(stage, time.perf_counter() - start, item)
+            yield item
+
+    def summary(self) -> dict:
+        """
+        Pages per minute, and the count, total, median and 95th percentile of each stage's times. The pages are those that
+        any timing or event was recorded for, so that runs which do not fetch through `iterate_safe` are counted too.
+        """
+        elapsed = time.time() - self.started if self.started else 0.0
+        with self._lock:
+            pages = len(self.titles)
+            stages = {}
+            for stage in sorted(self.timings, key=lambda stage: STAGES.index(stage) if stage in STAGES else len(STAGES)):
+                ordered = sorted(self.timings[stage])
+                stages[stage] = {
+                    "count": len(ordered),
+                    "total": sum(ordered),
+                    "p50": percentile(ordered, 50),
+                    "p95": percentile(ordered, 95),
+                }
+            return {
+                "elapsed_seconds": elapsed,
+                "pages": pages,
+                "pages_per_minute": pages / elapsed * 60 if elapsed else 0.0,
+                "stages": stages,
+                "events": dict(self.events),
+            }
+
+    def finish(self) -> None:
+        """Write the summary to the metrics file and to stderr, and stop collecting metrics."""
+        if not self.enabled:
+            return
+        summary = self.summary()
+        with self._lock:
+            self._write({"time": time.time(), "summary": summary})
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.enabled = False
+
+        print(f"{summary['pages']} pages in {summary['elapsed_seconds']:.1f} s ({summary['pages_per_minute']:.1f} pages/min)", file=sys.stderr)
+        for stage, timing in summary["stages"].items():
+            print(f"  {stage:<10} {timing['count']:>7} × p50 {timing['p50']*1000:9.1f} ms, p95 {timing['p95']*1000:9.1f} ms, total {timing['total']:8.1f} s", file=sys.stderr)
+        if summary["events"]:
+            print("  " + ", ".join(f"{event}: {count}" for event, count in sorted(summary["events"].items())), file=sys.stderr)
+
+
+METRICS = Metrics()
+
+def enable_metrics(path: str = None) -> Metrics:
+    METRICS.enable(path)
+    return METRICS
+
+def timed(stage: str, page=None) -> contextlib.AbstractContextManager:
+    """Time a `with` block as one of the stages of the run, e.g. `with kovachevbot.timed("transform", page):`."""
+    return METRICS.timed(stage, page)
+
+def record_timing(stage: str, seconds: float, page=None) -> None:
+    METRICS.record_timing(stage, seconds, page)
+
+def record_event(event: str, page=None, reason: str = None) -> None:
+    """Count something that happened to a page, like "skip", "no-op" or "error", if metrics are on."""
+    METRICS.record_event(event, page, reason)
+
+def metrics_summary() -> dict:
+    return METRICS.summary()
+
+
+if metrics_path := os.environ.get(METRICS_ENVIRONMENT_VARIABLE):
+    enable_metrics(metrics_path)
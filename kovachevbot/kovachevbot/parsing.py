@@ -0,0 +1,105 @@
+"""
+A shared cache of parsed wikitext, so that the same text is only parsed once however many helpers look at it.
+Trees are looked up by the text itself, which identifies a revision's content exactly, even after local edits.
+"""
+import time
+import threading
+import mwparserfromhell
+from collections import OrderedDict
+from kovachevbot.metrics import METRICS
+
+__all__ = ["ParseCache", "PARSE_CACHE", "parse", "remember_parse", "parse_cache_info"]
+
+PARSE_CACHE_SIZE = 128  # Number of trees kept; a tree of a large page takes a few MB
+
+
+class ParseCache:
+    """
+    A bounded LRU cache of `mwparserfromhell` trees by text, counting hits and misses.
+
+    Trees handed out normally are shared, so they must only be read. A caller that is going to edit the tree
+    asks for an `editable` one instead: that takes the tree out of the cache if nobody has been given it yet,
+    and otherwise gives a fresh parse (cheaper than copying the tree), leaving the shared tree cached, so nobody else
+    sees the edits. Once done editing, `remember` puts the edited tree back in under its new text.
+    """
+    def __init__(self, maxsize: int = PARSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.trees: OrderedDict[str, mwparserfromhell.wikicode.Wikicode] = OrderedDict()
+        self.shared: set[str] = set()  # The texts whose cached trees have been handed out to be read
+        self.hits = 0
+        self.misses = 0
+        self.hit_characters = 0
+        self.parsed_characters = 0
+        self.parse_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def parse(self, text: str, editable: bool = False) -> mwparserfromhell.wikicode.Wikicode:
+        with self._lock:
+            tree = self.trees.get(text)
+            if tree is not None and not (editable and text in self.shared):
+                self.hits += 1
+                self.hit_characters += len(text)
+                if editable:
+                    del self.trees[text]
+                else:
+                    self.shared.add(text)
+                    self.trees.move_to_end(text)
+                return tree
+
+        start = time.perf_counter()
+        tree = mwparserfromhell.parse(text)
+        elapsed = time.perf_counter() - start
+        METRICS.record_timing("parse", elapsed)
+
+        with self._lock:
+            self.misses += 1
+            self.parsed_characters += len(text)
+            self.parse_seconds += elapsed
+            if not editable:
+                self._store(text, tree)
+                self.shared.add(text)
+        return tree
+
+    def remember(self, tree: mwparserfromhell.wikicode.Wikicode, text: str = None) -> None:
+        """Cache a tree (e.g. one that has just been edited) as the parse of `text`, by default its own text."""
+        with self._lock:
+            self._store(str(tree) if text is None else text, tree)
+
+    def _store(self, text: str, tree: mwparserfromhell.wikicode.Wikicode) -> None:
+        self.trees[text] = tree
+        self.trees.move_to_end(text)
+        self.shared.discard(text)
+        while len(self.trees) > self.maxsize:
+            evicted, _ = self.trees.popitem(last=False)
+            self.shared.discard(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.trees.clear()
+            self.shared.clear()
+
+    def info(self) -> dict:
+        """Hit and miss counts, with an estimate of the parsing time the hits saved (at the average speed of the misses)."""
+        seconds_per_character = self.parse_seconds / self.parsed_characters if self.parsed_characters else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.trees),
+            "maxsize": self.maxsize,
+            "parse_seconds": self.parse_seconds,
+            "saved_seconds": self.hit_characters * seconds_per_character,
+        }
+
+
+PARSE_CACHE = ParseCache()
+
+def parse(text: str, editable: bool = False) -> mwparserfromhell.wikicode.Wikicode:
+    """Parse wikitext through the shared cache. The tree must not be changed unless `editable` is given."""
+    return PARSE_CACHE.parse(text, editable)
+
+def remember_parse(tree: mwparserfromhell.wikicode.Wikicode, text: str = None) -> None:
+    """Put an edited tree (back) into the shared cache, as the parse of its new text (or `text`)."""
+    PARSE_CACHE.remember(tree, text)
+
+def parse_cache_info() -> dict:
+    return PARSE_CACHE.info()
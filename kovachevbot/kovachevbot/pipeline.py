@@ -0,0 +1,249 @@
+"""
+A runner for tasks of the form "fetch each page, change its text, save it", in which the three steps overlap
+instead of taking turns: pages are fetched in one thread, transformed in another (or in a pool of processes),
+and saved in the calling thread, in their original order. Bounded queues between the stages provide backpressure,
+so that a slow stage (usually saving, which is rate-limited) holds the others back rather than letting pages pile up.
+Tasks which work out their edits in their own loop can hand the saving alone to a `SaveQueue`.
+"""
+import sys
+import time
+import queue
+import threading
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable
+import pywikibot
+from kovachevbot.common import ABORT_CHECK_INTERVAL, iterate_safe, save_page, backup_page
+from kovachevbot.metrics import METRICS
+
+__all__ = ["Transform", "PipelineResult", "run_pipeline", "SaveQueue"]
+
+PIPELINE_QUEUE_SIZE = 100  # Pages waiting between two stages
+QUEUE_POLL_INTERVAL = 0.5  # Seconds between checks of whether the pipeline is being shut down
+
+# Takes the text of a page and gives its new text, and the edit summary (or `None` if there is nothing to save)
+Transform = Callable[[str], tuple[str, str | None]]
+
+
+@dataclass
+class PipelineResult:
+    saved: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.saved + self.unchanged + self.failed
+
+
+@dataclass
+class _StageError:
+    """An exception raised in a stage's thread, passed down the pipeline to be raised again by the save stage."""
+    error: BaseException
+
+
+_DONE = object()  # Sent down the pipeline after the last page
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put an item in a stage's queue, waiting for room unless the pipeline is shut down meanwhile."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=QUEUE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _timed_transform(transform: Transform, text: str) -> tuple[tuple[str, str | None], float]:
+    start = time.perf_counter()
+    return transform(text), time.perf_counter() - start
+
+def _transform_here(transform: Transform, text: str) -> Future:
+    future = Future()
+    try:
+        future.set_result(_timed_transform(transform, text))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+def _save_result(page: pywikibot.Page, text: str, new_text: str, summary: str | None, backup_path: str | None, save_kwargs: dict) -> str:
+    if new_text == text or not summary:
+        METRICS.record_event("no-op", page)
+        return "unchanged"
+
+    try:
+        page.text = new_text
+        if backup_path is not None:
+            backup_page(text, page, backup_path)
+        save_page(page, summary, **save_kwargs)
+        return "saved"
+    except Exception:
+        print(f"Error saving page {page.title()}:", file=sys.stderr)
+        traceback.print_exc()
+        return "failed"
+
+def run_pipeline(
+    pages: Iterable[pywikibot.Page],
+    transform: Transform,
+    max_entries: int = None,
+    abort_check_interval: float = ABORT_CHECK_INTERVAL,
+    halt_page: pywikibot.Page = None,
+    processes: int = None,
+    backup_path: str = None,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    on_done: Callable[[pywikibot.Page, str], None] = None,
+    **save_kwargs,
+) -> PipelineResult:
+    """
+    Run `transform` over the text of every page and save the pages whose text it changed, with the summary it gave.
+    Pages are taken from `pages` through `iterate_safe`, so `max_entries` and the halt page apply as usual;
+    `pages` should preload them (e.g. `pages_from_titles`), so that fetching is done in batches.
+
+    The transform must not depend on anything but the text it is given. With `processes`, it runs in a pool
+    of that many processes, in which case it must be a module-level function (or a `functools.partial` of one).
+    If it raises an exception, the error is reported and the page is counted as failed, and the run goes on;
+    so do errors from saving. Stopping the bot (halting, or interrupting it) stops the whole pipeline.
+
+    Pages are saved one at a time, in the order they came in, after backing them up to `backup_path` if given;
+    `save_kwargs` are passed on to `save_page`. After each page, `on_done(page, outcome)` is called with an
+    outcome of "saved", "unchanged" or "failed", e.g. to keep track of progress.
+    """
+    fetched = queue.Queue(queue_size)
+    transformed = queue.Queue(queue_size)
+    stop = threading.Event()
+    executor = ProcessPoolExecutor(processes) if processes else None
+
+    def fetch():
+        try:
+            for page in iterate_safe(pages, max_entries, abort_check_interval, halt_page):
+                if not _put(fetched, (page, page.text), stop):
+                    return
+            _put(fetched, _DONE, stop)
+        except BaseException as error:
+            _put(fetched, _StageError(error), stop)
+
+    def transform_pages():
+        try:
+            while not stop.is_set():
+                try:
+                    item = fetched.get(timeout=QUEUE_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                if item is _DONE or isinstance(item, _StageError):
+                    _put(transformed, item, stop)
+                    return
+
+                page, text = item
+                future = executor.submit(_timed_transform, transform, text) if executor else _transform_here(transform, text)
+                if not _put(transformed, (page, text, future), stop):
+                    return
+        except BaseException as error:
+            _put(transformed, _StageError(error), stop)
+
+    threads = [threading.Thread(target=fetch, daemon=True), threading.Thread(target=transform_pages, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    result = PipelineResult()
+    try:
+        while (item := transformed.get()) is not _DONE:
+            if isinstance(item, _StageError):
+                raise item.error
+
+            page, text, future = item
+            try:
+                (new_text, summary), seconds = future.result()
+            except Exception as error:
+                print(f"Error transforming page {page.title()}:", file=sys.stderr)
+                traceback.print_exc()
+                METRICS.record_event("error", page, f"{type(error).__name__}: {error}")
+                outcome = "failed"
+            else:
+                METRICS.record_timing("transform", seconds, page)
+                outcome = _save_result(page, text, new_text, summary, backup_path, save_kwargs)
+
+            setattr(result, outcome, getattr(result, outcome) + 1)
+            if on_done is not None:
+                on_done(page, outcome)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(QUEUE_POLL_INTERVAL * 2)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return result
+
+
+class SaveQueue:
+    """
+    Pages waiting to be saved, which a background thread saves one at a time, in the order they were put in,
+    while the caller goes on fetching and working out the next ones. Backups, errors and `on_done(page, outcome)`
+    are handled as in `run_pipeline`, and `result` counts the outcomes; `on_done` is called from the saving thread.
+    `put` waits while the queue is full. Use it as a context manager, which waits for the last page to be saved;
+    if saving stops the bot (e.g. it has been halted), the error is raised again by the next `put` or on leaving.
+    """
+    def __init__(self, backup_path: str = None, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 on_done: Callable[[pywikibot.Page, str], None] = None, **save_kwargs):
+        self.backup_path = backup_path
+        self.on_done = on_done
+        self.save_kwargs = save_kwargs
+        self.result = PipelineResult()
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._error: BaseException = None
+        self._thread = threading.Thread(target=self._run, name="save-queue", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "SaveQueue":
+        return self
+
+    def __exit__(self, error_type, error, traceback_) -> None:
+        self.close(wait=error is None)
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def put(self, page: pywikibot.Page, new_text: str, summary: str) -> None:
+        """Queue the page to be saved with the new text and the edit summary (if the text has changed)."""
+        self._raise_error()
+        if not _put(self._queue, (page, page.text, new_text, summary), self._stop):
+            self._raise_error()
+
+    def _run(self) -> None:
+        try:
+            while (item := self._queue.get()) is not _DONE:
+                page, text, new_text, summary = item
+                outcome = _save_result(page, text, new_text, summary, self.backup_path, self.save_kwargs)
+                setattr(self.result, outcome, getattr(self.result, outcome) + 1)
+                if self.on_done is not None:
+                    self.on_done(page, outcome)
+        except BaseException as error:
+            self._error = error
+            self._stop.set()
+
+    def close(self, wait: bool = True) -> None:
+        """
+        Save the pages still queued and stop, raising any error which stopped the saving.
+        If not `wait`ing (e.g. because the caller is failing anyway), the pages still queued are dropped instead.
+        """
+        if not wait:
+            self._stop.set()
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+        while self._thread.is_alive():
+            try:
+                self._queue.put(_DONE, timeout=QUEUE_POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        if wait:
+            self._raise_error()
@@ -0,0 +1,107 @@
+"""
+Selection of candidate pages for a task by scanning a dump, instead of crawling tracking categories through the API.
+The offsets of a multistream dump's bz2 streams are taken from its published index and handed out to a pool of processes,
+each of which reads, decompresses and parses its own streams and applies the task's predicate.
+The titles (and revision IDs) of the matching pages are written to a candidates file, which can be fed back into
+`kovachevbot.pages_from_titles` and `kovachevbot.iterate_safe`.
+"""
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Generator, Iterable
+from kovachevbot.common import batched
+from kovachevbot.dump import INDEX_SUFFIX, DumpSource, is_bz2, iter_page_blocks, multistream_index_path, multistream_offsets, parse_page, read_page_blocks_at
+
+__all__ = ["scan_dump", "read_candidates", "read_candidate_revisions"]
+
+SCAN_BLOCK_SIZE = 500  # Pages handed to a worker at a time
+SCAN_STREAMS = 5  # bz2 streams (of 100 pages each) handed to a worker at a time
+PROGRESS_INTERVAL = 100_000  # Pages between progress reports
+
+Predicate = Callable[[str, str], bool]
+
+
+def scan_block(predicate: Predicate, namespaces: tuple[int], blocks: list[bytes]) -> tuple[list[tuple[str, int]], int]:
+    """Scan the raw XML of some pages, giving the matches and the number of pages scanned."""
+    matches = []
+    for block in blocks:
+        record = parse_page(block)
+        if record.namespace in namespaces and record.redirect is None and predicate(record.title, record.text):
+            matches.append((record.title, record.revid))
+    return matches, len(blocks)
+
+def scan_offsets(dump_path: str, predicate: Predicate, namespaces: tuple[int], offsets: list[int]) -> tuple[list[tuple[str, int]], int]:
+    """Scan the pages at the given offsets in the index, giving the matches and the number of pages scanned."""
+    with open(dump_path, "rb") as f:
+        blocks = [block for offset in offsets for block in read_page_blocks_at(f, dump_path, offset)]
+    return scan_block(predicate, namespaces, blocks)
+
+def dump_offsets(dump_path: str) -> Iterable[int] | None:
+    """
+    The offsets to hand out to the workers: those of the bz2 streams in the index published with a multistream dump,
+    or failing that, those in the dump's own index if it has been built. `None` if there is neither, or if the dump
+    is a single bz2 stream, which cannot be split up: its pages then have to be read in this process.
+    """
+    if published_index := multistream_index_path(dump_path):
+        return multistream_offsets(published_index)
+    if not os.path.exists(dump_path + INDEX_SUFFIX):
+        return None
+    offsets = DumpSource(dump_path).offsets()
+    return offsets if len(offsets) > 1 or not is_bz2(dump_path) else None
+
+def scan_dump(dump_path: str, predicate: Predicate, candidates_path: str, processes: int = None, namespaces: tuple[int] = (0,)) -> int:
+    """
+    Write the title and revision ID of every page in the dump for which `predicate(title, text)` is true
+    to `candidates_path`, one tab-separated pair per line, in dump order. Only non-redirect pages in `namespaces`
+    (the main namespace by default) are considered. The predicate must be a module-level function so that
+    it can be sent to the worker processes; it should rule pages out with cheap substring checks before parsing them.
+    Multistream dumps are split between the workers by their streams (see `dump_offsets`); other dumps are read here
+    as a stream, and handed out to them in blocks of pages. Returns the number of matching pages.
+    """
+    processes = processes or os.cpu_count()
+    if (offsets := dump_offsets(dump_path)) is not None:
+        batch_size = SCAN_STREAMS if is_bz2(dump_path) else SCAN_BLOCK_SIZE
+        tasks = ((scan_offsets, dump_path, predicate, namespaces, batch) for batch in batched(offsets, batch_size))
+    else:
+        print(f"No index of the streams of {dump_path}, so it is read and decompressed in this process", file=sys.stderr)
+        blocks = (block for _, block in iter_page_blocks(dump_path))
+        tasks = ((scan_block, predicate, namespaces, batch) for batch in batched(blocks, SCAN_BLOCK_SIZE))
+    found = 0
+    scanned = 0
+
+    with ProcessPoolExecutor(processes) as executor, open(candidates_path, mode="w", encoding="utf-8") as f:
+        pending = deque()
+
+        def write_next():
+            nonlocal found, scanned
+            matches, count = pending.popleft().result()
+            for title, revid in matches:
+                f.write(f"{title}\t{revid}\n")
+                found += 1
+
+            if (scanned + count) // PROGRESS_INTERVAL > scanned // PROGRESS_INTERVAL:
+                print(f"Scanned {scanned + count} pages, {found} candidates so far", file=sys.stderr)
+            scanned += count
+
+        for task in tasks:
+            # Only keep a couple of batches per worker in flight, so that the pages (or offsets) are read no faster than they are scanned
+            if len(pending) >= 2 * processes:
+                write_next()
+            pending.append(executor.submit(*task))
+
+        while pending:
+            write_next()
+
+    return found
+
+def read_candidate_revisions(candidates_path: str) -> Generator[tuple[str, int], None, None]:
+    """Iterate over the (title, revision ID) pairs in a candidates file written by `scan_dump`."""
+    with open(candidates_path, encoding="utf-8") as f:
+        for line in f:
+            title, revid = line.rstrip("\n").split("\t")
+            yield title, int(revid)
+
+def read_candidates(candidates_path: str) -> Generator[str, None, None]:
+    """Iterate over the titles in a candidates file written by `scan_dump`."""
+    return (title for title, _ in read_candidate_revisions(candidates_path))
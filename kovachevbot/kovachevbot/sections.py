@@ -0,0 +1,131 @@
+"""
+A fast index of a page's L2 (language) sections, found by scanning the heading lines alone, in linear time.
+This lets a task parse only the section of the one language it works on, rather than the whole page
+(which for pages like "a" or "人" has dozens of languages), and then splice the edited section back
+into the page text exactly, leaving everything else untouched.
+"""
+import bisect
+import regex as re
+import mwparserfromhell
+from dataclasses import dataclass
+from kovachevbot.parsing import parse
+
+__all__ = [
+    "SectionSpan", "l2_sections", "find_l2_section", "get_l2_section", "parse_l2_section", "splice_section",
+    "insert_l2", "collapse_blank_lines", "collapse_blank_lines_in",
+]
+
+# An L1 or L2 heading on a line of its own, like in MediaWiki; "==Title===" is an L2 heading whose title is "Title=".
+TOP_HEADING_PATTERN = re.compile(r"^(={1,2})(?!=)(.+?)\1[ \t]*$", re.MULTILINE)
+COMMENT_PATTERN = re.compile(r"<!--.*?(?:-->|\Z)", re.DOTALL)
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+FIRST_LANGUAGES = ("Translingual", "English")  # Come before all the others, which are in alphabetical order
+
+
+@dataclass
+class SectionSpan:
+    """Where a section lies in the page text: `text[start:end]` is the section, from its heading up to the next L1 or L2 heading."""
+    title: str
+    level: int
+    start: int
+    end: int
+
+
+def l2_sections(text: str) -> list[SectionSpan]:
+    """Find all the L2 sections of a page, in order. Headings inside HTML comments are ignored."""
+    comments = [(match.start(), match.end()) for match in COMMENT_PATTERN.finditer(text)] if "<!--" in text else []
+    comment_starts = [start for start, _ in comments]
+
+    def in_comment(position: int) -> bool:
+        i = bisect.bisect_right(comment_starts, position) - 1
+        return i >= 0 and position < comments[i][1]
+
+    headings = [match for match in TOP_HEADING_PATTERN.finditer(text) if not in_comment(match.start())]
+    sections = []
+    for i, match in enumerate(headings):
+        end = headings[i+1].start() if i + 1 < len(headings) else len(text)
+        if len(match[1]) == 2:
+            sections.append(SectionSpan(match[2].strip(), 2, match.start(), end))
+    return sections
+
+def find_l2_section(text: str, language: str) -> SectionSpan | None:
+    """Find the L2 section with exactly the title `language`, e.g. "Bulgarian", if the page has one."""
+    if language not in text:
+        return None
+    for section in l2_sections(text):
+        if section.title == language:
+            return section
+    return None
+
+def get_l2_section(text: str, language: str) -> str | None:
+    """The text of the L2 section for `language`, from its heading up to the next language's, if the page has one."""
+    section = find_l2_section(text, language)
+    return text[section.start:section.end] if section else None
+
+def parse_l2_section(text: str, language: str, editable: bool = True) -> tuple[mwparserfromhell.wikicode.Wikicode, SectionSpan] | None:
+    """
+    Parse only the L2 section for `language`, giving its tree and where it lies in the page,
+    or `None` if the page has no such section. Once the tree has been edited, put it back with
+    `splice_section(text, span, str(tree))`. The tree is editable unless `editable=False` is given,
+    in which case it comes from the shared parse cache and must only be read.
+    """
+    section = find_l2_section(text, language)
+    if section is None:
+        return None
+    return parse(text[section.start:section.end], editable), section
+
+def splice_section(text: str, section: SectionSpan, new_section: str) -> str:
+    """Replace the given section of the page text, leaving the rest of the text exactly as it was."""
+    return text[:section.start] + new_section + text[section.end:]
+
+def language_order(title: str) -> tuple[int, str]:
+    return (FIRST_LANGUAGES.index(title) if title in FIRST_LANGUAGES else len(FIRST_LANGUAGES), title)
+
+def insert_l2(text: str, section: str) -> str:
+    """
+    Insert a new L2 section (its text, starting with its heading) into the page, before the first section which
+    should come after it (Translingual, then English, then the others alphabetically), or at the end. The rest of the page is left as it is, except that the new section is separated
+    from its neighbours by one blank line. If the page already has a section with the same title, it is returned unchanged.
+    """
+    heading = TOP_HEADING_PATTERN.match(section.lstrip("\n"))
+    if heading is None or len(heading[1]) != 2:
+        raise ValueError(f"Not an L2 section: {section[:50]!r}")
+    title = heading[2].strip()
+
+    position = None
+    for existing in l2_sections(text):
+        if existing.title == title:
+            return text
+        if position is None and language_order(existing.title) > language_order(title):
+            position = existing.start
+    if position is None:
+        position = len(text)
+
+    before = text[:position].rstrip("\n")
+    after = text[position:].lstrip("\n")
+    return (before + "\n\n" if before else "") + section.strip("\n") + "\n\n" + after
+
+def collapse_blank_lines(text: str) -> str:
+    """Collapse every run of blank lines into a single blank line."""
+    return BLANK_LINES_PATTERN.sub("\n\n", text) if "\n\n\n" in text else text
+
+def collapse_blank_lines_in(wikicode: mwparserfromhell.wikicode.Wikicode) -> None:
+    """
+    Collapse every run of blank lines between the top-level nodes of the tree into a single blank line, in place,
+    including runs spread over several adjacent text nodes (as left by inserting text into a tree).
+    """
+    newlines = 0  # Newlines at the end of the text nodes just before the current one
+    for node in wikicode.nodes:
+        if not isinstance(node, mwparserfromhell.nodes.Text):
+            newlines = 0
+            continue
+        value = collapse_blank_lines(node.value)
+        leading = len(value) - len(value.lstrip("\n"))
+        if newlines + leading > 2:
+            value = value[newlines + leading - 2:]  # The run carries on from the nodes before, which have at most two
+        if value != node.value:
+            node.value = value
+        if value.strip("\n"):
+            newlines = len(value) - len(value.rstrip("\n"))
+        else:
+            newlines += len(value)
@@ -0,0 +1,162 @@
+"""
+A registry of tasks which edit one language's section of a page, so that several of them can be run together:
+`run_tasks` fetches each page once, parses the section once and hands the same tree to every task which applies
+to the page, then saves once, with all of their edit summaries combined. Each task is registered from its own script:
+
+    @kovachevbot.register_task("bg-subject-object", "Bulgarian", titles=words_to_edit, selector=mentions_sbjv_or_objv)
+    def fix_section(title: str, section: Wikicode) -> str | None:
+        ...  # Edit the section in place, giving the edit summary, or `None` if nothing was changed
+
+Tasks are run from whichever directory the runner is in, so a task's script names its files by absolute path,
+with `task_file(__file__, "words.txt")`; the working directory is never changed while tasks run, as the save,
+prefetch and halt-watching threads resolve relative paths against it.
+"""
+import os
+import sys
+import importlib.util
+from dataclasses import dataclass
+from typing import Callable, Iterable
+import pywikibot
+import mwparserfromhell
+from kovachevbot.common import iterate_safe, pages_from_titles, save_page, backup_page
+from kovachevbot.sections import parse_l2_section, splice_section
+from kovachevbot.metrics import METRICS, record_event
+
+__all__ = ["Task", "TASKS", "register_task", "task_file", "load_task_script", "apply_tasks", "run_tasks"]
+
+SUMMARY_SEPARATOR = "; "
+
+
+def every_page(title: str, text: str) -> bool:
+    return True
+
+@dataclass
+class Task:
+    """A task which edits one language's section of a page; see `register_task`."""
+    name: str
+    language: str
+    transform: Callable[[str, mwparserfromhell.wikicode.Wikicode], str | None]  # (title, section) -> edit summary, or None if unchanged
+    titles: Callable[[], Iterable[str]]  # The pages the task wants to visit; also where it loads what it needs
+    selector: Callable[[str, str], bool] = every_page  # (title, page text) -> whether the task applies, before parsing
+    saved: Callable[[str], None] | None = None  # Called with the title once a page the task changed has been saved
+    minor: bool = True
+    skipped: Callable[[str, str], None] | None = None  # Called with the title and the reason when the task could not look at a page it selected
+
+TASKS: dict[str, Task] = {}
+
+def register_task(name: str, language: str, titles: Callable[[], Iterable[str]], selector: Callable[[str, str], bool] = None,
+                  saved: Callable[[str], None] = None, minor: bool = True, skipped: Callable[[str, str], None] = None):
+    """
+    Register the decorated function `(title, section) -> edit summary | None` as the transform of a task.
+    The files the task reads and writes should be named with `task_file`, since it may be run from another directory.
+    `skipped(title, reason)` is called when the page does not exist, has no section in the task's language, or the task failed on it.
+    """
+    def register(transform: Callable[[str, mwparserfromhell.wikicode.Wikicode], str | None]):
+        TASKS[name] = Task(name, language, transform, titles, selector or every_page, saved, minor, skipped)
+        return transform
+    return register
+
+def task_file(script: str, name: str) -> str:
+    """The absolute path of a file next to a task's script (`task_file(__file__, "words.txt")`)."""
+    return os.path.join(os.path.dirname(os.path.abspath(script)), name)
+
+def load_task_script(path: str):
+    """
+    Import a task's script (which registers its tasks); it names its files with `task_file`, so it is not run from
+    its own directory. Scripts are not modules (their names have hyphens), so they are loaded by path.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3].replace("-", "_"), os.path.abspath(path))
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, directory)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+    return module
+
+def apply_tasks(title: str, text: str, tasks: Iterable[Task]) -> tuple[str, list[Task], list[str]]:
+    """
+    Apply every task whose selector accepts the page, parsing each language's section only once for all the tasks on it.
+    Returns the new text, the tasks which changed the page, and their edit summaries.
+    """
+    by_language: dict[str, list[Task]] = {}
+    for task in tasks:
+        if task.selector(title, text):
+            by_language.setdefault(task.language, []).append(task)
+
+    edits = []
+    changed_by, summaries = [], []
+    for language, language_tasks in by_language.items():
+        search = parse_l2_section(text, language)
+        if search is None:
+            for task in language_tasks:
+                record_event("skip", title, f"{task.name}: no {language} section")
+                if task.skipped is not None:
+                    task.skipped(title, f"no {language} section")
+            continue
+        section, span = search
+        changed = False
+        for task in language_tasks:
+            before = str(section)
+            try:
+                with METRICS.timed("transform", title):
+                    summary = task.transform(title, section)
+            except Exception as error:
+                # The task may have left the tree half-edited, so only the other tasks' edits are kept
+                print(f"Task {task.name} failed on {title}: {error}", file=sys.stderr)
+                record_event("error", title, f"{task.name}: {error}")
+                if task.skipped is not None:
+                    task.skipped(title, f"failed: {error}")
+                section = mwparserfromhell.parse(before)
+                continue
+            if summary:
+                changed = True
+                changed_by.append(task)
+                summaries.append(summary)
+        if changed:
+            edits.append((span, str(section)))
+
+    # Later sections first, so that the spans of the earlier ones still hold
+    for span, new_section in sorted(edits, key=lambda edit: edit[0].start, reverse=True):
+        text = splice_section(text, span, new_section)
+    return text, changed_by, summaries
+
+def run_tasks(task_names: Iterable[str] = None, pages: Iterable[pywikibot.Page] = None, backup_path: str = None, max_entries: int = None, **save_kwargs) -> int:
+    """
+    Run the registered tasks (or the named ones) together, visiting every page any of them wants once, in order
+    (or the given pages), and saving each page once with the combined summary. At most `max_entries` pages are visited
+    (see `iterate_safe`). Returns the number of pages saved.
+    """
+    tasks = [TASKS[name] for name in task_names] if task_names is not None else list(TASKS.values())
+    if pages is None:
+        titles = {}  # Ordered, without duplicates
+        for task in tasks:
+            titles.update(dict.fromkeys(task.titles()))
+        print(f"Running {len(tasks)} tasks ({', '.join(task.name for task in tasks)}) over {len(titles)} pages", file=sys.stderr)
+        pages = pages_from_titles(titles)
+
+    saved = 0
+    for page in iterate_safe(pages, max_entries):
+        title = page.title()
+        if not page.exists():
+            record_event("skip", title, "page does not exist")
+            for task in tasks:
+                if task.skipped is not None:
+                    task.skipped(title, "page does not exist")  # Whether or not the task wanted the page
+            continue
+        original_text = page.text
+        new_text, changed_by, summaries = apply_tasks(title, original_text, tasks)
+        if new_text == original_text:
+            record_event("no-op", title)
+            continue
+
+        page.text = new_text
+        if backup_path is not None:
+            backup_page(original_text, page, backup_path)
+        save_page(page, SUMMARY_SEPARATOR.join(summaries), minor=all(task.minor for task in changed_by), **save_kwargs)
+        saved += 1
+        for task in changed_by:
+            if task.saved is not None:
+                task.saved(title)
+    return saved
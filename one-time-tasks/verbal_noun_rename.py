@@ -4,9 +4,10 @@ import mwparserfromhell
 import json
 import sys
 
-with open("verbal_nouns.json") as f:
+with open(kovachevbot.task_file(__file__, "verbal_nouns.json")) as f:
     VERBAL_NOUNS = json.load(f)
 
+EDIT_SUMMARY = "Update verbal noun forms' {{infl of}} to point to the verbal noun / use {{verbal noun of}}"
 GRAVE = chr(0x300)
 ACUTE = chr(0x301)
 
@@ -52,25 +53,51 @@ def fix_infl_template(template: mwparserfromhell.nodes.Template):
             except ValueError:
                 print(f"Verb {verb} has more than one possible verbal noun: {verbal_noun_list}", file=sys.stderr)
 
+def fix_section(bulgarian: mwparserfromhell.wikicode.Wikicode) -> None:
+    """Fix the {{infl of}} templates for verbal nouns in the Bulgarian section, in place."""
+    for template in bulgarian.filter_templates():
+        template: mwparserfromhell.nodes.Template
+
+        if template.name == "infl of" or template.name == "inflection of":
+            fix_infl_template(template)
+
+def fix_text(text: str) -> str | None:
+    """Fix the {{infl of}} templates for verbal nouns in the Bulgarian section, or give `None` if there is no Bulgarian section."""
+    bulgarian_section_search = kovachevbot.parse_l2_section(text, "Bulgarian")
+    if bulgarian_section_search is None:
+        return None
+
+    bulgarian, section_span = bulgarian_section_search
+    fix_section(bulgarian)
+
+    return kovachevbot.splice_section(text, section_span, str(bulgarian))
+
+def get_entries() -> list[str]:
+    with open(kovachevbot.task_file(__file__, "verbal_noun_list.json")) as f:
+        return json.load(f)
+
+def mentions_verbal_noun(title: str, text: str) -> bool:
+    return "vnoun" in text or "verbal noun" in text
+
+@kovachevbot.register_task("verbal_noun_rename", "Bulgarian", titles=get_entries, selector=mentions_verbal_noun)
+def fix_section_task(title: str, bulgarian: mwparserfromhell.wikicode.Wikicode) -> str | None:
+    before = str(bulgarian)
+    fix_section(bulgarian)
+    return EDIT_SUMMARY if str(bulgarian) != before else None
+
 def main():
-    with open("verbal_noun_list.json") as f:
-        ENTRIES = json.load(f)
+    ENTRIES = get_entries()
 
     for page in kovachevbot.iterate_safe(kovachevbot.pages_from_titles(ENTRIES)):
         page: pywikibot.Page
-        parsed = mwparserfromhell.parse(page.text)
-
-        bulgarian = parsed.get_sections([2], "Bulgarian")[0]
-        for template in bulgarian.filter_templates():
-            template: mwparserfromhell.nodes.Template
+        out = fix_text(page.text)
+        if out is None:
+            print(f"Error: page {page.title()} has no Bulgarian content", file=sys.stderr)
+            continue
 
-            if template.name == "infl of" or template.name == "inflection of":
-                fix_infl_template(template)
-        
-        out = str(parsed)
         if out != page.text:
             page.text = out
-            page.save("Update verbal noun forms' {{infl of}} to point to the verbal noun / use {{verbal noun of}}")
+            kovachevbot.save_page(page, EDIT_SUMMARY)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file